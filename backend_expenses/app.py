@@ -1,26 +1,26 @@
 # backend_expenses/app.py
+import json
 import os
-import re
-from datetime import datetime
-from typing import Generator, Optional
+from datetime import date, datetime
+from typing import Generator, List, Optional
 
 import uvicorn
-from fastapi import FastAPI, Body, Depends
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from calendar import monthrange
 from openai import OpenAI
 import logging
 from fastapi import Request
 from fastapi.responses import JSONResponse
 # local imports
-from . import models, crud, utils
+from . import models, chat_planner, crud, periods, result_cache, utils
+from . import database, writer
 from .database import SessionLocal, engine
-from .models import Expense  # used in chat handler
+from .schema import ensure_schema
 
 # --- Setup DB ---
-models.Base.metadata.create_all(bind=engine)
+ensure_schema()
 
 # --- OpenAI ---
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", None)
@@ -38,6 +38,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Dependency for DB session
@@ -59,17 +60,104 @@ def root():
 def add_expense(exp: models.ExpenseCreate, db: Session = Depends(get_db)):
     return crud.create_expense(db, exp)
 
+# largest batch POST /expenses/bulk accepts
+MAX_BULK_EXPENSES = int(os.environ.get("MAX_BULK_EXPENSES", 5000))
+
+@app.post("/expenses/bulk")
+def add_expenses_bulk(payload: List[dict] = Body(...), db: Session = Depends(get_db)):
+    """
+    Create many expenses (each shaped like POST /expenses/) in one transaction.
+    Returns {"inserted", "results": [{index, id}], "errors": [{index, errors}]};
+    elements that fail validation are listed in errors and skipped.
+    """
+    if len(payload) > MAX_BULK_EXPENSES:
+        raise HTTPException(status_code=413, detail=f"at most {MAX_BULK_EXPENSES} expenses per request")
+    return crud.create_expenses_bulk(db, payload)
+
 @app.get("/expenses/")
-def list_expenses(skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
-    return crud.get_expenses(db, skip=skip, limit=limit)
+def list_expenses(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    source: Optional[str] = None,
+    exp_type: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    skip: int = 0,
+    fields: Optional[str] = None,
+    include_items: bool = False,
+    db: Session = Depends(get_db),
+):
+    """
+    Newest first. Pass the X-Next-Cursor response header back as `cursor` for
+    the next page (the header is absent on the last page). `skip` is kept for
+    old clients; cursors stay fast and stable while imports run.
+
+    fields=id,total_amount,... limits the returned columns; include_items=true
+    adds each expense's items (loaded with one extra query for the page).
+    Rows are serialised straight to JSON, skipping ORM objects and
+    jsonable_encoder.
+    """
+    try:
+        rows, next_cursor = crud.get_expenses_page(
+            db, limit=limit, cursor=cursor, source=source, exp_type=exp_type,
+            min_amount=min_amount, max_amount=max_amount, start=start, end=end, skip=skip,
+            fields=crud.parse_fields(fields), include_items=include_items,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(json.dumps(rows, separators=(",", ":")), media_type="application/json", headers=headers)
 
 @app.get("/reports/monthly")
 def report_monthly(year: int, month: int, db: Session = Depends(get_db)):
-    return utils.get_monthly_report(db, year, month)
+    version = result_cache.session_version(db)
+    return result_cache.cached(
+        "report_monthly", (year, month), lambda: utils.get_monthly_report(db, year, month), version
+    )
+
+@app.get("/reports/months")
+def report_months(months: List[str] = Query(..., description="YYYY-MM, repeatable"), db: Session = Depends(get_db)):
+    """Monthly reports for several months from one scan, in the order requested."""
+    try:
+        keys = [(int(m[:4]), int(m[5:7])) for m in months if len(m) == 7 and m[4] == "-"]
+    except ValueError:
+        keys = []
+    if len(keys) != len(months) or not all(1 <= month <= 12 for _, month in keys):
+        raise HTTPException(status_code=400, detail="months must be YYYY-MM")
+    reports = utils.get_monthly_reports(db, keys)
+    return [reports[k] for k in keys]
+
+@app.get("/reports/range")
+def report_range(start: str, end: str, granularity: str = "month", db: Session = Depends(get_db)):
+    """
+    Dense per-category series from start to end (YYYY, YYYY-MM or YYYY-MM-DD)
+    by day/week/month/quarter/year, with period-over-period and YoY deltas.
+    """
+    try:
+        return utils.get_range_report(
+            db, periods.parse_period(start), periods.parse_period(end, end=True), granularity
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/reports/compare")
 def report_compare(y1: int, m1: int, y2: int, m2: int, db: Session = Depends(get_db)):
-    return utils.compare_months(db, (y1, m1), (y2, m2))
+    version = result_cache.session_version(db)
+    return result_cache.cached(
+        "report_compare", (y1, m1, y2, m2), lambda: utils.compare_months(db, (y1, m1), (y2, m2)), version
+    )
+
+@app.get("/db_stats")
+def db_stats():
+    """Connection pool usage, write-gate wait time, 'database is locked' retries, writer-queue groups and cache hit rates."""
+    return {
+        **database.stats(),
+        "writer": writer.stats(),
+        "chat_plans": chat_planner.cache_info(),
+        "result_cache": result_cache.stats(),
+    }
 
 # -------------------------------------------------------
 # Chat
@@ -80,62 +168,8 @@ async def global_exception_handler(request: Request, exc: Exception):
     return JSONResponse(status_code=500, content={"detail": "Server error", "error": str(exc)})
 # -------------------------------------------------------
 
-STOPWORDS = {"this", "month", "today", "yesterday", "spent", "spend", "amount",
-             "much", "how", "i", "on", "for", "in", "the", "my", "me", "a", "an"}
-TIME_PHRASES = {"this month", "last month", "today", "yesterday"}
-
-def _extract_keyword(text: str) -> Optional[str]:
-    """
-    Extract a candidate keyword/phrase from the user's question.
-    - Prefer "on <phrase>" or "for <phrase>"
-    - Strip trailing time phrases like "this month", "this week"
-    - Return single cleaned phrase (lowercased) or None
-    """
-    if not text:
-        return None
-    low = text.lower().strip()
-
-    TIME_PHRASES = ["this month", "last month", "this week", "today", "yesterday", "this year"]
-    STOPWORDS = {"this", "month", "today", "yesterday", "spent", "spend", "amount",
-                 "much", "how", "i", "on", "for", "in", "the", "my", "me", "a", "an"}
-
-    # Prefer explicit phrasing: "on <phrase>" or "for <phrase>"
-    m = re.search(r"(?:\bon\b|\bfor\b)\s+([a-z0-9 _&\-\']+)", low, re.IGNORECASE)
-    if m:
-        cand = m.group(1).strip()
-        # remove trailing time phrases if present
-        for tp in TIME_PHRASES:
-            if cand.endswith(tp):
-                cand = cand[: -len(tp)].strip()
-        cand = " ".join(cand.split())
-        # final checks
-        if cand and not all(tok in STOPWORDS for tok in cand.split()):
-            return cand
-
-    # Pattern: "spent on <phrase>" or "spent with <phrase>"
-    m2 = re.search(r"spent(?:\s+(?:on|with|for))\s+([a-z0-9 _&\-\']+)", low, re.IGNORECASE)
-    if m2:
-        cand = m2.group(1).strip()
-        for tp in TIME_PHRASES:
-            if tp in cand:
-                cand = cand.replace(tp, "").strip()
-        cand = " ".join(cand.split())
-        if cand and not all(tok in STOPWORDS for tok in cand.split()):
-            return cand
-
-    # Fallback: first non-stopword token that is meaningful
-    tokens = re.findall(r"[a-z0-9_&\-]+", low)
-    for tok in tokens:
-        if tok in STOPWORDS:
-            continue
-        if len(tok) <= 1:
-            continue
-        return tok
-
-    return None
 def _format_monthly_context(db: Session, year: int, month: int) -> str:
-    rep = utils.get_monthly_report(db, year, month)
-    by_cat = rep.get("by_category", []) if rep else []
+    by_cat = utils.get_category_totals(db, year, month)
     if not by_cat:
         return "No recorded expenses for this month."
     parts = []
@@ -186,83 +220,15 @@ def chat_endpoint(body: dict = Body(...), db: Session = Depends(get_db)):
                 logger.exception("OpenAI call failed: %s", err)
                 return {"reply": "AI service error — please try again later.", "source": "ai_error"}
 
-        lower = text_in.lower()
-
-        # Category summary
-        if "category summary" in lower or "show expenses by category" in lower or "category totals" in lower:
-            now = datetime.now()
-            report = utils.get_monthly_report(db, now.year, now.month)
-            by_cat = report.get("by_category", [])
-            if not by_cat:
-                return {"reply": "No category data available for the current month.", "source": "db"}
-            lines = ["Category summary for this month:"]
-            for r in by_cat:
-                lines.append(f"- {r['exp_type']}: {r['total']:.2f} ({r['count']} txns)")
-            return {"reply": "\n".join(lines), "source": "db"}
-
-        # Top merchants
-        if "top merchant" in lower or "top 5 merchants" in lower or "top merchants" in lower:
-            now = datetime.now()
-            ys = str(now.year); ms = f"{now.month:02d}"
-            q = db.query(
-                    func.coalesce(Expense.note, "unknown").label("merchant"),
-                    func.sum(Expense.total_amount).label("total"),
-                    func.count(Expense.id).label("count")
-                ) \
-                .filter(func.strftime("%Y", Expense.tx_datetime) == ys) \
-                .filter(func.strftime("%m", Expense.tx_datetime) == ms) \
-                .group_by(func.coalesce(Expense.note, "unknown")) \
-                .order_by(func.abs(func.sum(Expense.total_amount)).desc()) \
-                .limit(5)
-            rows = q.all()
-            if not rows:
-                return {"reply": "No merchant data found for this month.", "source": "db"}
-            lines = ["Top merchants this month:"]
-            for r in rows:
-                lines.append(f"- {r.merchant or 'unknown'}: {float(r.total or 0):.2f} ({r.count} txns)")
-            return {"reply": "\n".join(lines), "source": "db"}
-
-        # Large transactions
-        if "large transaction" in lower or "large transactions" in lower or "above" in lower:
-            m = re.search(r"(?:above|over|greater than)\s+₹?([0-9,]+(?:\.\d+)?)", lower)
-            thr = float(m.group(1).replace(",", "")) if m else 1000.0
-            now = datetime.now()
-            ys = str(now.year); ms = f"{now.month:02d}"
-            q = db.query(Expense.tx_datetime, Expense.exp_type, Expense.total_amount, Expense.note) \
-                  .filter(func.strftime("%Y", Expense.tx_datetime) == ys) \
-                  .filter(func.strftime("%m", Expense.tx_datetime) == ms) \
-                  .filter(func.abs(Expense.total_amount) >= thr) \
-                  .order_by(func.abs(Expense.total_amount).desc()) \
-                  .limit(20)
-            rows = q.all()
-            if not rows:
-                return {"reply": f"No transactions above {thr:.2f} found this month.", "source": "db"}
-            lines = [f"Transactions ≥ {thr:.2f} this month:"]
-            for r in rows:
-                dt = r.tx_datetime
-                amt = float(r.total_amount or 0.0)
-                note = (r.note or "").strip()
-                lines.append(f"- {dt}: {amt:.2f} — {note}")
-            return {"reply": "\n".join(lines), "source": "db"}
-
-        # "how much ... spent"  — use parentheses to group correctly
-        if (re.search(r"\b(how much|what(?:'s| is) my total|how much did i spend|total (?:spend|spent))\b", lower)
-                and ("spent" in lower or "spend" in lower)):
-            now = datetime.now()
-            ys = str(now.year); ms = f"{now.month:02d}"
-            keyword = _extract_keyword(text_in)
-            q = db.query(func.sum(Expense.total_amount).label("total")) \
-                  .filter(func.strftime("%Y", Expense.tx_datetime) == ys) \
-                  .filter(func.strftime("%m", Expense.tx_datetime) == ms)
-            if keyword:
-                like = f"%{keyword}%"
-                q = q.filter(func.lower(Expense.note).like(like) | func.lower(Expense.exp_type).like(like))
-            total_row = q.first()
-            total = float(total_row.total or 0.0)
-            if keyword:
-                return {"reply": f"You spent {total:.2f} this month on '{keyword}'.", "source": "db"}
-            else:
-                return {"reply": f"Your total spend this month is {total:.2f}.", "source": "db"}
+        # rule-based questions: one planned query (see chat_planner.py)
+        plan = chat_planner.plan(text_in)
+        if plan.intent:
+            conn = database.get_conn()
+            try:
+                result = chat_planner.execute(conn, plan)
+            finally:
+                conn.close()
+            return {"reply": chat_planner.reply(plan, result), "source": "db"}
 
         # fallback
         return {"reply": f"You said: {text_in}", "source": "db"}
@@ -0,0 +1,323 @@
+# backend_expenses/bulk_writer.py
+"""
+Batched insert path for expenses + expense_items (raw sqlite3).
+
+Shared by the ingest endpoints (upload_csv / upload_text) and
+db_helpers.insert_expense. Rows are buffered and written with one
+executemany per batch instead of one INSERT (and one lastrowid) per row.
+
+Item foreign keys are resolved per batch: expense ids are allocated up
+front from MAX(id) while the write lock is held (BEGIN IMMEDIATE), so items
+can be inserted with their expense_id without a round trip per row.
+
+In "upsert" mode every record carries an import_key (its txn_id, or a
+content hash of tx_datetime/amount/note when there is none, see content_key) and
+(source, import_key) is unique, so re-importing an overlapping statement only
+writes the rows that are new or changed; the rest are counted as skipped.
+
+Callers own the transaction: the writer never commits.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .periods import normalize_timestamp
+
+DEFAULT_BATCH_SIZE = int(os.environ.get("BULK_INSERT_BATCH_SIZE", 1000))
+
+APPEND = "append"
+UPSERT = "upsert"
+MODES = (APPEND, UPSERT)
+
+EXPENSE_INSERT_SQL = (
+    "INSERT INTO expenses (id, tx_datetime, exp_type, total_amount, note, source, txn_id, batch_id, import_key) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+EXPENSE_UPDATE_SQL = "UPDATE expenses SET tx_datetime = ?, exp_type = ?, total_amount = ?, note = ? WHERE id = ?"
+ITEM_INSERT_SQL = "INSERT INTO expense_items (expense_id, quantity, amount) VALUES (?, ?, ?)"
+# SQLite's default limit on bound parameters is 999 on older builds
+_LOOKUP_CHUNK = 500
+# maintenance_state key set once rekey_content_hashes has run
+REKEY_STATE_KEY = "import_keys.normalized_timestamps"
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value or 0.0)
+    except Exception:
+        return 0.0
+
+
+def content_key(record: Dict[str, Any]) -> str:
+    """
+    Fallback import key for rows without a txn_id. The timestamp is hashed in
+    its stored form (periods.normalize_timestamp), so '2025-09-01T10:00:00'
+    and '2025-09-01 10:00:00' give the same key.
+    """
+    return _content_key(normalize_timestamp(record.get("tx_datetime")), record.get("total_amount"), record.get("note"))
+
+
+def _content_key(tx_datetime: Any, amount: Any, note: Optional[str]) -> str:
+    try:
+        amount = f"{float(amount):.2f}"
+    except (TypeError, ValueError):
+        amount = str(amount or "")
+    raw = "|".join((str(tx_datetime or ""), amount, (note or "").strip()))
+    return "h:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def rekey_content_hashes(conn: sqlite3.Connection) -> int:
+    """
+    Re-derive content keys that were hashed from a 'T'-separated timestamp
+    (imports made before content_key normalised it), so re-uploading those
+    files matches the stored rows again. Runs once per database (caller
+    commits); returns the number of rows rekeyed.
+    """
+    if conn.execute("SELECT 1 FROM maintenance_state WHERE key = ?", (REKEY_STATE_KEY,)).fetchone():
+        return 0
+    updates = []
+    rows = conn.execute(
+        "SELECT id, import_key, tx_datetime, total_amount, note FROM expenses "
+        "WHERE import_key LIKE 'h:%' AND tx_datetime LIKE '____-__-__ %'"
+    )
+    for expense_id, key, tx, amount, note in rows:
+        base, sep, n = key.partition("#")
+        if base == _content_key(tx[:10] + "T" + tx[11:], amount, note):
+            updates.append((_content_key(tx, amount, note) + sep + n, expense_id))
+    # OR IGNORE: a row already re-imported under the new key keeps its old one (dedupe finds the pair)
+    conn.executemany("UPDATE OR IGNORE expenses SET import_key = ? WHERE id = ?", updates)
+    conn.execute("INSERT INTO maintenance_state (key, value) VALUES (?, '1')", (REKEY_STATE_KEY,))
+    return len(updates)
+
+
+def _row_values(r: Dict[str, Any]) -> Tuple:
+    return (r.get("tx_datetime"), r.get("exp_type"), r.get("total_amount"), r.get("note"))
+
+
+class BulkWriter:
+    """
+    Buffer expense records and insert them with executemany in batches.
+
+    Each record is a dict with keys tx_datetime, exp_type, total_amount, note,
+    source, txn_id and optionally batch_id and items (list of {quantity, amount}).
+    Values are written as given; callers apply their own defaults/normalisation.
+
+    mode="upsert" assigns import keys (see content_key) and, per batch, looks
+    up which (source, import_key) pairs already exist: unchanged rows are
+    skipped, changed ones updated in place (keeping their original batch_id),
+    and only the rest inserted. A key seen n times in one import gets the
+    suffix "#n" so identical rows within a file are all kept, and the same
+    file re-imported maps onto the same keys.
+
+    Usage:
+        writer = BulkWriter(conn, batch_size=1000)
+        for rec in records:
+            writer.add(rec)
+        writer.flush()
+        conn.commit()
+        writer.stats()  # {"rows": ..., "rows_per_sec": ...}
+    """
+
+    def __init__(self, conn: sqlite3.Connection, batch_size: int = DEFAULT_BATCH_SIZE, mode: str = APPEND):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.conn = conn
+        self.batch_size = max(1, int(batch_size))
+        self.mode = mode
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self._seen_keys: Dict[Tuple[Optional[str], str], int] = {}
+        self._touched: Optional[List[Tuple[Optional[str], str]]] = None  # _seen_keys bumped since _checkpoint()
+        self.items = 0
+        self.batches = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._elapsed = 0.0
+
+    def add(self, record: Dict[str, Any]) -> List[int]:
+        """Queue one record; flushes (and returns the batch's ids) when the batch is full."""
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def add_many(self, records: Iterable[Dict[str, Any]]) -> List[int]:
+        ids: List[int] = []
+        for rec in records:
+            ids.extend(self.add(rec))
+        return ids
+
+    def _next_id(self) -> int:
+        cur = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM expenses")
+        next_id = cur.fetchone()[0]
+        # tables created with AUTOINCREMENT must not reuse ids of deleted rows
+        try:
+            row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'expenses'").fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row and row[0] is not None:
+            next_id = max(next_id, row[0])
+        return next_id + 1
+
+    def _import_key(self, r: Dict[str, Any]) -> str:
+        base = r.get("import_key") or r.get("txn_id") or content_key(r)
+        seen_key = (r.get("source"), base)
+        n = self._seen_keys.get(seen_key, 0)
+        self._seen_keys[seen_key] = n + 1
+        if self._touched is not None:
+            self._touched.append(seen_key)
+        return base if n == 0 else f"{base}#{n}"
+
+    def _existing(self, keyed: List[Tuple[Optional[str], str]]) -> Dict[Tuple[Optional[str], str], Tuple]:
+        """(source, import_key) -> (id, tx_datetime, exp_type, total_amount, note) for rows already stored."""
+        by_source: Dict[Optional[str], List[str]] = {}
+        for source, key in keyed:
+            by_source.setdefault(source, []).append(key)
+        found = {}
+        cur = self.conn.cursor()
+        for source, keys in by_source.items():
+            for i in range(0, len(keys), _LOOKUP_CHUNK):
+                part = keys[i:i + _LOOKUP_CHUNK]
+                marks = ",".join("?" * len(part))
+                cur.execute(
+                    "SELECT import_key, id, tx_datetime, exp_type, total_amount, note FROM expenses "
+                    f"WHERE source IS ? AND import_key IN ({marks})",
+                    [source, *part],
+                )
+                for row in cur.fetchall():
+                    found[(source, row[0])] = tuple(row[1:])
+        return found
+
+    def flush(self) -> List[int]:
+        """Write buffered records; returns the expense id of every record in input order."""
+        if not self._pending:
+            return []
+        batch, self._pending = self._pending, []
+        t0 = time.perf_counter()
+
+        # take the write lock before reading MAX(id) so the id range stays ours
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN IMMEDIATE")
+
+        keys: List[Optional[str]] = [None] * len(batch)
+        existing: Dict[Tuple[Optional[str], str], Tuple] = {}
+        if self.mode == UPSERT:
+            keys = [self._import_key(r) for r in batch]
+            existing = self._existing([(r.get("source"), k) for r, k in zip(batch, keys)])
+
+        ids: List[int] = []
+        to_insert = []
+        update_params = []
+        updated_ids = []
+        next_id = self._next_id()
+        for r, key in zip(batch, keys):
+            old = existing.get((r.get("source"), key)) if key is not None else None
+            if old is None:
+                ids.append(next_id)
+                to_insert.append((next_id, r, key))
+                next_id += 1
+            elif tuple(old[1:]) == _row_values(r):
+                ids.append(old[0])
+                self.skipped += 1
+            else:
+                ids.append(old[0])
+                update_params.append((*_row_values(r), old[0]))
+                updated_ids.append((old[0], r))
+
+        expense_params = []
+        item_params = []
+        for expense_id, r, key in to_insert:
+            expense_params.append((
+                expense_id,
+                r.get("tx_datetime"),
+                r.get("exp_type"),
+                r.get("total_amount"),
+                r.get("note"),
+                r.get("source"),
+                r.get("txn_id"),
+                r.get("batch_id"),
+                key,
+            ))
+            for it in r.get("items") or []:
+                item_params.append((expense_id, _to_float(it.get("quantity")), _to_float(it.get("amount"))))
+
+        cur = self.conn.cursor()
+        if expense_params:
+            cur.executemany(EXPENSE_INSERT_SQL, expense_params)
+        if update_params:
+            cur.executemany(EXPENSE_UPDATE_SQL, update_params)
+            # an updated row's items are replaced by the incoming ones
+            cur.executemany("DELETE FROM expense_items WHERE expense_id = ?", [(i,) for i, _ in updated_ids])
+            for expense_id, r in updated_ids:
+                for it in r.get("items") or []:
+                    item_params.append((expense_id, _to_float(it.get("quantity")), _to_float(it.get("amount"))))
+        if item_params:
+            cur.executemany(ITEM_INSERT_SQL, item_params)
+
+        self.rows += len(batch)
+        self.inserted += len(expense_params)
+        self.updated += len(update_params)
+        self.items += len(item_params)
+        self.batches += 1
+        self._elapsed += time.perf_counter() - t0
+        return ids
+
+    def _checkpoint(self) -> Tuple:
+        self._touched = []
+        return (self.rows, self.inserted, self.updated, self.skipped, self.items, self.batches,
+                list(self._pending), self._touched)
+
+    def _restore(self, state: Tuple) -> None:
+        """Back to a _checkpoint(), after the rows written since were rolled back (safe to call twice)."""
+        self.rows, self.inserted, self.updated, self.skipped, self.items, self.batches, pending, touched = state
+        self._pending = list(pending)
+        for key in touched:
+            n = self._seen_keys[key] - 1
+            if n:
+                self._seen_keys[key] = n
+            else:
+                del self._seen_keys[key]
+        touched.clear()
+
+    def write(self, conn: sqlite3.Connection, records: Iterable[Dict[str, Any]]) -> List[int]:
+        """
+        Add records and flush them on conn (the writer queue's connection);
+        returns their ids. If the writes are rolled back (this call raises,
+        or the writer undoes the request or its group) the counters and
+        import-key ordinals go back to where they were, so the same records
+        can be retried with the same writer.
+        """
+        self.conn = conn
+        state = self._checkpoint()
+        try:
+            ids = self.add_many(records)
+            ids.extend(self.flush())
+        except Exception:
+            self._restore(state)
+            raise
+        on_rollback = getattr(conn, "on_rollback", None)
+        if on_rollback is not None:
+            on_rollback(lambda: self._restore(state))
+        return ids
+
+    def stats(self) -> Dict[str, Any]:
+        """Rows processed so far, what happened to them, and throughput (time spent inside flush only)."""
+        secs = self._elapsed
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "items": self.items,
+            "batches": self.batches,
+            "seconds": round(secs, 4),
+            "rows_per_sec": round(self.rows / secs, 1) if secs > 0 else None,
+        }
+
+
+def write_records(conn: sqlite3.Connection, writer: BulkWriter, records: Iterable[Dict[str, Any]]) -> List[int]:
+    """Writer-queue request (fn(conn, *args)) that writes records through writer."""
+    return writer.write(conn, records)
@@ -4,9 +4,9 @@ from typing import Dict, Any, Optional
 from datetime import datetime
 import sqlite3
 
-# Adjust import path if needed
-from backend_ingest.parsers.intent import detect_item_month_query
+from backend_expenses import chat_planner, search
 from backend_expenses.database import get_conn
+from backend_expenses.periods import month_range
 
 router = APIRouter(prefix="/api/v1", tags=["chat"])
 
@@ -14,28 +14,14 @@ router = APIRouter(prefix="/api/v1", tags=["chat"])
 def total_for_keyword_month(keyword: str, year: int, month: int) -> Dict[str, Any]:
     """
     Compute sum(total_amount) and count of transactions for a keyword in a given year-month.
-    Uses substr(tx_datetime,1,7) = 'YYYY-MM' to handle mixed timestamp formats.
-    Searches note, exp_type, source (case-insensitive).
+    Searches note, exp_type, source (case-insensitive) through the expenses_fts
+    index joined to the half-open month range (see backend_expenses.search).
     """
-    ym = f"{year:04d}-{month:02d}"
-    like = f"%{keyword.lower()}%"
     conn = get_conn()
-    cur = conn.cursor()
-    sql = """
-    SELECT SUM(total_amount) AS total, COUNT(*) AS tx_count
-    FROM expenses
-    WHERE substr(coalesce(tx_datetime,''),1,7) = ?
-      AND (
-        lower(coalesce(note,'')) LIKE ?
-        OR lower(coalesce(exp_type,'')) LIKE ?
-        OR lower(coalesce(source,'')) LIKE ?
-      )
-    """
-    cur.execute(sql, (ym, like, like, like))
-    row = cur.fetchone()
-    conn.close()
-    total = float(row["total"]) if row and row["total"] is not None else 0.0
-    tx_count = int(row["tx_count"]) if row and row["tx_count"] is not None else 0
+    try:
+        total, tx_count = search.keyword_total(conn, keyword, month_range(year, month))
+    finally:
+        conn.close()
     return {"keyword": keyword, "year": year, "month": month, "total": total, "tx_count": tx_count}
 
 
@@ -43,21 +29,9 @@ def total_for_keyword_month(keyword: str, year: int, month: int) -> Dict[str, An
 # If you already have a function that handles generic prompts, import it here.
 def handle_generic_chat_text(text: str, payload: Dict[str, Any]) -> str:
     """
-    Minimal fallback: return month total for 'this month' style queries, otherwise echo.
+    Minimal fallback for messages the planner does not recognise.
     Replace this with your AI/chat logic.
     """
-    # Example: if user asks "total this month" -> return sum of month
-    s = text.lower()
-    if "this month" in s or "total this month" in s:
-        now = datetime.utcnow()
-        ym = f"{now.year:04d}-{now.month:02d}"
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT SUM(total_amount) AS total FROM expenses WHERE substr(coalesce(tx_datetime,''),1,7)=?", (ym,))
-        row = cur.fetchone()
-        conn.close()
-        total = float(row["total"]) if row and row["total"] is not None else 0.0
-        return f"Your total spend this month is {total:.2f}."
     # default echo (replace with AI)
     return "Sorry — I couldn't detect a specific item. " \
            "Try asking: 'How much I spent on coffee this month?'"
@@ -66,8 +40,8 @@ def handle_generic_chat_text(text: str, payload: Dict[str, Any]) -> str:
 @router.post("/chat")
 async def chat_endpoint(req: Request):
     """
-    Chat endpoint enhanced with item-month detection:
-    - If message matches an item-month intent (eg. coffee this month), return item-specific total.
+    Chat endpoint backed by chat_planner:
+    - If the message is a spending question (eg. coffee this month), answer it from the DB.
     - Otherwise, fall back to generic chat handler (AI or rule-based).
     Expects JSON payload with fields like { "message": "...", "text": "..." }.
     """
@@ -77,24 +51,30 @@ async def chat_endpoint(req: Request):
     if not text:
         return {"reply": "Sorry, I didn't receive any message."}
 
-    # 1) Try to detect item-month intent
-    detected = detect_item_month_query(text)
-    if detected and detected.get("keyword"):
-        keyword = detected["keyword"]
-        year = detected.get("year", datetime.utcnow().year)
-        month = detected.get("month", datetime.utcnow().month)
-
-        # compute totals
-        res = total_for_keyword_month(keyword, year, month)
-        total = res["total"]
-        tx_count = res["tx_count"]
-
-        if tx_count == 0:
-            reply = f"No expenses found for '{keyword}' in {year}-{month:02d}."
+    # 1) Rule-based questions (item totals, month totals, summaries) -> one planned query
+    plan = chat_planner.plan(text)
+    if plan.intent:
+        conn = get_conn()
+        try:
+            res = chat_planner.execute(conn, plan)
+        finally:
+            conn.close()
+        if plan.intent == "sum" and plan.term:
+            keyword, period = plan.term, chat_planner.period_text(plan)
+            if res["count"] == 0:
+                reply = f"No expenses found for '{keyword}' {period}."
+            else:
+                reply = f"You spent {res['total']:.2f} on '{keyword}' {period} across {res['count']} transaction(s)."
         else:
-            reply = f"You spent {total:.2f} on '{keyword}' in {year}-{month:02d} across {tx_count} transaction(s)."
-
-        return {"reply": reply, "data": res}
+            reply = chat_planner.reply(plan, res)
+        data = {"intent": plan.intent, "keyword": plan.term, "start": plan.start, "end": plan.end, **res}
+        if plan.intent == "sum":
+            # keys of the earlier keyword/month answer, kept for existing clients
+            # (year / month are None unless the range is exactly one calendar month)
+            year, month = int(plan.start[:4]), int(plan.start[5:7])
+            one_month = plan.start.endswith("-01") and plan.end == f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+            data.update(year=year if one_month else None, month=month if one_month else None, tx_count=res["count"])
+        return {"reply": reply, "data": data}
 
     # 2) Not an item query — fallback to existing chat/AI logic
     reply = handle_generic_chat_text(text, payload)
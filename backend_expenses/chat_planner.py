@@ -0,0 +1,283 @@
+# backend_expenses/chat_planner.py
+"""
+Rule-based chat questions -> one structured query.
+
+plan() turns a message into a Plan (intent, term, threshold, date range)
+using the precompiled patterns below; execute() answers it with a single
+parameterised statement, read from the rollup tables where the question is
+an aggregate over whole days / months (see rollups.py):
+
+    p = plan("How much did I spend on coffee last month?")
+    # Plan(intent='sum', term='coffee', threshold=None, start='2025-08-01', end='2025-09-01', period='last month')
+    result = execute(conn, p)          # {"total": ..., "count": ...}
+    text = reply(p, result)
+
+The search term is the phrase after "on" / "for" / "at"; without one, the
+message's words are looked up in the keyword vocabulary (vocab.keywords(),
+built from the stored expenses) and the longest known word wins, so "how
+much have I spent this month" totals everything instead of searching for
+"have". Plans depend only on the normalised text, today's date and that
+keyword set, so they are LRU-cached on the text, the date and the
+vocabulary generation (PLAN_CACHE_SIZE entries). The generation only moves
+when a refresh finds different tokens, and the matcher itself is not part
+of the key. Both chat endpoints
+(app.chat_endpoint and chat.router) go through here.
+Category summaries and top merchants are also cached per date range until
+the data changes (result_cache.py).
+"""
+import os
+import re
+import sqlite3
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from . import result_cache, search, vocab
+from .periods import ALL_TIME, RANGE_SQL, RELATIVE_PERIODS, month_range, relative_range, year_range
+
+INTENTS = ("category_summary", "top_merchants", "large_txn", "sum")
+# plans kept by the LRU cache (keyed by normalised text + today + vocabulary generation)
+PLAN_CACHE_SIZE = int(os.environ.get("CHAT_PLAN_CACHE_SIZE", 1024))
+DEFAULT_THRESHOLD = 1000.0
+TOP_MERCHANTS = 5
+LARGE_TXN_LIMIT = 20
+# intents whose results go through result_cache (the others are single indexed lookups)
+CACHED_INTENTS = ("category_summary", "top_merchants")
+
+# words that never form a search term on their own
+STOPWORDS = {
+    "how", "much", "what", "whats", "what's", "is", "was", "did", "do", "does", "i", "me", "my", "we", "our",
+    "spent", "spend", "spending", "amount", "total", "sum", "show", "tell", "give", "the", "a", "an", "all",
+    "on", "for", "in", "at", "of", "to", "and", "this", "last", "month", "week", "year", "today", "yesterday",
+    "money", "expenses", "expense", "so", "far", "ever", "overall", "time", "history", "have", "has", "had",
+    "i've", "ive", "been", "am", "are", "were", "can", "you", "please",
+}
+# a term ends at the first of these words ("coffee at starbucks this month" -> "coffee")
+_TERM_END = {
+    "at", "in", "during", "from", "since", "between", "before", "after", "this", "last", "today",
+    "yesterday", "above", "over", "per", "so", "and", "ever", "overall", "all",
+}
+_MONTHS = {
+    name: i + 1
+    for i, names in enumerate(zip(
+        ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"),
+        ("january", "february", "march", "april", "may", "june", "july",
+         "august", "september", "october", "november", "december"),
+    ))
+    for name in names
+}
+_MONTHS["sept"] = 9
+
+_PUNCT_RE = re.compile(r"[?!;\"]+|\.(?=\s|$)")
+_SPACE_RE = re.compile(r"\s+")
+
+# intent triggers: the phrases the chat endpoints answered before the planner, nothing broader
+_CATEGORY_RE = re.compile(r"category summary|show expenses by category|category totals")
+_TOP_RE = re.compile(r"top merchant|top 5 merchants")
+_LARGE_RE = re.compile(r"large transaction|above")
+_THRESHOLD_RE = re.compile(r"(?:\babove|\bover|\bgreater than)\s*₹?\s*([0-9][0-9,]*(?:\.\d+)?)")
+# a spending question needs one of these phrases and a "spend" / "spent"
+_SUM_RE = re.compile(r"\b(?:how much|what(?:'s| is) my total|what did i spend|total (?:spend|spent))\b")
+_SPEND_RE = re.compile(r"spen[dt]")
+# short forms ("coffee this month") count only with a known keyword (see _known_term)
+_SHORT_RE = re.compile(r"\b(?:this|last) month\b")
+_TERM_RE = re.compile(r"\b(?:on|for|about|at)\s+([a-z0-9&'\- ]+)")
+_WORD_RE = re.compile(r"[a-z0-9&'\-]+")
+
+_RELATIVE_RE = re.compile(r"\b(" + "|".join(sorted(RELATIVE_PERIODS, key=len, reverse=True)) + r")\b")
+_MONTH_NAMES = "|".join(sorted(_MONTHS, key=len, reverse=True))
+_MONTH_YEAR_RE = re.compile(rf"\b({_MONTH_NAMES})\s+(\d{{4}})\b")
+_IN_MONTH_RE = re.compile(rf"\bin\s+({_MONTH_NAMES})\b")
+_ISO_MONTH_RE = re.compile(r"\b(\d{4})-(\d{2})\b")
+_YEAR_RE = re.compile(r"\b(?:in|during|for)\s+((?:19|20)\d{2})\b")
+_ALL_TIME_RE = re.compile(r"\ball[- ]time\b|\bever\b|\boverall\b|\ball history\b")
+
+
+class Plan(NamedTuple):
+    intent: Optional[str]  # one of INTENTS, None when the message is not a spending question
+    term: Optional[str]  # keyword for "sum" (None = everything)
+    threshold: Optional[float]  # minimum abs(amount) for "large_txn"
+    start: str  # half-open date range [start, end)
+    end: str
+    period: str  # human label of the range ("this month", "2025-09")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop sentence punctuation, collapse whitespace."""
+    s = (text or "").lower().replace("’", "'")
+    return _SPACE_RE.sub(" ", _PUNCT_RE.sub(" ", s)).strip()
+
+
+def _date_range(s: str, today: date):
+    """(start, end, label) of the period named in s; defaults to this month."""
+    m = _MONTH_YEAR_RE.search(s)
+    if m:
+        year, month = int(m.group(2)), _MONTHS[m.group(1)]
+        return (*month_range(year, month), f"{year:04d}-{month:02d}")
+    m = _ISO_MONTH_RE.search(s)
+    if m and 1 <= int(m.group(2)) <= 12:
+        year, month = int(m.group(1)), int(m.group(2))
+        return (*month_range(year, month), f"{year:04d}-{month:02d}")
+    m = _RELATIVE_RE.search(s)
+    if m:
+        return (*relative_range(m.group(1), today), m.group(1))
+    m = _IN_MONTH_RE.search(s)
+    if m:
+        # "in march": the latest March that has started
+        month = _MONTHS[m.group(1)]
+        year = today.year if month <= today.month else today.year - 1
+        return (*month_range(year, month), f"{year:04d}-{month:02d}")
+    m = _YEAR_RE.search(s)
+    if m:
+        return (*year_range(int(m.group(1))), m.group(1))
+    if _ALL_TIME_RE.search(s):
+        return (*ALL_TIME, "all time")
+    return (*relative_range("this month", today), "this month")
+
+
+def _term(s: str, keywords: vocab.KeywordMatcher) -> Optional[str]:
+    m = _TERM_RE.search(s)
+    if m:
+        words = []
+        for word in m.group(1).split():
+            if word in _TERM_END or word.isdigit() or _ISO_MONTH_RE.fullmatch(word) or (word in _MONTHS and words):
+                break
+            if not words and word in ("the", "my", "a", "an"):
+                continue
+            words.append(word)
+        if words and not all(w in STOPWORDS for w in words):
+            return " ".join(words)
+    # no "on ..." phrase: the longest known keyword among the meaningful
+    # words, else the first of them
+    words = _words(s)
+    if not words:
+        return None
+    return _known_term(words, keywords) or words[0]
+
+
+def _words(s: str) -> List[str]:
+    """Words of s that can name a merchant / item."""
+    return [
+        word for word in _WORD_RE.findall(s)
+        if word not in STOPWORDS and word not in _MONTHS and len(word) > 1 and not word.isdigit()
+    ]
+
+
+def _known_term(words: List[str], keywords: vocab.KeywordMatcher) -> Optional[str]:
+    """Longest of words found in the keyword vocabulary, or None."""
+    known = [word for word in words if word in keywords]
+    return max(known, key=len) if known else None
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _plan(s: str, today: date, generation: int) -> Plan:
+    start, end, period = _date_range(s, today)
+    if _CATEGORY_RE.search(s):
+        return Plan("category_summary", None, None, start, end, period)
+    if _TOP_RE.search(s):
+        return Plan("top_merchants", None, None, start, end, period)
+    if _LARGE_RE.search(s):
+        m = _THRESHOLD_RE.search(s)
+        threshold = float(m.group(1).replace(",", "")) if m else DEFAULT_THRESHOLD
+        return Plan("large_txn", None, threshold, start, end, period)
+    if _SUM_RE.search(s) and _SPEND_RE.search(s):
+        return Plan("sum", _term(s, vocab.keywords()), None, start, end, period)
+    if _SHORT_RE.search(s):
+        term = _known_term(_words(s), vocab.keywords())
+        if term:
+            return Plan("sum", term, None, start, end, period)
+    return Plan(None, None, None, start, end, period)
+
+
+def plan(text: str, today: Optional[date] = None) -> Plan:
+    return _plan(normalize(text), today or date.today(), vocab.keywords_generation())
+
+
+def cache_info() -> Dict[str, int]:
+    info = _plan.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+
+
+def _month_aligned(p: Plan) -> bool:
+    return p.start.endswith("-01") and p.end.endswith("-01")
+
+
+def execute(conn: sqlite3.Connection, p: Plan) -> Dict[str, Any]:
+    """Run the plan on a sqlite3 connection; the result shape depends on the intent."""
+    if p.intent in CACHED_INTENTS:
+        version = result_cache.version(conn)
+        return result_cache.cached(f"chat_{p.intent}", (p.start, p.end), lambda: _execute(conn, p), version)
+    return _execute(conn, p)
+
+
+def _execute(conn: sqlite3.Connection, p: Plan) -> Dict[str, Any]:
+    bounds = (p.start, p.end)
+    if p.intent == "sum" and p.term:
+        total, count = search.keyword_total(conn, p.term, bounds)
+        return {"total": total, "count": count}
+    if p.intent == "sum":
+        row = conn.execute("SELECT SUM(total), SUM(count) FROM rollup_daily WHERE day >= ? AND day < ?", bounds).fetchone()
+        return {"total": float(row[0] or 0.0), "count": int(row[1] or 0)}
+    if p.intent == "category_summary":
+        if _month_aligned(p):
+            sql = "SELECT exp_type, SUM(total), SUM(count) FROM rollup_monthly WHERE ym >= ? AND ym < ? GROUP BY exp_type"
+            params = (p.start[:7], p.end[:7])
+        else:
+            sql = "SELECT exp_type, SUM(total), SUM(count) FROM rollup_daily WHERE day >= ? AND day < ? GROUP BY exp_type"
+            params = bounds
+        rows = [{"exp_type": r[0], "total": float(r[1] or 0.0), "count": int(r[2] or 0)} for r in conn.execute(sql, params)]
+        rows.sort(key=lambda r: abs(r["total"]), reverse=True)
+        return {"rows": rows}
+    if p.intent == "top_merchants":
+        cur = conn.execute(
+            "SELECT coalesce(note, 'unknown'), SUM(total_amount), COUNT(*) FROM expenses "
+            f"WHERE {RANGE_SQL} GROUP BY 1 ORDER BY abs(SUM(total_amount)) DESC LIMIT ?",
+            (*bounds, TOP_MERCHANTS),
+        )
+        return {"rows": [{"merchant": r[0], "total": float(r[1] or 0.0), "count": int(r[2])} for r in cur]}
+    if p.intent == "large_txn":
+        cur = conn.execute(
+            "SELECT tx_datetime, exp_type, total_amount, note FROM expenses "
+            f"WHERE {RANGE_SQL} AND abs(total_amount) >= ? ORDER BY abs(total_amount) DESC LIMIT ?",
+            (*bounds, p.threshold, LARGE_TXN_LIMIT),
+        )
+        return {"rows": [
+            {"tx_datetime": r[0], "exp_type": r[1], "total_amount": float(r[2] or 0.0), "note": r[3]} for r in cur
+        ]}
+    return {}
+
+
+def period_text(p: Plan) -> str:
+    """'this month', 'in 2025-09', 'overall' (for use after a verb)."""
+    if p.period == "all time":
+        return "overall"
+    return p.period if p.period[0].isalpha() else f"in {p.period}"
+
+
+def reply(p: Plan, result: Dict[str, Any]) -> str:
+    """Plain-text answer for an executed plan."""
+    period = period_text(p)
+    if p.intent == "sum" and p.term:
+        return f"You spent {result['total']:.2f} {period} on '{p.term}'."
+    if p.intent == "sum":
+        return f"Your total spend {period} is {result['total']:.2f}."
+    rows = result.get("rows") or []
+    if p.intent == "category_summary":
+        if not rows:
+            return f"No category data available {period}."
+        lines = [f"Category summary {period}:"]
+        lines += [f"- {r['exp_type']}: {r['total']:.2f} ({r['count']} txns)" for r in rows]
+        return "\n".join(lines)
+    if p.intent == "top_merchants":
+        if not rows:
+            return f"No merchant data found {period}."
+        lines = [f"Top merchants {period}:"]
+        lines += [f"- {r['merchant'] or 'unknown'}: {r['total']:.2f} ({r['count']} txns)" for r in rows]
+        return "\n".join(lines)
+    if p.intent == "large_txn":
+        if not rows:
+            return f"No transactions above {p.threshold:.2f} found {period}."
+        lines = [f"Transactions ≥ {p.threshold:.2f} {period}:"]
+        lines += [f"- {r['tx_datetime']}: {r['total_amount']:.2f} — {(r['note'] or '').strip()}" for r in rows]
+        return "\n".join(lines)
+    return ""
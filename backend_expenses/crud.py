@@ -1,27 +1,182 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import String, tuple_, type_coerce
 from sqlalchemy.orm import Session
-from . import models
+from . import models, writer
+from .bulk_writer import BulkWriter, write_records
+from .periods import day_range
+
+# largest page GET /expenses/ will return
+MAX_PAGE_SIZE = 500
+# columns GET /expenses/ can return (fields= projection), in response order
+EXPENSE_FIELDS = ("id", "tx_datetime", "exp_type", "total_amount", "note", "source", "txn_id", "batch_id", "import_key")
+
+def _record(exp: models.ExpenseCreate) -> Dict[str, Any]:
+    return {
+        # the text form SQLAlchemy's DateTime writes, so the row reads back like ORM-created ones
+        "tx_datetime": exp.tx_datetime.strftime("%Y-%m-%d %H:%M:%S.%f"),
+        "exp_type": exp.exp_type,
+        "total_amount": exp.total_amount,
+        "note": exp.note,
+        "items": [{"quantity": it.quantity, "amount": it.amount} for it in exp.items],
+    }
 
 def create_expense(db: Session, exp: models.ExpenseCreate):
-    db_exp = models.Expense(
-        tx_datetime=exp.tx_datetime,
-        exp_type=exp.exp_type,
-        total_amount=exp.total_amount,
-        note=exp.note
+    """Insert one expense + items through the writer queue (group commit); returns the ORM row."""
+    (expense_id,) = writer.submit(write_records, BulkWriter(None, batch_size=1), [_record(exp)]).result()
+    return db.get(models.Expense, expense_id)
+
+def create_expenses_bulk(db: Session, payload: List[Any]) -> Dict[str, Any]:
+    """
+    Validate each element of payload as ExpenseCreate and insert the valid ones,
+    items included, as one writer-queue request (executemany per batch, one
+    transaction). Invalid elements are reported in "errors" (by index) and do
+    not stop the rest.
+    """
+    valid: List[Tuple[int, models.ExpenseCreate]] = []
+    errors = []
+    for index, raw in enumerate(payload):
+        try:
+            valid.append((index, models.ExpenseCreate.model_validate(raw)))
+        except ValidationError as e:
+            errors.append({"index": index, "errors": e.errors(include_url=False, include_context=False)})
+
+    results = []
+    if valid:
+        ids = writer.submit(write_records, BulkWriter(None), [_record(exp) for _, exp in valid]).result()
+        results = [{"index": index, "id": expense_id} for (index, _), expense_id in zip(valid, ids)]
+
+    return {"inserted": len(results), "results": results, "errors": errors}
+
+def encode_cursor(tx_datetime: Optional[str], expense_id: int) -> str:
+    """Opaque cursor for the position after (tx_datetime, id)."""
+    raw = json.dumps([tx_datetime, expense_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Optional[str], int]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        tx, expense_id = json.loads(raw)
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(expense_id, int) or not (tx is None or isinstance(tx, str)):
+        raise ValueError("invalid cursor")
+    return tx, expense_id
+
+def _iso(raw: Optional[str]) -> Optional[str]:
+    """Stored tx_datetime text -> the isoformat() string the ORM response used to return."""
+    if raw is None:
+        return None
+    try:
+        return datetime.fromisoformat(raw).isoformat()
+    except ValueError:
+        return raw
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """'id,total_amount' -> ('id', 'total_amount'); None -> all EXPENSE_FIELDS. ValueError on unknown names."""
+    if not fields:
+        return EXPENSE_FIELDS
+    names = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in names if f not in EXPENSE_FIELDS]
+    if unknown or not names:
+        raise ValueError(f"unknown fields {unknown}; choose from {', '.join(EXPENSE_FIELDS)}")
+    return names
+
+def _load_items(db: Session, ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """expense_id -> [{quantity, amount}] for all ids in one IN query."""
+    out: Dict[int, List[Dict[str, Any]]] = {i: [] for i in ids}
+    if not ids:
+        return out
+    I = models.ExpenseItem
+    rows = (
+        db.query(I.expense_id, I.quantity, I.amount)
+        .filter(I.expense_id.in_(ids))
+        .order_by(I.expense_id, I.id)
+        .all()
     )
-    db.add(db_exp)
-    db.commit()
-    db.refresh(db_exp)
-
-    # add items
-    for it in exp.items:
-        db_item = models.ExpenseItem(
-            expense_id=db_exp.id,
-            quantity=it.quantity,
-            amount=it.amount
-        )
-        db.add(db_item)
-    db.commit()
-    return db_exp
+    for expense_id, quantity, amount in rows:
+        out[expense_id].append({"quantity": quantity, "amount": amount})
+    return out
+
+def get_expenses_page(
+    db: Session,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    source: Optional[str] = None,
+    exp_type: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    skip: int = 0,
+    fields: Tuple[str, ...] = EXPENSE_FIELDS,
+    include_items: bool = False,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Newest-first page of expenses ordered by (tx_datetime DESC, id DESC) and the
+    cursor for the next page (None on the last page).
+
+    Keyset pagination: the cursor holds the last row's (tx_datetime, id); the
+    next page seeks to it with a row-value comparison on ix_expenses_tx_datetime
+    (or the (source|exp_type, tx_datetime) indexes when filtering) instead of
+    skipping rows, so every page costs the same. Rows without a tx_datetime
+    come last, newest id first. start/end are inclusive days.
+
+    Only the requested columns are selected, as plain tuples (no ORM objects);
+    rows come back as dicts with just `fields`, plus "items" when include_items.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    E = models.Expense
+    tx = type_coerce(E.tx_datetime, String)
+
+    extra = [f for f in fields if f not in ("id", "tx_datetime")]
+    q = db.query(E.id, tx, *(getattr(E, f) for f in extra))
+    if source is not None:
+        q = q.filter(E.source == source)
+    if exp_type is not None:
+        q = q.filter(E.exp_type == exp_type)
+    if min_amount is not None:
+        q = q.filter(E.total_amount >= min_amount)
+    if max_amount is not None:
+        q = q.filter(E.total_amount <= max_amount)
+    if start is not None:
+        q = q.filter(tx >= day_range(start, start)[0])
+    if end is not None:
+        q = q.filter(tx < day_range(end, end)[1])
+    order = (tx.desc(), E.id.desc())
+    if not cursor:
+        rows = (q.offset(skip) if skip else q).order_by(*order).limit(limit + 1).all()
+    else:
+        c_tx, c_id = decode_cursor(cursor)
+        if c_tx is None:
+            rows = q.filter(tx.is_(None), E.id < c_id).order_by(E.id.desc()).limit(limit + 1).all()
+        else:
+            # seek past the cursor on the index; undated rows (sorted last) only once the dated ones run out
+            rows = q.filter(tuple_(tx, E.id) < tuple_(c_tx, c_id)).order_by(*order).limit(limit + 1).all()
+            if len(rows) <= limit:
+                rows += q.filter(tx.is_(None)).order_by(E.id.desc()).limit(limit + 1 - len(rows)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+
+    names = ("id", "tx_datetime", *extra)
+    out = []
+    for row in rows:
+        rec = dict(zip(names, row))
+        rec["tx_datetime"] = _iso(rec["tx_datetime"])
+        out.append({f: rec[f] for f in fields})
+    if include_items:
+        items = _load_items(db, [row[0] for row in rows])
+        for rec, row in zip(out, rows):
+            rec["items"] = items[row[0]]
+    return out, next_cursor
 
 def get_expenses(db: Session, skip: int = 0, limit: int = 50):
-    return db.query(models.Expense).offset(skip).limit(limit).all()
+    return db.query(models.Expense).order_by(models.Expense.id).offset(skip).limit(limit).all()
@@ -1,10 +1,26 @@
 # backend_expenses/database.py
+"""
+Data-access layer shared by both services (backend_ingest imports it too).
+
+- engine / SessionLocal: SQLAlchemy ORM; every DBAPI connection the engine
+  opens gets the same pragmas as the raw pool (WAL, busy_timeout, ...).
+- get_conn(): pooled raw sqlite3 connections for ingest, dedupe and chat helpers.
+- write_gate: one writer at a time per process (held by the writer queue
+  and ensure_schema), so writes queue here instead of failing with
+  "database is locked".
+- stats(): pool, write-gate wait time and lock-retry counters.
+"""
 import os
 import sqlite3
-from sqlalchemy import create_engine
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from pathlib import Path
-from typing import Generator
+from typing import Any, Dict, Generator, Iterator, List
+
+from . import result_cache
 
 # --- DB path resolution ---
 FINANCE_DB = os.environ.get("FINANCE_DB", None)
@@ -16,10 +32,14 @@ if not FINANCE_DB:
 
 # --- SQLAlchemy setup ---
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{FINANCE_DB}"
+# connections the ORM engine keeps open (readers; writes also pass the write gate)
+ENGINE_POOL_SIZE = int(os.environ.get("SQLITE_ENGINE_POOL_SIZE", 8))
 # check_same_thread=False is required for SQLite + multi-threaded servers
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
+    pool_size=ENGINE_POOL_SIZE,
+    max_overflow=ENGINE_POOL_SIZE,
     echo=False,
 )
 
@@ -37,30 +57,237 @@ def get_db() -> Generator:
     finally:
         db.close()
 
-# --- raw sqlite3 connection helper (for ingest/dedupe scripts) ---
+# --- raw sqlite3 connection pool (ingest, dedupe, chat helpers, scripts) ---
+# idle connections kept for reuse; more can be open at once, extras are closed on release
+POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 8))
+# page cache per connection in KiB (PRAGMA cache_size = -N)
+CACHE_SIZE_KIB = int(os.environ.get("SQLITE_CACHE_SIZE_KIB", 16384))
+# bytes of the DB file read through mmap (0 disables)
+MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 128 * 1024 * 1024))
+# DEFAULT | FILE | MEMORY: where temp b-trees for sorts / GROUP BY live
+TEMP_STORE = os.environ.get("SQLITE_TEMP_STORE", "MEMORY").upper()
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+
 def _ensure_pragmas(conn: sqlite3.Connection) -> None:
     """
-    Apply pragmatic SQLite pragmas to improve concurrency/durability.
+    Per-connection settings, applied once when the pool opens a connection:
+    WAL for concurrent readers/writers, synchronous=NORMAL, foreign keys,
+    a busy timeout instead of immediate 'database is locked', and the
+    tunable cache_size / mmap_size / temp_store.
     """
     try:
         conn.execute("PRAGMA journal_mode=WAL;")
         conn.execute("PRAGMA synchronous=NORMAL;")
         conn.execute("PRAGMA foreign_keys=ON;")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB};")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+        if TEMP_STORE in ("DEFAULT", "FILE", "MEMORY"):
+            conn.execute(f"PRAGMA temp_store={TEMP_STORE};")
     except Exception:
         # ignore if pragmas cannot be set yet
         pass
 
-def get_conn() -> sqlite3.Connection:
-    """
-    Return a configured sqlite3.Connection for lightweight operations.
-    Caller must close the connection.
-    """
-    # Connect with detect_types and allow usage from multiple threads
-    conn = sqlite3.connect(FINANCE_DB, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+
+def _connect() -> sqlite3.Connection:
+    # no detect_types: nothing relies on converters and they cost per column
+    conn = sqlite3.connect(FINANCE_DB, check_same_thread=False)
     _ensure_pragmas(conn)
     return conn
 
+
+class PooledConnection:
+    """
+    sqlite3.Connection stand-in handed out by get_conn(). Everything is
+    delegated to the real connection except close(), which rolls back any
+    open transaction and returns the connection to the pool.
+    """
+
+    __slots__ = ("_conn", "_pool")
+
+    def __init__(self, conn: sqlite3.Connection, pool: "ConnectionPool"):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_pool", pool)
+
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, "_conn")
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    # `with conn:` commits / rolls back like sqlite3.Connection (it does not close)
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self) -> None:
+        conn = object.__getattribute__(self, "_conn")
+        if conn is None:
+            return
+        object.__setattr__(self, "_conn", None)
+        self._pool.release(conn)
+
+    def __del__(self):
+        # a caller that forgot close() still gives the connection back
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of configured sqlite3 connections to FINANCE_DB."""
+
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = max(0, size)
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self) -> PooledConnection:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.reused += 1
+        if conn is None:
+            conn = _connect()
+            with self._lock:
+                self.opened += 1
+        conn.row_factory = sqlite3.Row
+        return PooledConnection(conn, self)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": self.size, "idle": len(self._idle), "opened": self.opened, "reused": self.reused}
+
+
+pool = ConnectionPool()
+
+
+@event.listens_for(engine, "connect")
+def _on_engine_connect(dbapi_conn, _record) -> None:
+    # same one-time setup as the raw pool, for every connection the ORM opens
+    _ensure_pragmas(dbapi_conn)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _on_session_flush(session, _flush_context) -> None:
+    # ORM writes bypass the writer queue: bump data_version once per flush, not per row
+    if session.new or session.dirty or session.deleted:
+        session.connection().exec_driver_sql(result_cache.BUMP_SQL)
+
+
+# --- single writer per process ---
+# 'database is locked' retries of the writer's BEGIN IMMEDIATE (after busy_timeout already waited)
+LOCK_RETRIES = int(os.environ.get("SQLITE_LOCK_RETRIES", 5))
+LOCK_RETRY_BACKOFF_SEC = float(os.environ.get("SQLITE_LOCK_RETRY_BACKOFF_SEC", 0.05))
+
+
+class WriteGate:
+    """
+    Re-entrant process-wide lock that write transactions (the writer
+    queue's groups, schema setup) hold while they run. SQLite allows one writer at a time anyway; queueing here
+    keeps writers from spinning on busy_timeout against each other and
+    records how long they waited.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.wait_sec_total = 0.0
+        self.wait_sec_max = 0.0
+        self.lock_retries = 0
+
+    @contextmanager
+    def hold(self) -> Iterator[None]:
+        t0 = time.perf_counter()
+        with self._lock:
+            waited = time.perf_counter() - t0
+            with self._stats_lock:
+                self.acquired += 1
+                self.wait_sec_total += waited
+                self.wait_sec_max = max(self.wait_sec_max, waited)
+            self._local.depth = getattr(self._local, "depth", 0) + 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+
+    def owned(self) -> bool:
+        """True if the calling thread currently holds the gate."""
+        return getattr(self._local, "depth", 0) > 0
+
+    def record_retry(self) -> None:
+        with self._stats_lock:
+            self.lock_retries += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "acquired": self.acquired,
+                "wait_ms_total": round(self.wait_sec_total * 1000, 3),
+                "wait_ms_max": round(self.wait_sec_max * 1000, 3),
+                "lock_retries": self.lock_retries,
+            }
+
+
+write_gate = WriteGate()
+
+
+def is_locked_error(exc: BaseException) -> bool:
+    return isinstance(exc, sqlite3.OperationalError) and "locked" in str(exc).lower()
+
+
+def stats() -> Dict[str, Any]:
+    """Counters for /db_stats and /ingest_stats."""
+    return {
+        "raw_pool": pool.stats(),
+        "engine_pool": {
+            "size": engine.pool.size(),
+            "checked_out": engine.pool.checkedout(),
+            "overflow": engine.pool.overflow(),
+        },
+        "write_gate": write_gate.stats(),
+    }
+
+
+def get_conn() -> PooledConnection:
+    """
+    Return a configured sqlite3 connection (rows as sqlite3.Row) from the pool.
+    Caller must close() it, which hands it back for reuse; uncommitted work
+    is rolled back at that point.
+    """
+    return pool.acquire()
+
 # convenience for scripts
 def init_db_schema():
     """
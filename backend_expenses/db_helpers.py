@@ -1,20 +1,33 @@
 # backend_expenses/db_helpers.py
 import sqlite3
+from typing import Iterable, List, Optional
+from .bulk_writer import BulkWriter, DEFAULT_BATCH_SIZE, write_records
+from .writer import writer
 from .utils_datetime_amount import normalize_tx_datetime, normalize_amount
 
-def insert_expense(conn: sqlite3.Connection, record: dict):
-    tx = normalize_tx_datetime(record.get("tx_datetime"))
-    amt = normalize_amount(record.get("total_amount"))
-    exp_type = record.get("exp_type") or None
-    note = record.get("note") or None
-    source = record.get("source") or None
-    txn_id = record.get("txn_id") or None
 
-    sql = """
-    INSERT INTO expenses (tx_datetime, exp_type, total_amount, note, source, txn_id)
-    VALUES (?, ?, ?, ?, ?, ?)
+def _normalize_record(record: dict) -> dict:
+    return {
+        "tx_datetime": normalize_tx_datetime(record.get("tx_datetime")),
+        "exp_type": record.get("exp_type") or None,
+        "total_amount": normalize_amount(record.get("total_amount")),
+        "note": record.get("note") or None,
+        "source": record.get("source") or None,
+        "txn_id": record.get("txn_id") or None,
+        "items": record.get("items") or [],
+    }
+
+
+def insert_expenses(conn: Optional[sqlite3.Connection], records: Iterable[dict],
+                    batch_size: int = DEFAULT_BATCH_SIZE) -> List[int]:
+    """
+    Normalize and bulk-insert records (executemany per batch) through the
+    writer queue; returns the new ids once committed. conn is not used: the
+    rows are written on the writer's connection (kept for existing callers).
     """
-    cur = conn.cursor()
-    cur.execute(sql, (tx, exp_type, amt, note, source, txn_id))
-    conn.commit()
-    return cur.lastrowid
+    normalized = [_normalize_record(r) for r in records]
+    return writer.submit(write_records, BulkWriter(None, batch_size=batch_size), normalized).result()
+
+
+def insert_expense(conn: Optional[sqlite3.Connection], record: dict):
+    return insert_expenses(conn, [record])[0]
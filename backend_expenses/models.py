@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, text
 from sqlalchemy.orm import relationship, declarative_base
 from pydantic import BaseModel
 from datetime import datetime
@@ -9,13 +9,20 @@ Base = declarative_base()
 class Expense(Base):
     __tablename__ = "expenses"
     id = Column(Integer, primary_key=True, index=True)
-    tx_datetime = Column(DateTime, default=datetime.utcnow)
+    tx_datetime = Column(DateTime, default=datetime.utcnow, index=True)
     exp_type = Column(String, index=True)   # groceries, wifi, etc.
     total_amount = Column(Float)
     note = Column(String, nullable=True)
 # inside Expense class in backend_expenses/models.py
     source = Column(String, nullable=True, index=True)
     txn_id = Column(String, nullable=True, index=True)
+    batch_id = Column(String, nullable=True, index=True)  # ingest import batch (see backend_ingest.jobs)
+    import_key = Column(String, nullable=True)  # txn_id or content hash, unique per source (see bulk_writer)
+
+    __table_args__ = (
+        Index("ux_expenses_source_import_key", "source", "import_key", unique=True,
+              sqlite_where=text("import_key IS NOT NULL")),
+    )
 
     items = relationship("ExpenseItem", back_populates="expense")
 
@@ -0,0 +1,182 @@
+# backend_expenses/periods.py
+"""
+Half-open date ranges for filtering expenses.tx_datetime.
+
+tx_datetime is stored as text ('YYYY-MM-DD HH:MM:SS[.ffffff]'; older ingest
+rows used a 'T' separator, see normalize_timestamp). Filtering with
+strftime('%Y', tx_datetime) = ... or substr(...) evaluates a function per row
+and cannot use ix_expenses_tx_datetime; comparing the raw column against
+date-only bounds can:
+
+    tx_datetime >= '2025-09-01' AND tx_datetime < '2025-10-01'
+
+Date-only bounds sort before any time on that day whatever the separator, so
+the ranges are exact for both timestamp forms.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple, Union
+
+from sqlalchemy import String, and_, type_coerce
+
+Bounds = Tuple[str, str]
+DateLike = Union[date, datetime, str]
+
+# raw sqlite3 predicate; bind the two values of a Bounds tuple
+RANGE_SQL = "tx_datetime >= ? AND tx_datetime < ?"
+
+# every dated expense (keyword totals "ever" / over the whole history)
+ALL_TIME: Bounds = ("0000-01-01", "9999-12-31")
+
+RELATIVE_PERIODS = ("today", "yesterday", "this week", "last week", "this month", "last month", "this year", "last year")
+
+
+def _day(value: DateLike) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def normalize_timestamp(value: Optional[str]) -> Optional[str]:
+    """'2025-09-01T10:00:00' -> '2025-09-01 10:00:00' (the form SQLAlchemy writes); other values unchanged."""
+    if isinstance(value, str) and len(value) > 10 and value[10] == "T" and value[4] == "-":
+        return value[:10] + " " + value[11:]
+    return value
+
+
+def day_range(start: DateLike, end: DateLike) -> Bounds:
+    """Bounds covering the days start..end inclusive."""
+    return _day(start).isoformat(), (_day(end) + timedelta(days=1)).isoformat()
+
+
+def add_months(year: int, month: int, delta: int) -> Tuple[int, int]:
+    idx = year * 12 + (month - 1) + delta
+    return idx // 12, idx % 12 + 1
+
+
+def month_range(year: int, month: int) -> Bounds:
+    ny, nm = add_months(year, month, 1)
+    return f"{year:04d}-{month:02d}-01", f"{ny:04d}-{nm:02d}-01"
+
+
+def months_range(start: Tuple[int, int], end: Tuple[int, int]) -> Bounds:
+    """Bounds covering the months start..end inclusive, each given as (year, month)."""
+    ny, nm = add_months(end[0], end[1], 1)
+    return f"{start[0]:04d}-{start[1]:02d}-01", f"{ny:04d}-{nm:02d}-01"
+
+
+def year_range(year: int) -> Bounds:
+    return f"{year:04d}-01-01", f"{year + 1:04d}-01-01"
+
+
+def relative_range(name: str, today: Optional[date] = None) -> Bounds:
+    """Bounds for one of RELATIVE_PERIODS ('this month', 'yesterday', ...) relative to today."""
+    today = today or date.today()
+    if name == "today":
+        return day_range(today, today)
+    if name == "yesterday":
+        d = today - timedelta(days=1)
+        return day_range(d, d)
+    if name in ("this week", "last week"):
+        monday = today - timedelta(days=today.weekday())
+        if name == "last week":
+            monday -= timedelta(days=7)
+        return day_range(monday, monday + timedelta(days=6))
+    if name == "this month":
+        return month_range(today.year, today.month)
+    if name == "last month":
+        return month_range(*add_months(today.year, today.month, -1))
+    if name == "this year":
+        return year_range(today.year)
+    if name == "last year":
+        return year_range(today.year - 1)
+    raise ValueError(f"unknown period {name!r}; expected one of {RELATIVE_PERIODS}")
+
+
+def tx_in_range(column, bounds: Bounds):
+    """
+    SQLAlchemy filter for column in [start, end). The column is compared as
+    text (its DateTime type would only accept datetime binds).
+    """
+    col = type_coerce(column, String)
+    return and_(col >= bounds[0], col < bounds[1])
+
+
+# --- bucketing for range reports ---
+GRANULARITIES = ("day", "week", "month", "quarter", "year")
+
+
+def parse_period(value: str, end: bool = False) -> date:
+    """
+    'YYYY', 'YYYY-MM' or 'YYYY-MM-DD' -> the first day of that period, or the
+    last day when end=True. Raises ValueError for anything else.
+    """
+    value = value.strip()
+    if len(value) == 4:
+        y = int(value)
+        return date(y, 12, 31) if end else date(y, 1, 1)
+    if len(value) == 7 and value[4] == "-":
+        y, m = int(value[:4]), int(value[5:7])
+        if not end:
+            return date(y, m, 1)
+        ny, nm = add_months(y, m, 1)
+        return date(ny, nm, 1) - timedelta(days=1)
+    return date.fromisoformat(value)
+
+
+def bucket_start(d: date, granularity: str) -> date:
+    """First day of the day/week (Monday)/month/quarter/year bucket containing d."""
+    if granularity == "day":
+        return d
+    if granularity == "week":
+        return d - timedelta(days=d.weekday())
+    if granularity == "month":
+        return d.replace(day=1)
+    if granularity == "quarter":
+        return date(d.year, (d.month - 1) // 3 * 3 + 1, 1)
+    if granularity == "year":
+        return date(d.year, 1, 1)
+    raise ValueError(f"granularity must be one of {GRANULARITIES}")
+
+
+def next_bucket(start: date, granularity: str) -> date:
+    if granularity == "day":
+        return start + timedelta(days=1)
+    if granularity == "week":
+        return start + timedelta(days=7)
+    step = {"month": 1, "quarter": 3, "year": 12}[granularity]
+    y, m = add_months(start.year, start.month, step)
+    return date(y, m, 1)
+
+
+def bucket_count(first: date, last: date, granularity: str) -> int:
+    """Number of buckets from bucket start first to bucket start last, inclusive (0 if last < first)."""
+    if granularity == "day":
+        n = (last - first).days
+    elif granularity == "week":
+        n = (last - first).days // 7
+    else:
+        months = (last.year - first.year) * 12 + last.month - first.month
+        n = months // {"month": 1, "quarter": 3, "year": 12}[granularity]
+    return max(n + 1, 0)
+
+
+def year_earlier(start: date, granularity: str) -> date:
+    """Start of the matching bucket one year before (52 weeks for weekly buckets)."""
+    if granularity == "week":
+        return start - timedelta(weeks=52)
+    try:
+        return start.replace(year=start.year - 1)
+    except ValueError:  # 29 February
+        return start.replace(year=start.year - 1, day=28)
+
+
+def bucket_label(start: date, granularity: str) -> str:
+    if granularity in ("day", "week"):
+        return start.isoformat()
+    if granularity == "month":
+        return f"{start.year:04d}-{start.month:02d}"
+    if granularity == "quarter":
+        return f"{start.year:04d}-Q{(start.month - 1) // 3 + 1}"
+    return f"{start.year:04d}"
@@ -0,0 +1,136 @@
+# backend_expenses/result_cache.py
+"""
+In-process cache for aggregate query results, keyed by data version.
+
+data_version holds one counter, bumped once per write transaction rather
+than per row: the writer queue bumps it before committing a group in which
+some request changed rows (requests marked @preserves_results, which only
+write bookkeeping tables, don't count), and ORM sessions bump it on flush.
+rollups.rebuild and search.rebuild call bump() themselves so they also
+invalidate when run outside the writer. Writers that bypass both paths
+must call bump() in their own transaction. A result
+is cached under (kind, params, version), so once the counter moves on,
+older entries can never be returned. Each FastAPI process keeps its own
+cache and still sees the other's writes through the shared counter.
+
+    version = result_cache.version(conn)          # read BEFORE computing
+    report = result_cache.cached("report_monthly", (2025, 9), lambda: ..., version)
+
+Reading the version first matters: a write landing between the read and the
+query only makes the cached value newer than its key, never older.
+Cached values are shared between callers and must not be mutated.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# entries kept before the least recently used is evicted
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 512))
+
+TABLES = [
+    "CREATE TABLE IF NOT EXISTS data_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO data_version (id, version) VALUES (0, 0)",
+]
+BUMP_SQL = "UPDATE data_version SET version = version + 1 WHERE id = 0"
+# per-row triggers from older schemas; bumps now happen once per transaction
+DROP_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS trg_version_insert",
+    "DROP TRIGGER IF EXISTS trg_version_delete",
+    "DROP TRIGGER IF EXISTS trg_version_update",
+]
+VERSION_SQL = "SELECT version FROM data_version WHERE id = 0"
+
+
+def install(conn: sqlite3.Connection) -> None:
+    """Create data_version if missing and drop the old per-row triggers (caller commits)."""
+    for stmt in TABLES + DROP_TRIGGERS:
+        conn.execute(stmt)
+
+
+def bump(conn: sqlite3.Connection) -> None:
+    """Invalidate every cached result, in the caller's transaction."""
+    conn.execute(BUMP_SQL)
+
+
+def preserves_results(fn: Callable[..., T]) -> Callable[..., T]:
+    """Mark a writer request whose writes never change a cached result (no data_version bump)."""
+    fn.preserves_results = True
+    return fn
+
+
+def version(conn: sqlite3.Connection) -> int:
+    return conn.execute(VERSION_SQL).fetchone()[0]
+
+
+def session_version(db) -> int:
+    """version() for a SQLAlchemy Session (read in the session's own transaction)."""
+    return db.connection().exec_driver_sql(VERSION_SQL).scalar()
+
+
+class ResultCache:
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, Hashable, int], Any]" = OrderedDict()
+        self._version = -1  # highest version seen
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cached(self, kind: str, params: Hashable, compute: Callable[[], T], version: int) -> T:
+        """compute() for (kind, params) at this data version, from the cache when present."""
+        key = (kind, params, version)
+        with self._lock:
+            if version > self._version:
+                # every entry belongs to an older version and can no longer be hit
+                self.evictions += len(self._entries)
+                self._entries.clear()
+                self._version = version
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        value = compute()  # outside the lock; concurrent misses may compute twice
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = value
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "version": self._version,
+            }
+
+
+cache = ResultCache()
+
+
+def cached(kind: str, params: Hashable, compute: Callable[[], T], version: int) -> T:
+    return cache.cached(kind, params, compute, version)
+
+
+def stats() -> Dict[str, Any]:
+    return cache.stats()
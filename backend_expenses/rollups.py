@@ -0,0 +1,129 @@
+# backend_expenses/rollups.py
+"""
+Materialised per-day and per-month totals (rollup_daily / rollup_monthly).
+
+Both tables hold (period, exp_type) -> total, count and are kept current by
+SQLite triggers on expenses, so every write path (ingest BulkWriter, crud,
+cancel_import deletes, upsert updates) maintains them in the same
+transaction as the row change. Reports read O(days x categories) rollup rows
+instead of aggregating expenses.
+
+Rows without a tx_datetime are not counted (they fall in no period).
+
+Recovery / first install on an existing DB:
+    python -m backend_expenses.rollups --rebuild
+"""
+import argparse
+import sqlite3
+from typing import Dict, List, Tuple
+
+from sqlalchemy import column, table as sa_table
+
+from . import result_cache
+
+# (table, key column, length of the tx_datetime prefix that forms the key)
+_ROLLUPS: List[Tuple[str, str, int]] = [
+    ("rollup_daily", "day", 10),      # 'YYYY-MM-DD'
+    ("rollup_monthly", "ym", 7),      # 'YYYY-MM'
+]
+
+
+def _add_sql(table: str, key: str, width: int, row: str) -> str:
+    return (
+        f"INSERT INTO {table} ({key}, exp_type, total, count) "
+        f"VALUES (substr({row}.tx_datetime, 1, {width}), coalesce({row}.exp_type, 'misc'), "
+        f"coalesce({row}.total_amount, 0), 1) "
+        f"ON CONFLICT({key}, exp_type) DO UPDATE SET total = total + excluded.total, count = count + 1;"
+    )
+
+
+def _remove_sql(table: str, key: str, width: int, row: str) -> str:
+    where = f"{key} = substr({row}.tx_datetime, 1, {width}) AND exp_type = coalesce({row}.exp_type, 'misc')"
+    return (
+        f"UPDATE {table} SET total = total - coalesce({row}.total_amount, 0), count = count - 1 WHERE {where};"
+        f"DELETE FROM {table} WHERE {where} AND count <= 0;"
+    )
+
+
+def _trigger_sql() -> List[str]:
+    adds_new = "".join(_add_sql(t, k, w, "NEW") for t, k, w in _ROLLUPS)
+    removes_old = "".join(_remove_sql(t, k, w, "OLD") for t, k, w in _ROLLUPS)
+    cols = "tx_datetime, exp_type, total_amount"
+    return [
+        "CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON expenses "
+        f"WHEN NEW.tx_datetime IS NOT NULL BEGIN {adds_new} END",
+        "CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON expenses "
+        f"WHEN OLD.tx_datetime IS NOT NULL BEGIN {removes_old} END",
+        # an update is a removal of the old values plus an addition of the new ones
+        f"CREATE TRIGGER IF NOT EXISTS trg_rollup_update_old AFTER UPDATE OF {cols} ON expenses "
+        f"WHEN OLD.tx_datetime IS NOT NULL BEGIN {removes_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_rollup_update_new AFTER UPDATE OF {cols} ON expenses "
+        f"WHEN NEW.tx_datetime IS NOT NULL BEGIN {adds_new} END",
+    ]
+
+
+# query-only table clauses for SQLAlchemy sessions (DDL lives in TABLES below)
+daily = sa_table("rollup_daily", column("day"), column("exp_type"), column("total"), column("count"))
+monthly = sa_table("rollup_monthly", column("ym"), column("exp_type"), column("total"), column("count"))
+
+TABLES = [
+    f"CREATE TABLE IF NOT EXISTS {table} ("
+    f"{key} TEXT NOT NULL, exp_type TEXT NOT NULL, total FLOAT NOT NULL DEFAULT 0, "
+    f"count INTEGER NOT NULL DEFAULT 0, PRIMARY KEY ({key}, exp_type))"
+    for table, key, _ in _ROLLUPS
+]
+TRIGGERS = _trigger_sql()
+
+
+def rebuild(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Recompute both rollup tables from expenses (caller commits). Returns rows per table."""
+    result_cache.bump(conn)  # reports cached from the old rows
+    counts = {}
+    for table, key, width in _ROLLUPS:
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            f"INSERT INTO {table} ({key}, exp_type, total, count) "
+            f"SELECT substr(tx_datetime, 1, {width}), coalesce(exp_type, 'misc'), "
+            f"coalesce(SUM(total_amount), 0), COUNT(*) FROM expenses "
+            f"WHERE tx_datetime IS NOT NULL GROUP BY 1, 2"
+        )
+        counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    return counts
+
+
+def install(conn: sqlite3.Connection) -> bool:
+    """
+    Create the rollup tables and triggers if missing (caller commits). When
+    the triggers are new the tables are rebuilt from expenses, since rows
+    written before they existed were never counted. Returns True if rebuilt.
+    """
+    have = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_rollup_%'")
+    }
+    for stmt in TABLES + TRIGGERS:
+        conn.execute(stmt)
+    if len(have) < len(TRIGGERS):
+        rebuild(conn)
+        return True
+    return False
+
+
+def main() -> None:
+    from .schema import ensure_schema
+    from .writer import writer
+
+    parser = argparse.ArgumentParser(description="Maintain the report rollup tables.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute rollups from expenses")
+    args = parser.parse_args()
+
+    ensure_schema()
+    if not args.rebuild:
+        parser.print_help()
+        return
+    counts = writer.submit(rebuild).result()
+    writer.close()
+    print("Rebuilt " + ", ".join(f"{t}: {n} rows" for t, n in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# backend_expenses/schema.py
+"""
+Idempotent schema setup for finance.db.
+
+models.Base.metadata.create_all only creates missing tables; columns and
+indexes added after a database was first created are applied here with
+ALTER TABLE / CREATE ... IF NOT EXISTS. Both services call ensure_schema()
+at startup, so either one can be started first against an old DB file.
+"""
+import sqlite3
+import threading
+
+from . import bulk_writer, models, result_cache, rollups, search, vocab
+from .database import engine, get_conn, write_gate
+
+# (table, column, column DDL) added after the initial schema
+_COLUMNS = [
+    ("expenses", "batch_id", "VARCHAR"),
+    ("expenses", "import_key", "VARCHAR"),
+]
+
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_expenses_batch_id ON expenses (batch_id)",
+    # month/period range filters (backend_expenses.periods); id is the rowid, so this
+    # index is also (tx_datetime, id) for keyset pagination in crud.get_expenses_page
+    "CREATE INDEX IF NOT EXISTS ix_expenses_tx_datetime ON expenses (tx_datetime)",
+    # GET /expenses/ filtered by source / exp_type, newest first
+    "CREATE INDEX IF NOT EXISTS ix_expenses_source_datetime ON expenses (source, tx_datetime)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_type_datetime ON expenses (exp_type, tx_datetime)",
+    # amount-window lookups and (amount, date) sweeps in backend_ingest.dedupe
+    "CREATE INDEX IF NOT EXISTS ix_expenses_amount_datetime ON expenses (total_amount, tx_datetime)",
+    # idempotent re-imports (bulk_writer upsert mode); rows without a key are not constrained
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_expenses_source_import_key "
+    "ON expenses (source, import_key) WHERE import_key IS NOT NULL",
+]
+
+# one-off data fixes, each safe to re-run
+_BACKFILLS = [
+    # rows imported before import_key existed are keyed by their txn_id;
+    # OR IGNORE leaves the later copies of already-duplicated txn_ids unkeyed
+    "UPDATE OR IGNORE expenses SET import_key = txn_id "
+    "WHERE import_key IS NULL AND txn_id IS NOT NULL AND txn_id <> ''",
+]
+
+# (maintenance_state key, statement): full-table fixes run once per database;
+# writers normalise these values since, so re-running would only rescan
+_ONE_OFF_BACKFILLS = [
+    # one timestamp form ('YYYY-MM-DD HH:MM:SS') for ISO values written with a 'T' separator
+    ("backfill.timestamp_separator",
+     "UPDATE expenses SET tx_datetime = substr(tx_datetime, 1, 10) || ' ' || substr(tx_datetime, 12) "
+     "WHERE tx_datetime LIKE '____-__-__T%'"),
+]
+
+# helper tables that are not part of the ORM models
+_TABLES = [
+    # duplicate clusters found by backend_ingest.dedupe.find_in_db (cluster_id = smallest member id)
+    """CREATE TABLE IF NOT EXISTS duplicate_clusters (
+        expense_id INTEGER PRIMARY KEY,
+        cluster_id INTEGER NOT NULL,
+        reason TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_duplicate_clusters_cluster_id ON duplicate_clusters (cluster_id)",
+    # small key/value store for incremental jobs (e.g. last expense id scanned for duplicates)
+    "CREATE TABLE IF NOT EXISTS maintenance_state (key TEXT PRIMARY KEY, value TEXT)",
+]
+
+_lock = threading.Lock()
+_done = False
+
+
+def _existing_columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def upgrade(conn: sqlite3.Connection) -> None:
+    """Add missing columns / indexes / helper tables on an existing DB (safe to run repeatedly)."""
+    for table, column, ddl in _COLUMNS:
+        if column not in _existing_columns(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    for stmt in _INDEXES + _TABLES + _BACKFILLS:
+        conn.execute(stmt)
+    for key, stmt in _ONE_OFF_BACKFILLS:
+        if not conn.execute("SELECT 1 FROM maintenance_state WHERE key = ?", (key,)).fetchone():
+            conn.execute(stmt)
+            conn.execute("INSERT INTO maintenance_state (key, value) VALUES (?, '1')", (key,))
+    bulk_writer.rekey_content_hashes(conn)  # after the timestamp backfill above
+    result_cache.install(conn)  # first: rebuilds in the installs below bump data_version
+    rollups.install(conn)
+    search.install(conn)
+    vocab.install(conn)
+    conn.commit()
+
+
+def ensure_schema() -> None:
+    """Create tables and apply upgrades once per process."""
+    global _done
+    with _lock:
+        if _done:
+            return
+        with write_gate.hold():
+            models.Base.metadata.create_all(bind=engine)
+            conn = get_conn()
+            try:
+                upgrade(conn)
+            finally:
+                conn.close()
+        _done = True
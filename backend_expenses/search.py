@@ -0,0 +1,173 @@
+# backend_expenses/search.py
+"""
+Keyword search over expenses.note / exp_type / source.
+
+expenses_fts is an FTS5 index with the trigram tokenizer over those three
+columns (external content: the text stays in expenses, the index holds
+trigrams keyed by expenses.id). A quoted phrase MATCH on a trigram index is
+a case-insensitive substring search, i.e. the same rows as
+
+    lower(note) LIKE '%kw%' OR lower(exp_type) LIKE '%kw%' OR ...
+
+but answered from the index instead of a full scan with lower() per row.
+Triggers on expenses keep it in sync for every write path, like the rollups.
+
+The index wins when the date range is wide: its cost follows the number of
+matching rows in all of history, while the LIKE scan walks only the rows in
+the range (ix_expenses_tx_datetime). keyword_total therefore estimates the
+rows in range from the rollups and keeps the range scan for narrow ranges
+(up to RANGE_SCAN_MAX_ROWS): a single month of a personal ledger normally
+scans, while year / multi-year / all-history questions (chat "... this
+year", "... ever", /query_amount with start/end) go to the index. Trigrams need at least 3 characters; shorter
+keywords (and SQLite builds without FTS5) also use the LIKE scan.
+
+Recovery / first install on an existing DB:
+    python -m backend_expenses.search --rebuild
+"""
+import argparse
+import os
+import sqlite3
+from typing import Optional, Sequence, Tuple
+
+from . import result_cache
+from .periods import ALL_TIME, Bounds, RANGE_SQL
+
+COLUMNS = ("note", "exp_type", "source")
+# shortest keyword the trigram index can answer
+MIN_FTS_LENGTH = 3
+# ranges with at most this many rows are scanned with LIKE instead of using the index
+RANGE_SCAN_MAX_ROWS = int(os.environ.get("SEARCH_RANGE_SCAN_MAX_ROWS", 10_000))
+
+TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5("
+    "note, exp_type, source, content='expenses', content_rowid='id', tokenize='trigram')"
+)
+
+_NEW = "INSERT INTO expenses_fts (rowid, note, exp_type, source) VALUES (NEW.id, NEW.note, NEW.exp_type, NEW.source);"
+_OLD = (
+    "INSERT INTO expenses_fts (expenses_fts, rowid, note, exp_type, source) "
+    "VALUES ('delete', OLD.id, OLD.note, OLD.exp_type, OLD.source);"
+)
+TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON expenses BEGIN {_NEW} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON expenses BEGIN {_OLD} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE OF note, exp_type, source ON expenses "
+    f"BEGIN {_OLD} {_NEW} END",
+]
+
+# None until checked; False when this SQLite build has no FTS5 / trigram tokenizer
+_available: Optional[bool] = None
+
+
+def rebuild(conn: sqlite3.Connection) -> None:
+    """Re-index every expense (caller commits)."""
+    conn.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+    result_cache.bump(conn)  # keyword totals cached from the old index
+
+
+def install(conn: sqlite3.Connection) -> bool:
+    """
+    Create expenses_fts and its triggers if missing (caller commits); a new
+    index is built from the existing rows. Returns False when FTS5 with the
+    trigram tokenizer is not available, in which case searches use LIKE.
+    """
+    global _available
+    have = {
+        row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_fts_%'")
+    }
+    try:
+        conn.execute(TABLE)
+    except sqlite3.OperationalError:
+        _available = False
+        return False
+    for stmt in TRIGGERS:
+        conn.execute(stmt)
+    if len(have) < len(TRIGGERS):
+        rebuild(conn)
+    _available = True
+    return True
+
+
+def available(conn: sqlite3.Connection) -> bool:
+    global _available
+    if _available is None:
+        _available = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses_fts'"
+        ).fetchone() is not None
+    return _available
+
+
+def match_query(keyword: str, columns: Sequence[str] = COLUMNS) -> str:
+    """FTS5 query for keyword as a literal substring of any of columns."""
+    phrase = '"' + keyword.replace('"', '""') + '"'
+    if tuple(columns) == COLUMNS:
+        return phrase
+    return "{" + " ".join(columns) + "}: " + phrase
+
+
+def rows_in_range(conn: sqlite3.Connection, bounds: Bounds) -> int:
+    """Dated expenses in bounds, from rollup_monthly when bounds fall on month starts, else rollup_daily."""
+    start, end = bounds
+    if start.endswith("-01") and end.endswith("-01") or bounds == ALL_TIME:
+        row = conn.execute("SELECT SUM(count) FROM rollup_monthly WHERE ym >= ? AND ym < ?",
+                           (start[:7], end[:7])).fetchone()
+    else:
+        row = conn.execute("SELECT SUM(count) FROM rollup_daily WHERE day >= ? AND day < ?", bounds).fetchone()
+    return int(row[0] or 0)
+
+
+def uses_fts(conn: sqlite3.Connection, keyword: str, bounds: Bounds) -> bool:
+    return (
+        len(keyword) >= MIN_FTS_LENGTH
+        and available(conn)
+        and rows_in_range(conn, bounds) > RANGE_SCAN_MAX_ROWS
+    )
+
+
+def keyword_total(conn: sqlite3.Connection, keyword: str, bounds: Bounds,
+                  columns: Sequence[str] = COLUMNS) -> Tuple[float, int]:
+    """(SUM(total_amount), COUNT(*)) of expenses in bounds whose columns contain keyword (case-insensitive)."""
+    keyword = keyword.lower()
+    if uses_fts(conn, keyword, bounds):
+        row = conn.execute(
+            "SELECT SUM(e.total_amount), COUNT(*) FROM expenses_fts "
+            "JOIN expenses e ON e.id = expenses_fts.rowid "
+            "WHERE expenses_fts MATCH ? AND e.tx_datetime >= ? AND e.tx_datetime < ?",
+            (match_query(keyword, columns), *bounds),
+        ).fetchone()
+    else:
+        like = f"%{keyword}%"
+        cond = " OR ".join(f"lower(coalesce({c}, '')) LIKE ?" for c in columns)
+        row = conn.execute(
+            f"SELECT SUM(total_amount), COUNT(*) FROM expenses WHERE {RANGE_SQL} AND ({cond})",
+            (*bounds, *([like] * len(columns))),
+        ).fetchone()
+    return float(row[0] or 0.0), int(row[1] or 0)
+
+
+def main() -> None:
+    from .database import get_conn
+    from .schema import ensure_schema
+    from .writer import writer
+
+    parser = argparse.ArgumentParser(description="Maintain the expenses full-text index.")
+    parser.add_argument("--rebuild", action="store_true", help="re-index all expenses")
+    args = parser.parse_args()
+
+    ensure_schema()
+    if not args.rebuild:
+        parser.print_help()
+        return
+    conn = get_conn()
+    try:
+        if not available(conn):
+            raise SystemExit("expenses_fts is not available (SQLite built without FTS5 trigram support)")
+    finally:
+        conn.close()
+    writer.submit(rebuild).result()
+    writer.close()
+    print("Rebuilt expenses_fts")
+
+
+if __name__ == "__main__":
+    main()
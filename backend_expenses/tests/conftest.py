@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture
+def conn():
+    """Pooled sqlite3 connection to the test database, closed after the test."""
+    from backend_expenses.database import get_conn
+    c = get_conn()
+    yield c
+    c.close()
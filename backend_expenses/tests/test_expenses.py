@@ -21,3 +21,447 @@ def test_add_expense():
     r = client.post("/expenses/", json=payload)
     assert r.status_code == 200
     assert r.json()["exp_type"] == "groceries"
+
+def test_bulk_writer_assigns_item_fks_per_batch():
+    from backend_expenses import models
+    from backend_expenses.bulk_writer import BulkWriter
+    from sqlalchemy import create_engine
+
+    eng = create_engine("sqlite://")
+    conn = eng.raw_connection().driver_connection
+    models.Base.metadata.create_all(bind=eng)
+    conn.execute("INSERT INTO expenses (id, exp_type, total_amount) VALUES (7, 'misc', 1.0)")
+    writer = BulkWriter(conn, batch_size=2)
+    ids = writer.add_many(
+        {"exp_type": "groceries", "total_amount": float(i), "items": [{"quantity": 1, "amount": i}]}
+        for i in range(5)
+    )
+    ids += writer.flush()
+    conn.commit()
+    assert ids == [8, 9, 10, 11, 12]
+    rows = conn.execute("SELECT expense_id, amount FROM expense_items ORDER BY expense_id").fetchall()
+    assert rows == [(8, 0.0), (9, 1.0), (10, 2.0), (11, 3.0), (12, 4.0)]
+    assert writer.stats()["rows"] == 5 and writer.stats()["batches"] == 3
+
+def test_monthly_report_uses_half_open_range_for_mixed_timestamps(add_expenses):
+    from backend_expenses.periods import month_range, relative_range
+    from datetime import date
+
+    assert month_range(2016, 12) == ("2016-12-01", "2017-01-01")
+    assert relative_range("last month", date(2017, 1, 15)) == ("2016-12-01", "2017-01-01")
+
+    add_expenses(*(
+        {"tx_datetime": tx, "exp_type": "range-test", "total_amount": amount}
+        for tx, amount in [("2016-11-30 23:59:59", 1.0), ("2016-12-01", 2.0), ("2016-12-01T08:00:00", 4.0),
+                           ("2016-12-31 23:59:59.5", 8.0), ("2017-01-01 00:00:00", 16.0)]
+    ))
+    rep = client.get("/reports/monthly?year=2016&month=12").json()
+    assert {r["exp_type"]: r["total"] for r in rep["by_category"]}["range-test"] == 14.0
+
+def test_compare_months_is_one_rollup_query(add_expenses):
+    from sqlalchemy import event
+    from backend_expenses.database import engine
+
+    add_expenses(*(
+        {"tx_datetime": tx, "exp_type": exp_type, "total_amount": amount}
+        for tx, exp_type, amount in [("2015-03-02 10:00:00", "cmp-a", 5.0), ("2015-03-02 11:00:00", "cmp-b", 1.0),
+                                     ("2015-03-09 10:00:00", "cmp-a", 2.0), ("2015-04-01 10:00:00", "cmp-a", 3.0)]
+    ))
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        res = client.get("/reports/compare?y1=2015&m1=3&y2=2015&m2=4").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert not [s for s in statements if "FROM expenses" in s]
+    assert len([s for s in statements if "FROM rollup_daily" in s]) == 1
+    assert res["month1"]["by_day"] == [{"day": "02", "total": 6.0}, {"day": "09", "total": 2.0}]
+    assert res["month1"]["total"] == 8.0
+    assert {d["exp_type"]: d["diff"] for d in res["diff_by_category"]} == {"cmp-a": -4.0, "cmp-b": -1.0}
+    assert client.get("/reports/months?months=2015-04&months=2015-03").json()[0]["total"] == 3.0
+    for bad in ("2015-13", "2015-00", "2015-4", "2015", "abcd-ef"):
+        assert client.get(f"/reports/months?months=2015-04&months={bad}").status_code == 400, bad
+
+def test_rollups_follow_inserts_updates_and_deletes(conn, add_expenses):
+    from backend_expenses import result_cache, rollups
+
+    def rollup(conn):
+        return {r[0]: tuple(r[1:]) for r in conn.execute(
+            "SELECT day, total, count FROM rollup_daily WHERE exp_type = 'rollup-test' ORDER BY day")}
+
+    ids = add_expenses(*(
+        {"tx_datetime": tx, "exp_type": "rollup-test", "total_amount": amount}
+        for tx, amount in [("2014-05-01 09:00:00", 10.0), ("2014-05-01 18:00:00", 5.0), ("2014-05-02", 1.0)]
+    ))
+    assert rollup(conn) == {"2014-05-01": (15.0, 2), "2014-05-02": (1.0, 1)}
+
+    conn.execute("UPDATE expenses SET tx_datetime = '2014-05-02 12:00:00', total_amount = 7 WHERE id = ?", (ids[1],))
+    conn.execute("DELETE FROM expenses WHERE id = ?", (ids[0],))
+    conn.commit()
+    assert rollup(conn) == {"2014-05-02": (8.0, 2)}
+    monthly = conn.execute("SELECT total, count FROM rollup_monthly WHERE ym = '2014-05' AND exp_type = 'rollup-test'")
+    assert tuple(monthly.fetchone()) == (8.0, 2)
+
+    before, version = rollup(conn), result_cache.version(conn)
+    rollups.rebuild(conn)
+    conn.commit()
+    assert rollup(conn) == before
+    assert result_cache.version(conn) > version  # results cached from the old rollups are dropped
+
+def test_reports_range_dense_series_with_deltas(add_expenses):
+    add_expenses(*(
+        {"tx_datetime": tx, "exp_type": "range-series", "total_amount": amount}
+        for tx, amount in [("2012-02-10 10:00:00", 50.0), ("2013-01-05 10:00:00", 10.0), ("2013-03-20 10:00:00", 40.0)]
+    ))
+
+    rep = client.get("/reports/range?start=2013-01&end=2013-03&granularity=month").json()
+    assert rep["periods"] == ["2013-01", "2013-02", "2013-03"]
+    s = next(x for x in rep["series"] if x["exp_type"] == "range-series")
+    assert s["totals"] == [10.0, 0.0, 40.0]
+    assert s["change"] == [10.0, -10.0, 40.0]
+    assert s["yoy"] == [10.0, -50.0, 40.0]
+    assert s["yoy_pct"] == [None, -100.0, None]
+
+    q = client.get("/reports/range?start=2013&end=2013&granularity=quarter").json()
+    assert q["periods"] == ["2013-Q1", "2013-Q2", "2013-Q3", "2013-Q4"]
+    assert client.get("/reports/range?start=2013&end=2013&granularity=fortnight").status_code == 400
+    too_wide = client.get("/reports/range?start=1000-01-01&end=9999-12-31&granularity=day")
+    assert too_wide.status_code == 400 and "more than" in too_wide.json()["detail"]
+    assert client.get("/reports/range?start=1931&end=2013&granularity=month").status_code == 200  # 996 buckets
+
+def test_list_expenses_keyset_pages_are_stable(add_expenses):
+    add_expenses(*(
+        {"tx_datetime": tx, "exp_type": "misc", "total_amount": amount, "source": "page-src"}
+        for tx, amount in [("2011-01-0%d 10:00:00" % (i % 3 + 1), float(i)) for i in range(7)] + [(None, 99.0)]
+    ))
+
+    seen, cursor = [], None
+    while True:
+        params = {"source": "page-src", "limit": 3, **({"cursor": cursor} if cursor else {})}
+        r = client.get("/expenses/", params=params)
+        assert r.status_code == 200
+        seen += [(e["tx_datetime"], e["id"]) for e in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert len(seen) == 8 and len(set(seen)) == 8
+    dated = [s for s in seen if s[0]]
+    assert dated == sorted(dated, reverse=True) and seen[-1][0] is None
+
+    r = client.get("/expenses/", params={"source": "page-src", "start": "2011-01-02", "end": "2011-01-02", "min_amount": 4})
+    assert [e["total_amount"] for e in r.json()] == [4.0]
+    assert client.get("/expenses/", params={"cursor": "not-a-cursor"}).status_code == 400
+
+def test_list_expenses_projection_and_items(conn, add_expenses):
+    [expense_id] = add_expenses(
+        {"tx_datetime": "2010-06-01 09:30:00", "exp_type": "misc", "total_amount": 3.5, "source": "proj-src"})
+    conn.executemany("INSERT INTO expense_items (expense_id, quantity, amount) VALUES (?, ?, ?)",
+                     [(expense_id, 1, 1.5), (expense_id, 2, 1.0)])
+    conn.commit()
+
+    full = client.get("/expenses/", params={"source": "proj-src"}).json()
+    assert full[0]["tx_datetime"] == "2010-06-01T09:30:00" and "note" in full[0] and "items" not in full[0]
+
+    r = client.get("/expenses/", params={"source": "proj-src", "fields": "id,total_amount", "include_items": "true"})
+    assert r.json() == [{"id": expense_id, "total_amount": 3.5,
+                         "items": [{"quantity": 1.0, "amount": 1.5}, {"quantity": 2.0, "amount": 1.0}]}]
+    assert client.get("/expenses/", params={"fields": "id,password"}).status_code == 400
+
+def test_bulk_create_reports_invalid_items_and_inserts_the_rest(conn):
+    payload = [
+        {"tx_datetime": "2009-01-01T10:00:00", "exp_type": "bulk-test", "total_amount": 5,
+         "items": [{"quantity": 1, "amount": 5}]},
+        {"tx_datetime": "not a date", "exp_type": "bulk-test", "total_amount": 1},
+        {"tx_datetime": "2009-01-02T10:00:00", "exp_type": "bulk-test", "total_amount": 7, "note": "n"},
+    ]
+    r = client.post("/expenses/bulk", json=payload)
+    assert r.status_code == 200
+    body = r.json()
+    assert body["inserted"] == 2
+    assert [x["index"] for x in body["results"]] == [0, 2]
+    assert [e["index"] for e in body["errors"]] == [1]
+    assert body["errors"][0]["errors"][0]["loc"] == ["tx_datetime"]
+
+    # ids come back in input order (one queued BulkWriter request, not INSERT ... RETURNING)
+    first, second = (x["id"] for x in body["results"])
+    assert first < second
+    amounts = dict(conn.execute("SELECT id, total_amount FROM expenses WHERE id IN (?, ?)", (first, second)).fetchall())
+    assert amounts == {first: 5.0, second: 7.0}
+    assert conn.execute("SELECT COUNT(*) FROM expense_items WHERE expense_id = ?", (first,)).fetchone()[0] == 1
+
+def test_get_conn_reuses_configured_connections():
+    from backend_expenses.database import ConnectionPool
+
+    pool = ConnectionPool(size=1)
+    conn = pool.acquire()
+    raw = conn._conn
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+    conn.execute("BEGIN")
+    conn.execute("INSERT INTO expenses (exp_type, total_amount) VALUES ('pool-test', 1)")
+    conn.close()
+    conn.close()  # idempotent
+
+    again = pool.acquire()
+    assert again._conn is raw and not again.in_transaction
+    assert again.execute("SELECT COUNT(*) FROM expenses WHERE exp_type = 'pool-test'").fetchone()[0] == 0
+    other = pool.acquire()  # pool empty: opens a second connection
+    assert other._conn is not raw
+    again.close()
+    other.close()  # over size: closed instead of kept
+    assert pool.stats() == {"size": 1, "idle": 1, "opened": 2, "reused": 1}
+    pool.close_all()
+
+def test_engine_pragmas_match_the_raw_pool():
+    from sqlalchemy import text
+    from backend_expenses import database
+
+    with database.engine.connect() as c:
+        assert c.execute(text("PRAGMA busy_timeout")).scalar() == database.BUSY_TIMEOUT_MS
+        assert c.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+    assert client.get("/db_stats").json()["write_gate"]["acquired"] > 0
+
+def test_writer_groups_commits_and_isolates_failures(conn):
+    import asyncio
+    import threading
+    from backend_expenses.writer import WriterService
+
+    svc = WriterService(max_batch=64, max_wait_ms=50)
+    hold = threading.Event()
+    # park the writer thread so the following submits queue up behind it
+    first = svc.submit(lambda conn: hold.wait(5))
+
+    def add(conn, n):
+        conn.execute("INSERT INTO expenses (exp_type, total_amount) VALUES ('writer-test', ?)", (n,))
+        if n == 3:
+            raise ValueError("bad row")
+        return n
+
+    futures = [svc.submit(add, n) for n in range(6)]
+    hold.set()
+    assert first.result(5) is True
+    assert [f.exception(5) is not None for f in futures] == [n == 3 for n in range(6)]
+    assert asyncio.run(svc.run(add, 10)) == 10
+    svc.close()
+
+    amounts = [r[0] for r in conn.execute("SELECT total_amount FROM expenses WHERE exp_type = 'writer-test' ORDER BY 1")]
+    assert amounts == [0, 1, 2, 4, 5, 10]
+    stats = svc.stats()
+    assert stats["requests"] == 8 and stats["failed"] == 1
+    assert stats["groups"] < stats["requests"]
+
+def test_bulk_writer_state_follows_rolled_back_requests(conn):
+    from backend_expenses.bulk_writer import UPSERT, BulkWriter, write_records
+    from backend_expenses.writer import WriterService
+
+    svc = WriterService()
+    bw = BulkWriter(None, mode=UPSERT)
+    records = [{"tx_datetime": "2008-01-01 10:00:00", "exp_type": "misc", "total_amount": 2.0,
+                "note": "rollback-test", "source": "rb-src"}] * 2
+
+    def write_then_fail(c, writer, recs):
+        write_records(c, writer, recs)
+        raise ValueError("later step failed")
+
+    assert isinstance(svc.submit(write_then_fail, bw, records).exception(5), ValueError)
+    assert bw.stats()["rows"] == 0 and bw.stats()["inserted"] == 0
+    assert len(svc.submit(write_records, bw, records).result(5)) == 2
+    svc.close()
+    keys = [r[0] for r in conn.execute("SELECT import_key FROM expenses WHERE source = 'rb-src' ORDER BY id")]
+    assert len(keys) == 2 and keys[1] == keys[0] + "#1"  # not "#2" / "#3" from the failed attempt
+    assert bw.stats()["inserted"] == 2
+
+def test_content_keys_ignore_the_timestamp_separator(conn, add_expenses):
+    from backend_expenses import bulk_writer
+
+    rec = {"tx_datetime": "2007-03-04T10:00:00", "total_amount": 12.5, "note": "rekey-test "}
+    new_key = bulk_writer.content_key(rec)
+    assert new_key == bulk_writer.content_key({**rec, "tx_datetime": "2007-03-04 10:00:00"})
+    # a key stored before the normalisation: hashed from the 'T' form, row since rewritten with a space
+    old_key = bulk_writer._content_key(rec["tx_datetime"], 12.5, "rekey-test")
+    add_expenses(*(
+        {"tx_datetime": "2007-03-04 10:00:00", "exp_type": "misc", "total_amount": 12.5,
+         "note": "rekey-test", "source": "rekey-src", "import_key": key}
+        for key in (old_key, old_key + "#1", "h:unrelated")
+    ))
+    conn.execute("DELETE FROM maintenance_state WHERE key = ?", (bulk_writer.REKEY_STATE_KEY,))
+    assert bulk_writer.rekey_content_hashes(conn) == 2
+    assert bulk_writer.rekey_content_hashes(conn) == 0  # once per database
+    conn.commit()
+    keys = [r[0] for r in conn.execute("SELECT import_key FROM expenses WHERE source = 'rekey-src' ORDER BY id")]
+    assert keys == [new_key, new_key + "#1", "h:unrelated"]
+
+def test_timestamp_separator_backfill_runs_once_per_database(conn, add_expenses):
+    from backend_expenses import schema
+
+    (expense_id,) = add_expenses({"tx_datetime": "2006-05-06T07:08:09", "exp_type": "misc", "total_amount": 1})
+    tx = lambda: conn.execute("SELECT tx_datetime FROM expenses WHERE id = ?", (expense_id,)).fetchone()[0]
+    schema.upgrade(conn)
+    assert tx() == "2006-05-06T07:08:09"  # already recorded in maintenance_state: no rescan on boot
+    conn.execute("DELETE FROM maintenance_state WHERE key = 'backfill.timestamp_separator'")
+    schema.upgrade(conn)
+    assert tx() == "2006-05-06 07:08:09"
+
+def test_keyword_search_index_matches_like_scan(monkeypatch, conn, add_expenses):
+    from backend_expenses import result_cache, search
+    from backend_expenses.periods import month_range
+
+    add_expenses(*(
+        {"tx_datetime": tx, "exp_type": exp_type, "total_amount": amount, "note": note, "source": source}
+        for tx, exp_type, amount, note, source in [
+            ("2019-03-02 09:00:00", "dining", 4.5, "Blue Tokai COFFEE", "hdfc"),
+            ("2019-03-05 09:00:00", "misc", 2.0, None, "coffeebank"),
+            ("2019-03-09 09:00:00", "misc", 7.0, "tea", "sbi"),
+            ("2019-04-01 00:00:00", "dining", 9.0, "coffee", "sbi")]
+    ))
+    conn.execute("UPDATE expenses SET note = 'iced coffee' WHERE note = 'tea' AND tx_datetime LIKE '2019-03%'")
+    conn.execute("DELETE FROM expenses WHERE source = 'coffeebank'")
+    conn.commit()
+
+    march = month_range(2019, 3)
+    monkeypatch.setattr(search, "RANGE_SCAN_MAX_ROWS", -1)  # always use the index
+    assert search.uses_fts(conn, "coffee", march)
+    indexed = [search.keyword_total(conn, kw, march) for kw in ("coffee", "COF", "okai c", "hdfc", "xyz")]
+    monkeypatch.setattr(search, "RANGE_SCAN_MAX_ROWS", 10**9)  # always scan
+    assert not search.uses_fts(conn, "coffee", march)
+    scanned = [search.keyword_total(conn, kw, march) for kw in ("coffee", "COF", "okai c", "hdfc", "xyz")]
+    assert indexed == scanned == [(11.5, 2), (11.5, 2), (4.5, 1), (4.5, 1), (0.0, 0)]
+
+    version = result_cache.version(conn)
+    search.rebuild(conn)
+    conn.commit()
+    assert result_cache.version(conn) > version
+
+def test_keyword_vocab_counts_follow_inserts_updates_and_deletes(conn, add_expenses):
+    from backend_expenses import vocab
+
+    def counts():
+        return dict(conn.execute("SELECT token, doc_count FROM keyword_vocab WHERE token LIKE 'vocabt%'").fetchall())
+
+    vocab.sync_now()
+    add_expenses(*(
+        {"exp_type": "misc", "total_amount": 1, "note": note, "source": "vocabtsrc"}
+        for note in ("vocabtone vocabtone 42", "vocabtone vocabttwo")
+    ))
+    assert vocab.sync_now()["new_rows"] == 2
+    assert counts() == {"vocabtone": 2, "vocabttwo": 1, "vocabtsrc": 2}
+
+    conn.execute("UPDATE expenses SET note = 'vocabtthree' WHERE note = 'vocabtone vocabttwo'")
+    conn.execute("DELETE FROM expenses WHERE note = 'vocabtone vocabtone 42'")
+    conn.commit()
+    stats = vocab.sync_now()
+    assert stats["new_rows"] == 0 and stats["changes"] == 3
+    assert counts() == {"vocabtthree": 1, "vocabtsrc": 1}
+
+def test_chat_planner_plans_and_executes_against_rollups(monkeypatch, conn, add_expenses):
+    from datetime import date
+    from backend_expenses import chat_planner, search, vocab
+    from backend_expenses.periods import ALL_TIME
+
+    tokens = ["coffee", "starbucks", "uber"]
+    keyword_cache = vocab._KeywordCache(ttl=float("inf"))
+    monkeypatch.setattr(keyword_cache, "_read", lambda: vocab.KeywordMatcher(tokens))
+    monkeypatch.setattr(vocab, "_KEYWORD_CACHE", keyword_cache)
+    monkeypatch.setattr(vocab, "sync_now", lambda: None)
+    today = date(2018, 6, 14)
+    p = chat_planner.plan("How much did I spend on Coffee at Starbucks last month?", today)
+    assert p == chat_planner.Plan("sum", "coffee", None, "2018-05-01", "2018-06-01", "last month")
+    assert chat_planner.plan("how much  did i spend on coffee at starbucks last month", today) is p  # cached
+    assert chat_planner.plan("transactions above ₹1,500 in may 2018", today).threshold == 1500.0
+    assert chat_planner.plan("category summary for 2018-05", today)[::3] == ("category_summary", "2018-05-01")
+    assert chat_planner.plan("hello there", today).intent is None
+    assert chat_planner.plan("How much have I spent this month?", today).term is None
+    assert chat_planner.plan("airport starbucks last month", today).term == "starbucks"  # known keyword wins
+    assert chat_planner.plan("how much did i spend at the zzqx today", today).term == "zzqx"
+    # not spending questions: no spend verb, or a short form without a known keyword
+    for text in ("hello total", "last month", "zzqx last month", "what's my total this week", "spent it all",
+                 "anything over 10000 last year", "top 3 merchants", "by category"):
+        assert chat_planner.plan(text, today).intent is None, text
+
+    # a refresh with the same tokens keeps the cached plans; new tokens start new keys
+    generation = vocab.keywords_generation()
+    keyword_cache._refresh()
+    assert vocab.keywords_generation() == generation
+    assert chat_planner.plan("How much did I spend on Coffee at Starbucks last month?", today) is p
+    assert chat_planner.plan("airportlounge starbucks last month", today).term == "starbucks"
+    tokens.append("airportlounge")
+    keyword_cache._refresh()
+    assert vocab.keywords_generation() == generation + 1
+    assert chat_planner.plan("airportlounge starbucks last month", today).term == "airportlounge"
+
+    add_expenses(*(
+        {"tx_datetime": tx, "exp_type": exp_type, "total_amount": amount, "note": note, "source": source}
+        for tx, exp_type, amount, note, source in [
+            ("2018-05-02 09:00:00", "dining", 4.5, "coffee", "hdfc"),
+            ("2018-05-20 09:00:00", "travel", 1800.0, "flight", "hdfc"),
+            ("2018-05-31 23:00:00", "dining", 5.5, "Coffee beans", "sbi"),
+            ("2018-06-01 00:00:00", "dining", 9.0, "coffee", "sbi")]
+    ))
+    results = {
+        text: chat_planner.execute(conn, chat_planner.plan(text, today))
+        for text in ("coffee last month", "total spend in may 2018", "category summary last month",
+                     "transactions above 1,500 last month")
+    }
+    assert results["coffee last month"] == {"total": 10.0, "count": 2}
+    assert results["total spend in may 2018"] == {"total": 1810.0, "count": 3}
+    assert results["category summary last month"]["rows"] == [
+        {"exp_type": "travel", "total": 1800.0, "count": 1}, {"exp_type": "dining", "total": 10.0, "count": 2}]
+    assert [r["note"] for r in results["transactions above 1,500 last month"]["rows"]] == ["flight"]
+
+    ever = chat_planner.plan("How much have I ever spent on coffee beans?", today)
+    assert (ever.term, (ever.start, ever.end)) == ("coffee beans", ALL_TIME)
+    monkeypatch.setattr(search, "RANGE_SCAN_MAX_ROWS", 0)  # any non-empty history is "wide"
+    assert search.uses_fts(conn, ever.term, ALL_TIME)
+    assert chat_planner.execute(conn, ever) == {"total": 5.5, "count": 1}
+
+def test_result_cache_follows_data_version_and_evicts_lru(conn):
+    from backend_expenses import result_cache, vocab
+    from backend_expenses.writer import writer
+
+    r = client.get("/reports/monthly", params={"year": 2017, "month": 2})
+    before = result_cache.stats()
+    assert client.get("/reports/monthly", params={"year": 2017, "month": 2}).json() == r.json()
+    assert result_cache.stats()["hits"] == before["hits"] + 1
+
+    def write(c):
+        c.execute("INSERT INTO expenses (tx_datetime, exp_type, total_amount) VALUES ('2017-02-03 10:00:00', 'misc', 7)")
+        c.execute("UPDATE expenses SET total_amount = 8 WHERE tx_datetime = '2017-02-03 10:00:00'")
+
+    v0 = result_cache.version(conn)
+    vocab.sync_now()  # bookkeeping-only request: cached results stay valid
+    assert result_cache.version(conn) == v0
+    writer.submit(write).result()
+    assert result_cache.version(conn) == v0 + 1  # once per committed write, not per row
+    assert client.get("/reports/monthly", params={"year": 2017, "month": 2}).json()["total"] == r.json()["total"] + 8
+
+    lru = result_cache.ResultCache(maxsize=2)
+    for key in ("a", "b", "a", "c"):
+        lru.cached("k", key, lambda: key.upper(), version=1)
+    assert lru.cached("k", "a", lambda: "recomputed", version=1) == "A"  # "b" was least recent
+    assert lru.cached("k", "b", lambda: "recomputed", version=1) == "recomputed"
+    assert lru.cached("k", "a", lambda: "new", version=2) == "new"
+    assert lru.stats()["hits"] == 2 and lru.stats()["size"] == 1
+
+def test_chat_router_answers_month_totals_and_falls_back():
+    from datetime import date
+    from fastapi import FastAPI
+    from backend_expenses import chat
+
+    router_app = FastAPI()
+    router_app.include_router(chat.router)
+    chat_client = TestClient(router_app)
+    today = date.today()
+    r = chat_client.post("/api/v1/chat", json={"message": "How much did I spend this month?"})
+    assert r.status_code == 200
+    assert r.json()["reply"].startswith("Your total spend this month is")
+    data = r.json()["data"]
+    assert data["start"] == f"{today.year:04d}-{today.month:02d}-01"
+    assert (data["year"], data["month"], data["tx_count"]) == (today.year, today.month, data["count"])
+    r = chat_client.post("/api/v1/chat", json={"message": "How much have I ever spent on coffee?"})
+    assert r.status_code == 200
+    data = r.json()["data"]
+    assert (data["keyword"], data["year"], data["month"]) == ("coffee", None, None)
+    r = chat_client.post("/api/v1/chat", json={"text": "hello"})
+    assert r.status_code == 200 and "couldn't detect" in r.json()["reply"]
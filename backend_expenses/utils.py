@@ -1,74 +1,83 @@
 # backend_expenses/utils.py
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from .models import Expense
-from datetime import datetime
-from typing import Tuple, Dict, Any, List
-
-def _fetch_by_category(db: Session, year: int, month: int) -> List[Dict[str, Any]]:
-    """Return list of { exp_type, total, count } for the given year/month, sorted by abs(total)."""
-    year_s = str(year)
-    month_s = f"{month:02d}"
-
-    q = (
-        db.query(
-            func.coalesce(Expense.exp_type, "misc").label("exp_type"),
-            func.sum(Expense.total_amount).label("total"),
-            func.count(Expense.id).label("count"),
-        )
-        .filter(func.strftime("%Y", Expense.tx_datetime) == year_s)
-        .filter(func.strftime("%m", Expense.tx_datetime) == month_s)
-        .group_by(func.coalesce(Expense.exp_type, "misc"))
-    )
+from sqlalchemy import and_, func, or_
+from . import rollups
+from . import periods
+from .periods import month_range
+from datetime import date, datetime, timedelta
+from typing import Tuple, Dict, Any, List, Optional
+
+# /reports/range refuses series longer than this many buckets
+MAX_RANGE_BUCKETS = 1000
+
+def _fetch_grouped(db: Session, months: List[Tuple[int, int]]):
+    """
+    (ym 'YYYY-MM', day 'DD', exp_type, total, count) for the requested months,
+    read from the rollup_daily table (see rollups.py) in one indexed query.
+    """
+    d = rollups.daily.c
+    q = db.query(
+        func.substr(d.day, 1, 7).label("ym"),
+        func.substr(d.day, 9, 2).label("day"),
+        d.exp_type.label("exp_type"),
+        d.total.label("total"),
+        d.count.label("count"),
+    ).filter(or_(*(and_(d.day >= lo, d.day < hi) for lo, hi in (month_range(y, m) for y, m in sorted(set(months))))))
+    return q.all()
+
+def get_category_totals(db: Session, year: int, month: int) -> List[Dict[str, Any]]:
+    """[{exp_type, total, count}] for one month from rollup_monthly, sorted by abs(total)."""
+    m = rollups.monthly.c
+    rows = db.query(m.exp_type, m.total, m.count).filter(m.ym == f"{year:04d}-{month:02d}").all()
+    result = [{"exp_type": r.exp_type, "total": float(r.total or 0.0), "count": int(r.count or 0)} for r in rows]
+    result.sort(key=lambda x: abs(x["total"]), reverse=True)
+    return result
 
-    rows = q.all()
-    result = []
+def _fold_month(year: int, month: int, rows) -> Dict[str, Any]:
+    """Fold (day, exp_type) groups of one month into by_category / by_day / totals."""
+    by_cat: Dict[str, Dict[str, Any]] = {}
+    by_day: Dict[str, float] = {}
     for r in rows:
-        # r may be a SQLAlchemy row - convert explicitly
-        exp_type = r.exp_type
         total = float(r.total or 0.0)
         count = int(r.count or 0)
-        result.append({"exp_type": exp_type, "total": total, "count": count})
+        cat = by_cat.setdefault(r.exp_type, {"exp_type": r.exp_type, "total": 0.0, "count": 0})
+        cat["total"] += total
+        cat["count"] += count
+        by_day[r.day] = by_day.get(r.day, 0.0) + total
 
+    by_category = list(by_cat.values())
     # sort by absolute total descending (largest movers first)
-    result.sort(key=lambda x: abs(x["total"]), reverse=True)
-    return result
+    by_category.sort(key=lambda x: abs(x["total"]), reverse=True)
+    return {
+        "year": year,
+        "month": month,
+        "by_category": by_category,
+        "by_day": [{"day": d, "total": by_day[d]} for d in sorted(by_day)],
+        "total": sum(c["total"] for c in by_category),
+        "count": sum(c["count"] for c in by_category),
+    }
 
-def _fetch_by_day(db: Session, year: int, month: int) -> List[Dict[str, Any]]:
+def get_monthly_reports(db: Session, months: List[Tuple[int, int]]) -> Dict[Tuple[int, int], Dict[str, Any]]:
     """
-    Return list of { day: '01', total: float } for days in the month.
-    Day is returned as two-digit string to align with frontend examples.
+    Monthly reports for several (year, month) pairs from a single rollup query.
+    Returns {(year, month): {"year", "month", "by_category", "by_day", "total", "count"}}.
     """
-    year_s = str(year)
-    month_s = f"{month:02d}"
-
-    q = (
-        db.query(
-            func.strftime("%d", Expense.tx_datetime).label("day"),
-            func.sum(Expense.total_amount).label("total"),
-        )
-        .filter(func.strftime("%Y", Expense.tx_datetime) == year_s)
-        .filter(func.strftime("%m", Expense.tx_datetime) == month_s)
-        .group_by(func.strftime("%d", Expense.tx_datetime))
-        .order_by(func.strftime("%d", Expense.tx_datetime))
-    )
-
-    rows = q.all()
-    result = []
-    for r in rows:
-        day = r.day
-        total = float(r.total or 0.0)
-        result.append({"day": day, "total": total})
-    return result
+    grouped: Dict[Tuple[int, int], list] = {(y, m): [] for y, m in months}
+    if not grouped:
+        return {}
+    for r in _fetch_grouped(db, list(grouped)):
+        key = (int(r.ym[:4]), int(r.ym[5:7]))
+        if key in grouped:
+            grouped[key].append(r)
+    return {key: _fold_month(key[0], key[1], rows) for key, rows in grouped.items()}
 
 def get_monthly_report(db: Session, year: int, month: int) -> Dict[str, Any]:
     """
-    Return {"year": year, "month": month, "by_category": [...], "by_day": [...]}
-    Keeps compatibility with previous shape (by_category), adds by_day for daily chart.
+    Return {"year": year, "month": month, "by_category": [...], "by_day": [...], "total", "count"}
+    by_category is [{exp_type, total, count}] sorted by abs(total); by_day is
+    [{day: '01', total}] (two-digit day strings, as the frontend expects).
     """
-    by_category = _fetch_by_category(db, year, month)
-    by_day = _fetch_by_day(db, year, month)
-    return {"year": year, "month": month, "by_category": by_category, "by_day": by_day}
+    return get_monthly_reports(db, [(year, month)])[(year, month)]
 
 def compare_months(db: Session, m1: Tuple[int, int], m2: Tuple[int, int]) -> Dict[str, Any]:
     """
@@ -80,11 +89,9 @@ def compare_months(db: Session, m1: Tuple[int, int], m2: Tuple[int, int]) -> Dic
         "diff_by_category": [ { exp_type, total1, total2, diff }, ... ]
       }
     """
-    y1, mo1 = m1
-    y2, mo2 = m2
-
-    month1 = get_monthly_report(db, y1, mo1)
-    month2 = get_monthly_report(db, y2, mo2)
+    reports = get_monthly_reports(db, [tuple(m1), tuple(m2)])
+    month1 = reports[tuple(m1)]
+    month2 = reports[tuple(m2)]
 
     # build maps of totals for diff
     map1 = {r["exp_type"]: r["total"] for r in month1["by_category"]}
@@ -101,3 +108,93 @@ def compare_months(db: Session, m1: Tuple[int, int], m2: Tuple[int, int]) -> Dic
     diff_list.sort(key=lambda x: abs(x["diff"]), reverse=True)
 
     return {"month1": month1, "month2": month2, "diff_by_category": diff_list}
+
+def _deltas(values: List[float], window: range, base_idx: List[Optional[int]]):
+    """
+    Absolute and relative (%) change of values[i] for i in window against
+    values[base_idx[k]]; None where there is no base (or a zero base, for %).
+    """
+    bases = [values[j] if j is not None else None for j in base_idx]
+    diff = [values[i] - b if b is not None else None for i, b in zip(window, bases)]
+    pct = [round(d / abs(b) * 100.0, 2) if d is not None and b else None for d, b in zip(diff, bases)]
+    return diff, pct
+
+def get_range_report(db: Session, start: date, end: date, granularity: str = "month") -> Dict[str, Any]:
+    """
+    Dense per-category time series between start and end (inclusive, widened
+    to whole buckets) at day/week/month/quarter/year granularity, read from
+    rollup_daily in one query. Each series carries period-over-period
+    ("change", e.g. MoM for months) and year-over-year ("yoy") deltas; the
+    query also covers the year before start so the first buckets have a base.
+    """
+    if granularity not in periods.GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(periods.GRANULARITIES)}")
+    if end < start:
+        raise ValueError("end must not be before start")
+
+    first = periods.bucket_start(start, granularity)
+    last = periods.bucket_start(end, granularity)
+    # checked before any bucket is built, so an oversized range costs nothing
+    if periods.bucket_count(first, last, granularity) > MAX_RANGE_BUCKETS:
+        raise ValueError(f"range has more than {MAX_RANGE_BUCKETS} {granularity} buckets")
+    history_start = periods.bucket_start(periods.year_earlier(first, granularity), granularity)
+
+    starts: List[date] = []
+    b = history_start
+    while b <= last:
+        starts.append(b)
+        b = periods.next_bucket(b, granularity)
+    offset = starts.index(first)
+    index = {s_: i for i, s_ in enumerate(starts)}
+
+    d = rollups.daily.c
+    rows = (
+        db.query(d.day, d.exp_type, d.total, d.count)
+        .filter(d.day >= history_start.isoformat(), d.day < periods.next_bucket(last, granularity).isoformat())
+        .all()
+    )
+    n = len(starts)
+    totals: Dict[str, List[float]] = {}
+    counts: Dict[str, List[int]] = {}
+    for r in rows:
+        try:
+            i = index[periods.bucket_start(date.fromisoformat(r.day), granularity)]
+        except (KeyError, ValueError):
+            continue
+        if r.exp_type not in totals:
+            totals[r.exp_type] = [0.0] * n
+            counts[r.exp_type] = [0] * n
+        totals[r.exp_type][i] += float(r.total or 0.0)
+        counts[r.exp_type][i] += int(r.count or 0)
+
+    window = range(offset, n)
+    prev_idx = [i - 1 for i in window]
+    yoy_idx = [index.get(periods.year_earlier(starts[i], granularity)) for i in window]
+
+    def _series(vals: List[float], cnts: List[int]) -> Dict[str, Any]:
+        change, change_pct = _deltas(vals, window, prev_idx)
+        yoy, yoy_pct = _deltas(vals, window, yoy_idx)
+        return {
+            "totals": vals[offset:],
+            "counts": cnts[offset:],
+            "total": sum(vals[offset:]),
+            "change": change,
+            "change_pct": change_pct,
+            "yoy": yoy,
+            "yoy_pct": yoy_pct,
+        }
+
+    series = [{"exp_type": k, **_series(totals[k], counts[k])} for k in totals]
+    series = [x for x in series if any(x["counts"])]
+    series.sort(key=lambda x: abs(x["total"]), reverse=True)
+    all_totals = [sum(col) for col in zip(*totals.values())] if totals else [0.0] * n
+    all_counts = [sum(col) for col in zip(*counts.values())] if counts else [0] * n
+
+    return {
+        "start": first.isoformat(),
+        "end": (periods.next_bucket(last, granularity) - timedelta(days=1)).isoformat(),
+        "granularity": granularity,
+        "periods": [periods.bucket_label(s_, granularity) for s_ in starts[offset:]],
+        "series": series,
+        "overall": _series(all_totals, all_counts),
+    }
@@ -0,0 +1,356 @@
+# backend_expenses/vocab.py
+"""
+Persisted keyword vocabulary for chat intent detection.
+
+keyword_vocab holds every token found in expenses.note / exp_type / source
+with the number of expenses containing it (doc_count). It is maintained
+incrementally by sync():
+
+  * rows with id above the watermark (maintenance_state 'keywords.last_id')
+    are new: they are tokenised and their tokens counted;
+  * changes to rows already counted (deletes, e.g. cancel_import; note /
+    exp_type / source updates from upsert re-imports; an insert reusing a
+    counted id) are logged by triggers into keyword_changes with their old
+    or new values, and applied as -1 / +1 by the next sync.
+
+Tokenising needs Python, so the counting happens in sync() rather than in
+the triggers; the triggers only record what changed. sync() runs on the
+writer queue (backend_expenses.writer) and costs O(rows changed since the
+last sync). Ingest calls sync_in_background() after each import.
+
+keywords() serves the table (plus STATIC_SEED) as a KeywordMatcher, cached
+and refreshed in the background; chat_planner uses it to pick the search
+term of a question, backend_ingest.parsers.intent re-exports it.
+
+Recovery:
+    python -m backend_expenses.vocab --rebuild
+"""
+import argparse
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from .result_cache import preserves_results
+
+STATE_KEY = "keywords.last_id"
+
+# keywords always known, whatever keyword_vocab holds
+STATIC_SEED = {"coffee", "cafe", "starbuck", "starbucks", "tea", "latte", "espresso", "chai", "beer", "wine"}
+# tokens never stored (too generic to identify a merchant / item)
+STOPWORDS = {
+    "the", "and", "for", "with", "from", "to", "on", "in", "at", "by", "of", "a", "an", "txn", "gpay", "upi", "pay",
+    "paytm", "google", "amazon", "order", "online", "cash", "debit", "credit"
+}
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+")  # grab alphanumeric words
+# rows read per fetchmany while counting new expenses
+_FETCH = 5000
+
+TABLES = [
+    "CREATE TABLE IF NOT EXISTS keyword_vocab (token TEXT PRIMARY KEY, doc_count INTEGER NOT NULL)",
+    # changes to already-counted expenses, applied (and emptied) by sync()
+    "CREATE TABLE IF NOT EXISTS keyword_changes (sign INTEGER NOT NULL, note TEXT, exp_type TEXT, source TEXT)",
+]
+
+_COUNTED = f"(SELECT CAST(value AS INTEGER) FROM maintenance_state WHERE key = '{STATE_KEY}')"
+_LOG_NEW = "INSERT INTO keyword_changes VALUES (1, NEW.note, NEW.exp_type, NEW.source);"
+_LOG_OLD = "INSERT INTO keyword_changes VALUES (-1, OLD.note, OLD.exp_type, OLD.source);"
+TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_vocab_insert AFTER INSERT ON expenses "
+    f"WHEN NEW.id <= {_COUNTED} BEGIN {_LOG_NEW} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_vocab_delete AFTER DELETE ON expenses "
+    f"WHEN OLD.id <= {_COUNTED} BEGIN {_LOG_OLD} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_vocab_update AFTER UPDATE OF note, exp_type, source ON expenses "
+    f"WHEN OLD.id <= {_COUNTED} BEGIN {_LOG_OLD} {_LOG_NEW} END",
+]
+
+
+def tokenize(text: Optional[str]) -> Iterable[str]:
+    if not text:
+        return ()
+    # extract alphanumeric tokens only, lowercase
+    return (tok.lower() for tok in _TOKEN_RE.findall(str(text)))
+
+
+def is_valid_token(tok: str) -> bool:
+    if not tok:
+        return False
+    if tok in STOPWORDS:
+        return False
+    if len(tok) < 3:  # ignore tiny tokens like 'is','to','on' — tune if needed
+        return False
+    # ignore pure-numeric tokens (txn ids, amounts)
+    if tok.isdigit():
+        return False
+    return True
+
+
+def row_tokens(*values: Optional[str]) -> Set[str]:
+    """Distinct valid tokens of one expense (each counts once per row)."""
+    return {tok for v in values for tok in tokenize(v) if is_valid_token(tok)}
+
+
+def install(conn: sqlite3.Connection) -> None:
+    """Create the vocabulary tables and triggers (caller commits). The first sync() counts every row."""
+    for stmt in TABLES + TRIGGERS:
+        conn.execute(stmt)
+
+
+@preserves_results
+def sync(conn: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Count expenses added since the last sync and apply logged changes, in
+    the caller's transaction (use the writer queue: writer.submit(sync)).
+    """
+    row = conn.execute("SELECT value FROM maintenance_state WHERE key = ?", (STATE_KEY,)).fetchone()
+    last_id = int(row[0]) if row else 0
+    deltas: Counter = Counter()
+
+    cur = conn.execute("SELECT id, note, exp_type, source FROM expenses WHERE id > ? ORDER BY id", (last_id,))
+    new_rows, max_id = 0, last_id
+    while True:
+        batch = cur.fetchmany(_FETCH)
+        if not batch:
+            break
+        for expense_id, note, exp_type, source in batch:
+            deltas.update(row_tokens(note, exp_type, source))
+        new_rows += len(batch)
+        max_id = batch[-1][0]
+
+    changes = 0
+    for sign, note, exp_type, source in conn.execute("SELECT sign, note, exp_type, source FROM keyword_changes"):
+        for tok in row_tokens(note, exp_type, source):
+            deltas[tok] += sign
+        changes += 1
+    conn.execute("DELETE FROM keyword_changes")
+
+    updates = [(tok, n) for tok, n in deltas.items() if n]
+    conn.executemany(
+        "INSERT INTO keyword_vocab (token, doc_count) VALUES (?, ?) "
+        "ON CONFLICT(token) DO UPDATE SET doc_count = doc_count + excluded.doc_count",
+        updates,
+    )
+    if any(n < 0 for _, n in updates):
+        conn.execute("DELETE FROM keyword_vocab WHERE doc_count <= 0")
+    conn.execute(
+        "INSERT INTO maintenance_state (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (STATE_KEY, str(max_id)),
+    )
+    return {"new_rows": new_rows, "changes": changes, "tokens_changed": len(updates)}
+
+
+@preserves_results
+def rebuild(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Recount the vocabulary from scratch (caller commits)."""
+    conn.execute("DELETE FROM keyword_vocab")
+    conn.execute("DELETE FROM keyword_changes")
+    conn.execute("DELETE FROM maintenance_state WHERE key = ?", (STATE_KEY,))
+    return sync(conn)
+
+
+def load_tokens(conn: sqlite3.Connection) -> Set[str]:
+    return {row[0] for row in conn.execute("SELECT token FROM keyword_vocab")}
+
+
+def synced(conn: sqlite3.Connection) -> bool:
+    """True once the vocabulary has been counted at least once."""
+    return conn.execute("SELECT 1 FROM maintenance_state WHERE key = ?", (STATE_KEY,)).fetchone() is not None
+
+
+def sync_now() -> Dict[str, int]:
+    """Run sync() on the writer queue and wait for it."""
+    from .writer import writer
+    return writer.submit(sync).result()
+
+
+class KeywordMatcher:
+    """
+    Immutable keyword set with a multi-pattern substring search, built once
+    per vocabulary refresh.
+
+    find(text) returns the longest keyword occurring anywhere in text
+    (leftmost among equally long ones), or None. Instead of testing every
+    keyword against the text it probes the text's substrings against the
+    set, one pass per distinct keyword length, so a lookup costs
+    O(len(text) x distinct lengths): bounded by the longest keyword, not
+    by the number of keywords.
+    """
+
+    __slots__ = ("keywords", "_lengths")
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = frozenset(k for k in keywords if k)
+        self._lengths = sorted({len(k) for k in self.keywords}, reverse=True)
+
+    def __contains__(self, token: str) -> bool:
+        return token in self.keywords
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keywords)
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def find(self, text: str) -> Optional[str]:
+        keywords = self.keywords
+        n = len(text)
+        for size in self._lengths:  # longest first
+            for i in range(n - size + 1):
+                if text[i:i + size] in keywords:
+                    return text[i:i + size]
+        return None
+
+
+def load_keywords(conn: sqlite3.Connection) -> Set[str]:
+    """Stored tokens merged with STATIC_SEED."""
+    return set(STATIC_SEED) | load_tokens(conn)
+
+
+class _KeywordCache:
+    """
+    Thread-safe, stale-while-revalidate view of keyword_vocab + STATIC_SEED,
+    held as a KeywordMatcher. A reload that finds the same tokens keeps the
+    current matcher; one that finds different tokens swaps it and bumps
+    generation, which callers can use as a cheap cache key for anything
+    derived from the keyword set.
+
+    get() never waits for a refresh: once the copy is older than ttl it
+    returns it as is and starts one background refresh (sync the vocabulary
+    on the writer queue, then reload it). Only the very first call reads the
+    table inline, which is a plain SELECT of the stored tokens.
+    """
+
+    def __init__(self, ttl: float = 300):  # seconds; refresh every 5 minutes (tune as needed)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._keywords: Optional[KeywordMatcher] = None
+        self._generation = 0
+        self._updated_at = 0.0
+        self._refreshing = False
+
+    def get(self) -> KeywordMatcher:
+        return self.snapshot()[0]
+
+    def snapshot(self) -> Tuple[KeywordMatcher, int]:
+        """(matcher, generation), starting a background refresh when stale like get()."""
+        with self._lock:
+            keywords, generation = self._keywords, self._generation
+            stale = time.time() - self._updated_at >= self.ttl
+            start = stale and not self._refreshing
+            if start:
+                self._refreshing = True
+        if keywords is None:
+            keywords, generation = self._load()
+        if start:
+            threading.Thread(target=self._refresh, name="keyword-cache-refresh", daemon=True).start()
+        return keywords, generation
+
+    def _read(self) -> KeywordMatcher:
+        from .database import get_conn
+        conn = get_conn()
+        try:
+            return KeywordMatcher(load_keywords(conn))
+        finally:
+            conn.close()
+
+    def _swap(self, kws: KeywordMatcher) -> None:
+        """Install kws unless it holds the same tokens (caller holds _lock)."""
+        if self._keywords is None or kws.keywords != self._keywords.keywords:
+            self._keywords = kws
+            self._generation += 1
+
+    def _load(self) -> Tuple[KeywordMatcher, int]:
+        try:
+            kws = self._read()
+        except Exception:
+            # if DB read fails, fall back to static seed
+            kws = KeywordMatcher(STATIC_SEED)
+        with self._lock:
+            if self._keywords is None:
+                self._swap(kws)
+            return self._keywords, self._generation
+
+    def _refresh(self) -> None:
+        try:
+            sync_now()
+            kws = self._read()
+        except Exception:
+            kws = None  # keep serving the previous copy; retried after ttl
+        with self._lock:
+            if kws is not None:
+                self._swap(kws)
+            self._updated_at = time.time()
+            self._refreshing = False
+
+    def invalidate(self) -> None:
+        """Make the next get() start a refresh."""
+        with self._lock:
+            self._updated_at = 0.0
+
+
+_KEYWORD_CACHE = _KeywordCache()
+
+
+def keywords() -> KeywordMatcher:
+    """Current keyword set (cached, refreshed in the background every ttl seconds)."""
+    return _KEYWORD_CACHE.get()
+
+
+def keywords_generation() -> int:
+    """Counter that moves only when the keyword set's tokens change."""
+    return _KEYWORD_CACHE.snapshot()[1]
+
+
+# single-flight background sync: requests made while one runs are folded into one more pass
+_bg_lock = threading.Lock()
+_bg_running = False
+_bg_pending = False
+
+
+def _bg_loop() -> None:
+    global _bg_running, _bg_pending
+    while True:
+        with _bg_lock:
+            if not _bg_pending:
+                _bg_running = False
+                return
+            _bg_pending = False
+        try:
+            sync_now()
+        except Exception:
+            pass  # next request / refresh retries; the table stays as of the last good sync
+
+
+def sync_in_background() -> None:
+    """Schedule a sync without waiting (e.g. after an import)."""
+    global _bg_running, _bg_pending
+    with _bg_lock:
+        _bg_pending = True
+        if _bg_running:
+            return
+        _bg_running = True
+    threading.Thread(target=_bg_loop, name="keyword-vocab-sync", daemon=True).start()
+
+
+def main() -> None:
+    from .schema import ensure_schema
+    from .writer import writer
+
+    parser = argparse.ArgumentParser(description="Maintain the chat keyword vocabulary.")
+    parser.add_argument("--rebuild", action="store_true", help="recount keyword_vocab from expenses")
+    args = parser.parse_args()
+
+    ensure_schema()
+    if not args.rebuild:
+        parser.print_help()
+        return
+    stats = writer.submit(rebuild).result()
+    writer.close()
+    print(f"Rebuilt keyword_vocab from {stats['new_rows']} expenses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+# backend_expenses/writer.py
+"""
+Single-writer service for finance.db with group commit.
+
+One daemon thread owns a dedicated write connection and drains a queue of
+write requests. Requests that arrive together (up to WRITER_MAX_BATCH, or
+whatever is queued within WRITER_MAX_WAIT_MS of the first one) run in one
+BEGIN IMMEDIATE ... COMMIT, each inside its own SAVEPOINT: a request that
+raises is rolled back on its own and gets the exception, the rest of the
+group still commits. One fsync/lock round trip is shared by the whole group,
+so throughput grows with the number of concurrent writers instead of
+collapsing into lock retries.
+
+    fut = writer.submit(fn, *args)      # concurrent.futures.Future
+    result = fut.result()               # blocking callers (worker threads)
+    result = await writer.run(fn, ...)  # async endpoints
+
+fn(conn, *args) receives the writer's connection. It must not commit or
+roll back itself: commit() is a no-op on that connection and rollback()
+raises; raise an exception to undo the request. Requests that keep
+in-memory state about what they wrote (BulkWriter counters / import keys)
+register conn.on_rollback(undo) so the state follows the transaction when
+the request or its whole group is rolled back. A group in which some
+request changed rows bumps data_version once before it commits (see
+result_cache; requests marked @result_cache.preserves_results don't count).
+
+Every application write goes through it: ingest imports / cancels,
+POST /expenses/ and /expenses/bulk, db_helpers.insert_expenses, dedupe
+cluster scans, vocab syncs, the rebuild CLIs and normalize_existing_db.
+Only schema setup (ensure_schema, which runs before any request, partly
+through the ORM engine) still takes the write gate directly.
+"""
+import asyncio
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import result_cache
+from .database import _connect, is_locked_error, write_gate, LOCK_RETRIES, LOCK_RETRY_BACKOFF_SEC
+
+WRITER_MAX_BATCH = int(os.environ.get("WRITER_MAX_BATCH", 256))
+# how long the writer lingers after the first request to collect a group
+WRITER_MAX_WAIT_MS = float(os.environ.get("WRITER_MAX_WAIT_MS", 2))
+
+_STOP = object()
+
+
+class _TxConnection:
+    """The writer's connection as seen by a request: transaction control stays with the writer."""
+
+    __slots__ = ("_conn", "_undo")
+
+    def __init__(self, conn: sqlite3.Connection):
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_undo", [])
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def commit(self) -> None:
+        """No-op: the writer commits the whole group."""
+
+    def rollback(self) -> None:
+        raise RuntimeError("queued writes cannot roll back the shared transaction; raise instead")
+
+    def close(self) -> None:
+        """No-op: the writer owns the connection."""
+
+    def on_rollback(self, fn: Callable[[], None]) -> None:
+        """Call fn if the writes made so far by this request are rolled back (newest callback first)."""
+        self._undo.append(fn)
+
+    def _rolled_back(self, mark: int = 0) -> None:
+        callbacks = self._undo[mark:]
+        del self._undo[mark:]
+        for fn in reversed(callbacks):
+            try:
+                fn()
+            except Exception:
+                pass  # an undo hook must not take down the writer thread
+
+
+class WriterService:
+    def __init__(self, max_batch: int = WRITER_MAX_BATCH, max_wait_ms: float = WRITER_MAX_WAIT_MS):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._tx: Optional[_TxConnection] = None  # current group's connection (writer thread only)
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.failed = 0
+        self.groups = 0
+        self.largest_group = 0
+        self.commit_seconds = 0.0
+
+    # --- client side ---
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """Queue fn(conn, *args); the future resolves after its group commits."""
+        fut: Future = Future()
+        if threading.current_thread() is self._thread:
+            # nested write from inside a request: run in the current transaction
+            try:
+                fut.set_result(fn(self._tx or _TxConnection(self._conn), *args))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        if write_gate.owned():
+            raise RuntimeError("submit() while holding the write gate would deadlock the writer")
+        self._ensure_started()
+        self._queue.put((fn, args, fut))
+        return fut
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Await fn(conn, *args) on the writer thread."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Finish queued requests and stop the thread."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "failed": self.failed,
+                "groups": self.groups,
+                "avg_group": round(self.requests / self.groups, 2) if self.groups else None,
+                "largest_group": self.largest_group,
+                "commit_ms_total": round(self.commit_seconds * 1000, 3),
+                "queued": self._queue.qsize(),
+            }
+
+    # --- writer thread ---
+    def _collect(self, first) -> Tuple[List[tuple], bool]:
+        group, stop = [first], False
+        deadline = time.monotonic() + self.max_wait
+        while len(group) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            group.append(item)
+        return group, stop
+
+    def _begin(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if not is_locked_error(e) or attempt >= LOCK_RETRIES:
+                    raise
+                write_gate.record_retry()
+                attempt += 1
+                time.sleep(LOCK_RETRY_BACKOFF_SEC * (2 ** (attempt - 1)))
+
+    def _run_group(self, group: List[tuple]) -> None:
+        done: List[Tuple[Future, Any]] = []
+        failed: List[Tuple[Future, BaseException]] = []
+        tx_conn = self._tx = _TxConnection(self._conn)
+        changed = False  # some committed request changed rows cached results depend on
+        t0 = time.perf_counter()
+        with write_gate.hold():
+            try:
+                self._begin()
+            except Exception as e:
+                for _, _, fut in group:
+                    fut.set_exception(e)
+                self._count(len(group), len(group), 0.0)
+                return
+            for fn, args, fut in group:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                self._conn.execute("SAVEPOINT queued_write")
+                mark = len(tx_conn._undo)
+                before = self._conn.total_changes
+                try:
+                    result = fn(tx_conn, *args)
+                    self._conn.execute("RELEASE queued_write")
+                    done.append((fut, result))
+                    if self._conn.total_changes != before and not getattr(fn, "preserves_results", False):
+                        changed = True
+                except Exception as e:
+                    self._conn.execute("ROLLBACK TO queued_write")
+                    self._conn.execute("RELEASE queued_write")
+                    tx_conn._rolled_back(mark)
+                    failed.append((fut, e))
+            try:
+                if changed:
+                    result_cache.bump(self._conn)  # once per group, not per row
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                tx_conn._rolled_back()
+                failed.extend((fut, e) for fut, _ in done)
+                done = []
+        self._tx = None
+        self._count(len(group), len(failed), time.perf_counter() - t0)
+        for fut, result in done:
+            fut.set_result(result)
+        for fut, exc in failed:
+            fut.set_exception(exc)
+
+    def _count(self, size: int, failed: int, seconds: float) -> None:
+        with self._stats_lock:
+            self.requests += size
+            self.failed += failed
+            self.groups += 1
+            self.largest_group = max(self.largest_group, size)
+            self.commit_seconds += seconds
+
+    def _loop(self) -> None:
+        self._conn = _connect()
+        self._conn.isolation_level = None  # explicit BEGIN / SAVEPOINT / COMMIT only
+        self._conn.row_factory = sqlite3.Row
+        try:
+            while True:
+                first = self._queue.get()
+                if first is _STOP:
+                    return
+                group, stop = self._collect(first)
+                try:
+                    self._run_group(group)
+                except Exception as e:  # e.g. SAVEPOINT itself failed
+                    if self._conn.in_transaction:
+                        self._conn.execute("ROLLBACK")
+                    for _, _, fut in group:
+                        if not fut.done():
+                            fut.set_exception(e)
+                if stop:
+                    return
+        finally:
+            self._conn.close()
+
+
+writer = WriterService()
+atexit.register(writer.close)
+
+
+def submit(fn: Callable[..., Any], *args: Any) -> Future:
+    return writer.submit(fn, *args)
+
+
+async def run(fn: Callable[..., Any], *args: Any) -> Any:
+    return await writer.run(fn, *args)
+
+
+def stats() -> Dict[str, Any]:
+    return writer.stats()
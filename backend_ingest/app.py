@@ -1,13 +1,29 @@
 # backend_ingest/app.py
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any
-import csv
-import io
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional
 from datetime import datetime
+import asyncio
+import os
+import shutil
+import tempfile
+import uuid
 
-from . import parsers, dedupe
+from . import parsers, dedupe, streaming, workers, jobs, preview_cache
+from .streaming import ParseError
+from backend_expenses import database
 from backend_expenses.database import get_conn  # reuse DB connection
+from backend_expenses.writer import writer as db_writer
+from backend_expenses import bulk_writer, result_cache, search, vocab
+from backend_expenses.bulk_writer import BulkWriter, write_records
+from backend_expenses.periods import ALL_TIME, day_range, month_range, normalize_timestamp, parse_period
+from backend_expenses.schema import ensure_schema
+
+# seconds DELETE /cancel_import waits for a running job to roll itself back
+CANCEL_WAIT_SEC = float(os.environ.get("INGEST_CANCEL_WAIT_SEC", 30))
+
+ensure_schema()
 
 app = FastAPI(title="Monexa - Ingest Service")
 
@@ -25,19 +41,108 @@ def root():
     return {"message": "Welcome to Ingest Data !!!!"}
 
 
+def _preview_file(source: str, raw) -> Dict[str, Any]:
+    """Parse the upload and keep the result in the preview cache under its content hash."""
+    reader = preview_cache.HashingReader(raw, source)
+    rows = streaming.iter_csv_rows(reader)
+    parsed = list(parsers.iter_parse_rows(source, rows, streaming.BATCH_SIZE))
+    token = reader.token()
+    if not preview_cache.cache.put(token, source, parsed):
+        token = None
+    return {"source": source, "parsed": parsed, "token": token}
+
+
+def _cached_rows(token: str, source: Optional[str] = None) -> List[Dict[str, Any]]:
+    rows = preview_cache.cache.get(token, source)
+    if rows is None:
+        raise HTTPException(status_code=410, detail="Preview token expired or unknown; upload the file again")
+    return rows
+
+
+def _import_file(job: jobs.ImportJob, parsed) -> Dict[str, Any]:
+    """Blocking part of upload_csv: insert parsed records. Runs on the ingest pool."""
+    try:
+        result = jobs.run_import(job, parsed)
+    except ParseError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to parse CSV: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB insert failed: {e}")
+    return {**result, "imported": job.rows_inserted}
+
+
+def _spool_upload(raw) -> str:
+    """Copy the upload to a temp file the background job can read after the request ends."""
+    fd, path = tempfile.mkstemp(prefix="monexa-import-", suffix=".csv")
+    with os.fdopen(fd, "wb") as out:
+        shutil.copyfileobj(raw, out, streaming.READ_CHUNK_BYTES)
+    return path
+
+
+def _import_spooled(job: jobs.ImportJob, path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "rb") as raw:
+            return jobs.run_import(job, jobs.parse_upload(job.source, raw))
+    finally:
+        os.remove(path)
+
+
+def _import_mode(mode: str) -> str:
+    if mode not in bulk_writer.MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(bulk_writer.MODES)}")
+    return mode
+
+
+def _import_text(source: str, text: str) -> Dict[str, Any]:
+    parsed = parsers.parse_text(source, text)
+
+    batch_id = uuid.uuid4().hex
+    writer = BulkWriter(None, batch_size=streaming.BATCH_SIZE, mode=bulk_writer.UPSERT)
+    records = [
+        {**r, "tx_datetime": normalize_timestamp(r.get("tx_datetime")), "source": source, "batch_id": batch_id}
+        for r in parsed
+    ]
+    try:
+        db_writer.submit(write_records, writer, records).result()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB insert failed: {e}")
+    vocab.sync_in_background()
+    stats = writer.stats()
+    return {
+        "imported": stats["inserted"],
+        "updated": stats["updated"],
+        "skipped": stats["skipped"],
+        "rows_per_sec": stats["rows_per_sec"],
+        "batch_id": batch_id,
+    }
+
+
+def _submit(fn, *args):
+    """Schedule blocking ingest work on the bounded worker pool; 503 when the queue is full."""
+    try:
+        return workers.submit(fn, *args)
+    except workers.QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+async def _run_ingest(fn, *args):
+    """Run blocking ingest work on the worker pool and await its result."""
+    return await asyncio.wrap_future(_submit(fn, *args))
+
+
 @app.post("/preview_csv")
 async def preview_csv(
     source: str = Form(...),
     file: UploadFile = File(...)
 ):
-    """Parse CSV file without inserting into DB."""
+    """
+    Parse CSV file without inserting into DB.
+    The response carries a `token` for the cached parse result that
+    /dedupe_preview and /upload_csv accept instead of the rows / file.
+    """
     try:
-        content = await file.read()
-        text = content.decode("utf-8", errors="ignore")
-        reader = csv.DictReader(io.StringIO(text))
-        rows = list(reader)
-        parsed = parsers.parse_rows(source, rows)
-        return {"source": source, "parsed": parsed}
+        return await _run_ingest(_preview_file, source, file.file)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -45,66 +150,94 @@ async def preview_csv(
 @app.post("/upload_csv")
 async def upload_csv(
     source: str = Form(...),
-    file: UploadFile = File(...)
+    file: Optional[UploadFile] = File(None),
+    token: Optional[str] = Form(None),
+    background: bool = Form(False),
+    mode: str = Form(bulk_writer.UPSERT),
 ):
     """
-    Parse CSV rows via parsers.parse_rows(source, rows) and insert into DB.
-    Also inserts any parsed 'items' into 'expense_items' table with expense_id FK.
+    Stream CSV rows through parsers.iter_parse_rows(source, rows) and insert into DB
+    with BulkWriter (one executemany per streaming.BATCH_SIZE rows), so memory stays
+    flat for large files. Parsed 'items' go into 'expense_items' with the expense_id FK.
+    Parsing and inserts run on the ingest worker pool, off the event loop.
+
+    Pass the `token` returned by /preview_csv instead of (or along with) the file
+    to commit the already-parsed rows without re-uploading or re-parsing. If the
+    token has expired the file is parsed when present, otherwise 410 is returned.
+
+    Every import is tagged with a batch_id (see DELETE /cancel_import/{batch_id}).
+    With background=true, or for uploads over jobs.BACKGROUND_MIN_BYTES, the
+    import runs as a job: the batch_id is returned immediately and progress is
+    available from GET /import_status/{batch_id}.
+
+    mode=upsert (default) keys rows on (source, txn_id), or a content hash when
+    txn_id is empty, so re-importing an overlapping statement only inserts new
+    rows and reports rows_inserted / rows_updated / rows_skipped; mode=append
+    inserts every row as before.
     """
-    try:
-        content = await file.read()
-        text = content.decode("utf-8", errors="ignore")
-        reader = csv.DictReader(io.StringIO(text))
-        rows = list(reader)
-        parsed = parsers.parse_rows(source, rows)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to parse CSV: {e}")
+    mode = _import_mode(mode)
+    cached = preview_cache.cache.get(token, source) if token else None
+    if cached is None and file is None:
+        if token:
+            _cached_rows(token, source)  # raises 410
+        raise HTTPException(status_code=400, detail="Either file or token is required")
 
-    conn = get_conn()  # your helper returning sqlite3.Connection
-    cur = conn.cursor()
-    imported = 0
+    job = jobs.create(source, mode=mode)
+    if cached is not None:
+        job.future = _submit(_import_file, job, cached)
+        if background:
+            return {**job.to_dict(), "imported": 0, "background": True}
+        return await asyncio.wrap_future(job.future)
 
+    if not (background or (file.size or 0) >= jobs.BACKGROUND_MIN_BYTES):
+        job.future = _submit(_import_file, job, jobs.parse_upload(source, file.file))
+        return await asyncio.wrap_future(job.future)
+
+    # the UploadFile is closed once this request finishes, so the job reads its own copy
+    path = await run_in_threadpool(_spool_upload, file.file)
     try:
-        for r in parsed:
-            # Ensure required fields exist (defensive)
-            tx_dt = r.get("tx_datetime")
-            exp_type = r.get("exp_type") or "misc"
-            total_amount = r.get("total_amount") or 0.0
-            note = r.get("note") or ""
-            txn_id = r.get("txn_id") or None
-
-            # Insert into expenses
-            cur.execute(
-                "INSERT INTO expenses (tx_datetime, exp_type, total_amount, note, source, txn_id) VALUES (?, ?, ?, ?, ?, ?)",
-                (tx_dt, exp_type, total_amount, note, source, txn_id)
-            )
-            expense_id = cur.lastrowid
-            imported += 1
-
-            # Insert any line-items (optional)
-            for it in r.get("items", []):
-                try:
-                    qty = float(it.get("quantity") or 0.0)
-                except Exception:
-                    qty = 0.0
-                try:
-                    amt = float(it.get("amount") or 0.0)
-                except Exception:
-                    amt = 0.0
-
-                cur.execute(
-                    "INSERT INTO expense_items (expense_id, quantity, amount) VALUES (?, ?, ?)",
-                    (expense_id, qty, amt)
-                )
-
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"DB insert failed: {e}")
-    finally:
-        conn.close()
+        job.future = _submit(_import_spooled, job, path)
+    except HTTPException:
+        os.remove(path)
+        job.status = jobs.FAILED
+        job.error = "ingest queue is full"
+        raise
+    return {**job.to_dict(), "imported": 0, "background": True}
+
+
+@app.get("/import_status/{batch_id}")
+def import_status(batch_id: str):
+    """Progress of an import: rows parsed/inserted so far and throughput."""
+    job = jobs.get(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch_id {batch_id}")
+    return job.to_dict()
 
-    return {"imported": imported, "source": source}
+
+@app.delete("/cancel_import/{batch_id}")
+async def cancel_import(batch_id: str):
+    """
+    Cancel an import and delete exactly the rows tagged with its batch_id.
+    A running job stops at its next batch and removes what it committed; for a
+    finished (or no longer tracked) batch the tagged rows are deleted directly.
+    """
+    job = jobs.cancel(batch_id)
+    if job is not None and job.active and job.future is not None:
+        try:
+            # shield: timing out here must not cancel the job's own future
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.future)), CANCEL_WAIT_SEC)
+        except asyncio.TimeoutError:
+            return {"batch_id": batch_id, "status": job.status, "deleted": job.deleted}
+        except Exception:
+            pass  # failure is recorded on the job; its rows are already removed
+        return {"batch_id": batch_id, "status": job.status, "deleted": job.deleted}
+
+    deleted = await db_writer.run(jobs.delete_batch, batch_id)
+    vocab.sync_in_background()
+    if job is not None:
+        job.status = jobs.CANCELLED
+        job.deleted += deleted
+    return {"batch_id": batch_id, "status": jobs.CANCELLED, "deleted": deleted}
 
 
 @app.post("/upload_text")
@@ -113,44 +246,38 @@ async def upload_text(
     text: str = Form(...)
 ):
     """Parse text bills/invoices and insert into DB."""
-    parsed = parsers.parse_text(source, text)
+    return await _run_ingest(_import_text, source, text)
 
-    conn = get_conn()
-    cur = conn.cursor()
-    imported = 0
-    try:
-        for r in parsed:
-            cur.execute(
-                "INSERT INTO expenses (tx_datetime, exp_type, total_amount, note, source, txn_id) VALUES (?, ?, ?, ?, ?, ?)",
-                (
-                    r.get("tx_datetime"),
-                    r.get("exp_type"),
-                    r.get("total_amount"),
-                    r.get("note"),
-                    source,
-                    r.get("txn_id"),
-                ),
-            )
-            imported += 1
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"DB insert failed: {e}")
-    finally:
-        conn.close()
-    return {"imported": imported}
+
+@app.get("/ingest_stats")
+def ingest_stats():
+    """Worker pool occupancy (running + queued ingest jobs) plus DB pool / writer-queue / result-cache counters."""
+    return {**workers.stats(), "db": database.stats(), "writer": db_writer.stats(), "result_cache": result_cache.stats()}
 
 
 # --- Dedupe endpoints (reuse dedupe.py) ---
 @app.post("/dedupe_preview")
-def dedupe_preview(rows: List[Dict[str, Any]]):
-    return dedupe.preview(rows)
+def dedupe_preview(
+    rows: Optional[List[Dict[str, Any]]] = Body(None),
+    token: Optional[str] = None,
+    date_window_days: Optional[int] = None,
+):
+    """
+    Dedupe check for parsed rows, sent in the body or referenced by a /preview_csv token.
+    date_window_days additionally restricts candidates to +/- that many days.
+    """
+    if token:
+        rows = _cached_rows(token)
+    return dedupe.preview(rows or [], date_window_days=date_window_days)
 
 
 @app.get("/find_duplicates")
-def find_duplicates():
-    # return a list/dict from dedupe.find_in_db()
-    return dedupe.find_in_db()
+def find_duplicates(full: bool = False, limit: int = 100):
+    """
+    Duplicate clusters across the whole table. Only rows added since the last
+    scan are examined unless full=true.
+    """
+    return dedupe.find_in_db(full=full, limit=limit)
 
 
 # --- Example quick query: amount for a keyword for a month ---
@@ -163,39 +290,34 @@ def query_amount(payload: Dict[str, Any] = Body(...)):
       "year": 2025,
       "month": 9
     }
+    or, for a wider range, "start" / "end" as YYYY, YYYY-MM or YYYY-MM-DD
+    (inclusive; either may be omitted for an open end) instead of year/month.
     Returns sum(total_amount) for expenses whose note or exp_type or source matches keyword.
     """
     keyword = str(payload.get("keyword", "")).strip().lower()
-    year = int(payload.get("year", datetime.utcnow().year))
-    month = int(payload.get("month", datetime.utcnow().month))
+    if payload.get("start") or payload.get("end"):
+        try:
+            start = parse_period(str(payload["start"])).isoformat() if payload.get("start") else ALL_TIME[0]
+            last = parse_period(str(payload["end"]), end=True) if payload.get("end") else None
+            end = day_range(last, last)[1] if last else ALL_TIME[1]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="start / end must be YYYY, YYYY-MM or YYYY-MM-DD")
+        bounds, scope = (start, end), {"start": start, "end": end}
+    else:
+        year = int(payload.get("year", datetime.utcnow().year))
+        month = int(payload.get("month", datetime.utcnow().month))
+        bounds, scope = month_range(year, month), {"year": year, "month": month}
 
+    # full-text index on note / exp_type / source joined to the half-open range (wide
+    # ranges use the index, see backend_expenses.search), cached until the next write
+    # to expenses (see backend_expenses.result_cache)
     conn = get_conn()
-    cur = conn.cursor()
-
-    # filter by year/month on tx_datetime (stored as ISO string)
-    start = f"{year:04d}-{month:02d}-01T00:00:00"
-    # naive end: next month first day (works for SQL string compare)
-    if month == 12:
-        nxt_year, nxt_month = year + 1, 1
-    else:
-        nxt_year, nxt_month = year, month + 1
-    end = f"{nxt_year:04d}-{nxt_month:02d}-01T00:00:00"
-
-    # search in note or exp_type or source
-    q = """
-    SELECT SUM(total_amount) as total, COUNT(*) as tx_count
-    FROM expenses
-    WHERE tx_datetime >= ? AND tx_datetime < ?
-      AND (
-          lower(note) LIKE ?
-          OR lower(exp_type) LIKE ?
-          OR lower(source) LIKE ?
-      )
-    """
-    like = f"%{keyword}%"
-    cur.execute(q, (start, end, like, like, like))
-    row = cur.fetchone()
-    conn.close()
-    total = row["total"] if row and row["total"] is not None else 0.0
-    tx_count = row["tx_count"] if row else 0
-    return {"keyword": keyword, "year": year, "month": month, "total": float(total), "tx_count": tx_count}
+    try:
+        total, tx_count = result_cache.cached(
+            "query_amount", (keyword, bounds),
+            lambda: search.keyword_total(conn, keyword, bounds),
+            result_cache.version(conn),
+        )
+    finally:
+        conn.close()
+    return {"keyword": keyword, **scope, "total": total, "tx_count": tx_count}
@@ -1,7 +1,20 @@
-from typing import List, Dict, Any
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime, timedelta
 from difflib import SequenceMatcher
 from backend_expenses.database import get_conn
+from backend_expenses.result_cache import preserves_results
+from backend_expenses.writer import writer
+
+# a candidate must be within this amount (exclusive) and this note similarity (exclusive)
+AMOUNT_TOLERANCE = 1.0
+SIMILARITY_THRESHOLD = 0.6
+# range scans are widened by this much; the exact abs(diff) < tolerance test runs after
+_FETCH_SLACK = 1e-6
+
+_COLUMNS = "id, tx_datetime, total_amount, note, source, txn_id"
+
 
 def normalize(s: str) -> str:
     return (s or "").lower().strip()
@@ -9,29 +22,378 @@ def normalize(s: str) -> str:
 def similarity(a: str, b: str) -> float:
     return SequenceMatcher(None, normalize(a), normalize(b)).ratio()
 
-def preview(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+
+class _SimilarityIndex:
+    """
+    similarity() with memoisation and cheap upper-bound pruning.
+    real_quick_ratio()/quick_ratio() never under-estimate ratio(), so pairs
+    that cannot beat the threshold are rejected without the full match.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._memo: Dict[Tuple[str, str], Optional[float]] = {}
+
+    def score(self, a: str, b: str) -> Optional[float]:
+        """ratio(a, b) if it is above the threshold, else None."""
+        key = (normalize(a), normalize(b))
+        if key in self._memo:
+            return self._memo[key]
+        sm = SequenceMatcher(None, key[0], key[1])
+        sim = None
+        if sm.real_quick_ratio() > self.threshold and sm.quick_ratio() > self.threshold:
+            ratio = sm.ratio()
+            if ratio > self.threshold:
+                sim = ratio
+        self._memo[key] = sim
+        return sim
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_date(value: Any) -> Optional[datetime]:
+    """Date part of an ISO-ish tx_datetime ('2025-09-01', '2025-09-01T10:00:00', ...)."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _merge_ranges(amounts: List[float], tol: float) -> List[Tuple[float, float]]:
+    """Collapse the (a - tol, a + tol) windows of all incoming amounts into disjoint ranges."""
+    ranges: List[Tuple[float, float]] = []
+    for a in sorted(amounts):
+        lo, hi = a - tol, a + tol
+        if ranges and lo <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], hi))
+        else:
+            ranges.append((lo, hi))
+    return ranges
+
+
+def _load_buckets(cur, ranges: List[Tuple[float, float]], date_lo: Optional[str], date_hi: Optional[str]):
+    """
+    Fetch existing rows whose amount falls in any incoming window, via range
+    scans on ix_expenses_amount_datetime. Returns rows sorted by amount plus the
+    parallel list of amounts for bisecting.
+    """
+    rows: List[Dict[str, Any]] = []
+    date_sql = ""
+    date_params: Tuple = ()
+    if date_lo and date_hi:
+        date_sql = " AND tx_datetime >= ? AND tx_datetime < ?"
+        date_params = (date_lo, date_hi)
+    for lo, hi in ranges:
+        cur.execute(
+            f"SELECT {_COLUMNS} FROM expenses WHERE total_amount > ? AND total_amount < ?{date_sql} "
+            "ORDER BY total_amount",
+            (lo, hi) + date_params,
+        )
+        rows.extend(dict(r) for r in cur.fetchall())
+    return rows, [float(r["total_amount"]) for r in rows]
+
+
+def preview(rows: List[Dict[str, Any]], date_window_days: Optional[int] = None) -> Dict[str, Any]:
+    """
+    For every incoming row, list existing expenses that look like duplicates:
+    amount within AMOUNT_TOLERANCE and note similarity above SIMILARITY_THRESHOLD
+    (optionally also within date_window_days of the incoming date).
+
+    Candidates are blocked first: existing rows are pulled by amount range from
+    the whole table (not just the latest 500), and the fuzzy note comparison
+    only runs inside each row's amount bucket. Candidates are listed newest first.
+    """
+    if not rows:
+        return {"results": []}
+
+    amounts = [_to_float(r.get("total_amount", 0)) for r in rows]
+    window = timedelta(days=date_window_days) if date_window_days is not None else None
+
+    date_lo = date_hi = None
+    if window is not None:
+        dates = [d for d in (_to_date(r.get("tx_datetime")) for r in rows) if d]
+        if dates:
+            date_lo = (min(dates) - window).strftime("%Y-%m-%d")
+            date_hi = (max(dates) + window + timedelta(days=1)).strftime("%Y-%m-%d")
+
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id, tx_datetime, total_amount, note, source, txn_id FROM expenses ORDER BY tx_datetime DESC LIMIT 500")
-    existing = [dict(r) for r in cur.fetchall()]
+    try:
+        existing, existing_amounts = _load_buckets(
+            conn.cursor(), _merge_ranges(amounts, AMOUNT_TOLERANCE + _FETCH_SLACK), date_lo, date_hi
+        )
+    finally:
+        conn.close()
 
+    sims = _SimilarityIndex()
     results = []
-    for r in rows:
+    for r, amt in zip(rows, amounts):
+        lo = bisect_right(existing_amounts, amt - AMOUNT_TOLERANCE - _FETCH_SLACK)
+        hi = bisect_left(existing_amounts, amt + AMOUNT_TOLERANCE + _FETCH_SLACK)
+        r_date = _to_date(r.get("tx_datetime")) if window is not None else None
         candidates = []
-        for ex in existing:
-            amt_close = abs(float(r.get("total_amount", 0)) - float(ex["total_amount"])) < 1.0
-            sim = similarity(r.get("note", ""), ex.get("note", ""))
-            if amt_close and sim > 0.6:
+        for ex, ex_amt in zip(existing[lo:hi], existing_amounts[lo:hi]):
+            if not abs(amt - ex_amt) < AMOUNT_TOLERANCE:
+                continue
+            if r_date is not None:
+                ex_date = _to_date(ex.get("tx_datetime"))
+                if ex_date is None or abs(ex_date - r_date) > window:
+                    continue
+            sim = sims.score(r.get("note", ""), ex.get("note", ""))
+            if sim is not None:
                 candidates.append({"existing": ex, "sim": sim})
+        candidates.sort(key=lambda c: (str(c["existing"]["tx_datetime"] or ""), c["existing"]["id"]), reverse=True)
         results.append({"incoming": r, "candidates": candidates})
-    conn.close()
     return {"results": results}
 
-def find_in_db() -> Dict[str, Any]:
-    conn = get_conn()
+# --- whole-table duplicate clusters ---
+# fuzzy-note matches must also be within this many days of each other
+CLUSTER_DATE_WINDOW_DAYS = 3
+# incremental runs with more new rows than this fall back to a full sweep
+FULL_SWEEP_MIN_NEW_ROWS = 50_000
+_STATE_KEY = "dedupe.last_scanned_id"
+
+REASON_TXN_ID = "txn_id"
+REASON_SAME_DAY = "same_source_amount_day"
+REASON_FUZZY_NOTE = "fuzzy_note"
+
+
+class _Clusters:
+    """Union-find over expense ids, remembering why each id was linked."""
+
+    def __init__(self):
+        self.parent: Dict[int, int] = {}
+        self.reason: Dict[int, str] = {}
+
+    def find(self, x: int) -> int:
+        root = self.parent.setdefault(x, x)
+        while root != self.parent[root]:
+            root = self.parent[root]
+        while self.parent[x] != root:  # path compression
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a: int, b: int, reason: str) -> None:
+        self.reason.setdefault(a, reason)
+        self.reason.setdefault(b, reason)
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # smallest id is the root, so it doubles as a stable cluster id
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    def groups(self) -> Dict[int, List[int]]:
+        out: Dict[int, List[int]] = {}
+        for x in list(self.parent):
+            out.setdefault(self.find(x), []).append(x)
+        return out
+
+
+def _day(value: Any) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").toordinal()
+    except ValueError:
+        return None
+
+
+def _match_reason(a: Tuple, b: Tuple, sims: "_SimilarityIndex", window_days: int) -> Optional[str]:
+    """a, b are (id, amount, day, note, source) sweep tuples already within AMOUNT_TOLERANCE."""
+    if a[2] is None or b[2] is None or abs(a[2] - b[2]) > window_days:
+        return None
+    if a[1] == b[1] and a[2] == b[2] and (a[4] or "") == (b[4] or ""):
+        return REASON_SAME_DAY
+    if sims.score(a[3], b[3]) is not None:
+        return REASON_FUZZY_NOTE
+    return None
+
+
+def _link_txn_ids(cur, clusters: _Clusters, since_id: Optional[int] = None) -> None:
+    """Exact (source, txn_id) collisions, optionally only groups touching ids > since_id."""
+    sql = (
+        "SELECT group_concat(id) FROM expenses WHERE txn_id IS NOT NULL AND txn_id <> '' "
+        "GROUP BY coalesce(source, ''), txn_id HAVING COUNT(*) > 1"
+    )
+    if since_id is not None:
+        sql += " AND MAX(id) > ?"
+    cur.execute(sql, (since_id,) if since_id is not None else ())
+    for (ids,) in cur:
+        members = [int(x) for x in ids.split(",")]
+        for other in members[1:]:
+            clusters.union(members[0], other, REASON_TXN_ID)
+
+
+def _sweep(cur, clusters: _Clusters, window_days: int) -> int:
+    """
+    Stream all expenses ordered by (total_amount, tx_datetime) and compare each
+    row only with the rows still inside its amount window, bucketed by day.
+    Memory is bounded by the window, not the table.
+    """
+    cur.execute(
+        "SELECT id, total_amount, tx_datetime, note, source FROM expenses "
+        "WHERE total_amount IS NOT NULL ORDER BY total_amount, tx_datetime"
+    )
+    sims = _SimilarityIndex()
+    window: deque = deque()
+    by_day: Dict[Optional[int], deque] = {}
+    scanned = 0
+    while True:
+        chunk = cur.fetchmany(5000)
+        if not chunk:
+            break
+        for row_id, amount, tx_dt, note, source in chunk:
+            scanned += 1
+            amount = float(amount)
+            row = (row_id, amount, _day(tx_dt), note, source)
+            # rows arrive in amount order, so the oldest window entry of each day is at its front
+            while window and not amount - window[0][1] < AMOUNT_TOLERANCE:
+                old = window.popleft()
+                by_day[old[2]].popleft()
+            if row[2] is not None:
+                for d in range(row[2] - window_days, row[2] + window_days + 1):
+                    for other in by_day.get(d, ()):
+                        reason = _match_reason(row, other, sims, window_days)
+                        if reason:
+                            clusters.union(other[0], row_id, reason)
+            window.append(row)
+            by_day.setdefault(row[2], deque()).append(row)
+    return scanned
+
+
+def _link_new_rows(cur, clusters: _Clusters, since_id: int, window_days: int) -> int:
+    """Incremental pass: compare only rows with id > since_id against their amount window."""
+    cur.execute(
+        "SELECT id, total_amount, tx_datetime, note, source FROM expenses "
+        "WHERE id > ? AND total_amount IS NOT NULL ORDER BY id",
+        (since_id,),
+    )
+    new_rows = [(r[0], float(r[1]), _day(r[2]), r[3], r[4]) for r in cur.fetchall()]
+    sims = _SimilarityIndex()
+    for row in new_rows:
+        cur.execute(
+            "SELECT id, total_amount, tx_datetime, note, source FROM expenses "
+            "WHERE total_amount > ? AND total_amount < ? AND id <> ?",
+            (row[1] - AMOUNT_TOLERANCE, row[1] + AMOUNT_TOLERANCE, row[0]),
+        )
+        for r in cur.fetchall():
+            other = (r[0], float(r[1]), _day(r[2]), r[3], r[4])
+            if not abs(row[1] - other[1]) < AMOUNT_TOLERANCE:
+                continue
+            reason = _match_reason(row, other, sims, window_days)
+            if reason:
+                clusters.union(other[0], row[0], reason)
+    return len(new_rows)
+
+
+@preserves_results
+def _store_scan(conn, clusters: _Clusters, full: bool, max_id: int) -> None:
+    """Writer-queue request: save the clusters and the scan watermark together."""
+    _save_clusters(conn, clusters, full)
+    conn.execute(
+        "INSERT INTO maintenance_state (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (_STATE_KEY, str(max_id)),
+    )
+
+
+def _save_clusters(conn, clusters: _Clusters, full: bool) -> None:
     cur = conn.cursor()
-    cur.execute("SELECT id, tx_datetime, total_amount, note, source, txn_id FROM expenses")
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    # naive: return total count
-    return {"scanned": len(rows)}
+    if full:
+        cur.execute("DELETE FROM duplicate_clusters")
+    else:
+        # pull in the existing clusters the new links touch, so merged clusters get one id
+        touched = list(clusters.parent)
+        for i in range(0, len(touched), 500):
+            part = touched[i:i + 500]
+            marks = ",".join("?" * len(part))
+            cur.execute(
+                f"SELECT expense_id, cluster_id, reason FROM duplicate_clusters WHERE cluster_id IN "
+                f"(SELECT cluster_id FROM duplicate_clusters WHERE expense_id IN ({marks}))",
+                part,
+            )
+            for expense_id, cluster_id, reason in cur.fetchall():
+                clusters.union(cluster_id, expense_id, reason or REASON_FUZZY_NOTE)
+                if reason:
+                    clusters.reason[expense_id] = reason
+    rows = [
+        (member, root, clusters.reason.get(member))
+        for root, members in clusters.groups().items()
+        for member in members
+    ]
+    cur.executemany(
+        "INSERT INTO duplicate_clusters (expense_id, cluster_id, reason) VALUES (?, ?, ?) "
+        "ON CONFLICT(expense_id) DO UPDATE SET cluster_id = excluded.cluster_id, reason = excluded.reason",
+        rows,
+    )
+
+
+def _list_clusters(cur, limit: int) -> Tuple[int, List[Dict[str, Any]]]:
+    """Clusters with at least two live members (deleted expenses are ignored)."""
+    cur.execute(
+        "SELECT d.cluster_id, group_concat(d.expense_id), group_concat(DISTINCT d.reason) "
+        "FROM duplicate_clusters d JOIN expenses e ON e.id = d.expense_id "
+        "GROUP BY d.cluster_id HAVING COUNT(*) > 1 ORDER BY d.cluster_id"
+    )
+    total = 0
+    out = []
+    for cluster_id, ids, reasons in cur:
+        total += 1
+        if len(out) < limit:
+            out.append({
+                "cluster_id": cluster_id,
+                "expense_ids": sorted(int(x) for x in ids.split(",")),
+                "reasons": sorted((reasons or "").split(",")) if reasons else [],
+            })
+    return total, out
+
+
+def find_in_db(full: bool = False, limit: int = 100,
+               date_window_days: int = CLUSTER_DATE_WINDOW_DAYS) -> Dict[str, Any]:
+    """
+    Find duplicate clusters across the whole expenses table:
+      - exact (source, txn_id) collisions,
+      - same source + same amount + same day,
+      - fuzzy note match (amount within AMOUNT_TOLERANCE, dates within
+        date_window_days, note similarity above SIMILARITY_THRESHOLD).
+
+    The first run (or full=True) is a streaming sort-and-sweep over
+    (total_amount, tx_datetime). Later runs only examine rows added since the
+    last scan and merge them into the stored clusters (duplicate_clusters).
+    Returns the number of rows examined and up to `limit` clusters.
+    """
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.row_factory = None  # plain tuples for the sweep
+        row = cur.execute("SELECT value FROM maintenance_state WHERE key = ?", (_STATE_KEY,)).fetchone()
+        last_id = int(row[0]) if row else None
+        max_id = cur.execute("SELECT COALESCE(MAX(id), 0) FROM expenses").fetchone()[0]
+        if last_id is not None and max_id - last_id > FULL_SWEEP_MIN_NEW_ROWS:
+            full = True
+        full = full or last_id is None
+
+        clusters = _Clusters()
+        if full:
+            _link_txn_ids(cur, clusters)
+            scanned = _sweep(cur, clusters, date_window_days)
+        else:
+            _link_txn_ids(cur, clusters, since_id=last_id)
+            scanned = _link_new_rows(cur, clusters, last_id, date_window_days)
+
+        writer.submit(_store_scan, clusters, full, max_id).result()
+
+        total, clusters_out = _list_clusters(cur, limit)
+    finally:
+        conn.close()
+    return {
+        "mode": "full" if full else "incremental",
+        "scanned": scanned,
+        "cluster_count": total,
+        "clusters": clusters_out,
+    }
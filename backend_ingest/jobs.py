@@ -0,0 +1,192 @@
+# backend_ingest/jobs.py
+"""
+CSV import jobs tagged with a batch_id.
+
+Every upload_csv import gets a batch_id that is written to expenses.batch_id,
+so a whole import can be cancelled later by deleting exactly its rows.
+Large uploads run as background jobs on the ingest worker pool: the request
+returns the batch_id straight away and the client polls /import_status/{id}.
+
+Rows are committed per batch (streaming.BATCH_SIZE) so progress is visible
+while the job runs; a failed or cancelled job deletes the rows it already
+committed, keeping imports all-or-nothing from the caller's point of view.
+
+Imports default to bulk_writer's upsert mode, so re-uploading a statement
+(or an overlapping date range) only inserts the rows that are new. Rows an
+upsert import updated keep their original batch_id and are not reverted by
+a cancel.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional
+
+from backend_expenses import bulk_writer, vocab
+from backend_expenses.bulk_writer import BulkWriter, write_records
+from backend_expenses.writer import writer as db_writer
+from backend_expenses.periods import normalize_timestamp
+
+from . import parsers, streaming
+
+# uploads larger than this are imported in the background even if not requested
+BACKGROUND_MIN_BYTES = int(os.environ.get("INGEST_BACKGROUND_MIN_BYTES", 5 * 1024 * 1024))
+# finished jobs kept in memory for /import_status
+MAX_TRACKED_JOBS = int(os.environ.get("INGEST_MAX_TRACKED_JOBS", 200))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class ImportCancelled(Exception):
+    """Raised inside a running job when cancel() was requested."""
+
+
+class ImportJob:
+    """Progress/state of one CSV import."""
+
+    def __init__(self, source: str, batch_id: Optional[str] = None, mode: str = bulk_writer.UPSERT):
+        self.batch_id = batch_id or uuid.uuid4().hex
+        self.source = source
+        self.mode = mode
+        self.status = QUEUED
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.rows_skipped = 0
+        self.deleted = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.future: Optional[Future] = None
+        self._cancel = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "batch_id": self.batch_id,
+            "source": self.source,
+            "mode": self.mode,
+            "status": self.status,
+            "rows_parsed": self.rows_parsed,
+            "rows_inserted": self.rows_inserted,
+            "rows_updated": self.rows_updated,
+            "rows_skipped": self.rows_skipped,
+            "deleted": self.deleted,
+            "elapsed_sec": round(elapsed, 3) if elapsed is not None else None,
+            "rows_per_sec": round(self.rows_inserted / elapsed, 1) if elapsed else None,
+            "error": self.error,
+        }
+
+
+_lock = threading.Lock()
+_jobs: "OrderedDict[str, ImportJob]" = OrderedDict()
+
+
+def create(source: str, mode: str = bulk_writer.UPSERT) -> ImportJob:
+    job = ImportJob(source, mode=mode)
+    with _lock:
+        _jobs[job.batch_id] = job
+        # forget the oldest finished jobs once over the limit
+        while len(_jobs) > MAX_TRACKED_JOBS:
+            oldest = next((k for k, j in _jobs.items() if not j.active), None)
+            if oldest is None:
+                break
+            del _jobs[oldest]
+    return job
+
+
+def get(batch_id: str) -> Optional[ImportJob]:
+    with _lock:
+        return _jobs.get(batch_id)
+
+
+def _expense_record(r: Dict[str, Any], source: str, batch_id: str) -> Dict[str, Any]:
+    """Apply upload_csv defaults to a parsed row (defensive: parsers may omit fields)."""
+    return {
+        "tx_datetime": normalize_timestamp(r.get("tx_datetime")),
+        "exp_type": r.get("exp_type") or "misc",
+        "total_amount": r.get("total_amount") or 0.0,
+        "note": r.get("note") or "",
+        "source": source,
+        "txn_id": r.get("txn_id") or None,
+        "batch_id": batch_id,
+        "items": r.get("items") or [],
+    }
+
+
+def delete_batch(conn, batch_id: str) -> int:
+    """Writer-queue request: delete the expenses (and their items) tagged with batch_id; returns rows deleted."""
+    conn.execute(
+        "DELETE FROM expense_items WHERE expense_id IN (SELECT id FROM expenses WHERE batch_id = ?)",
+        (batch_id,),
+    )
+    cur = conn.execute("DELETE FROM expenses WHERE batch_id = ?", (batch_id,))
+    return cur.rowcount
+
+
+def parse_upload(source: str, raw: BinaryIO) -> Iterator[Dict[str, Any]]:
+    """Lazily decode + parse an uploaded CSV; parse failures surface as streaming.ParseError."""
+    rows = streaming.iter_csv_rows(raw)
+    return streaming.parse_guard(parsers.iter_parse_rows(source, rows, streaming.BATCH_SIZE))
+
+
+def run_import(job: ImportJob, parsed: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Insert parsed records (e.g. parse_upload(...) or cached preview rows) under
+    job.batch_id. Blocking; runs on the ingest worker pool and hands each
+    batch to the shared writer queue (group commit with other writers).
+    Re-raises streaming.ParseError / DB errors after removing any rows
+    already committed for the batch.
+    """
+    writer = BulkWriter(None, batch_size=streaming.BATCH_SIZE, mode=job.mode)
+    job.started_at = time.time()
+    try:
+        if job._cancel.is_set():
+            raise ImportCancelled()
+        job.status = RUNNING
+        for batch in streaming.batched(parsed, streaming.BATCH_SIZE):
+            if job._cancel.is_set():
+                raise ImportCancelled()
+            job.rows_parsed += len(batch)
+            records = [_expense_record(r, job.source, job.batch_id) for r in batch]
+            db_writer.submit(write_records, writer, records).result()
+            job.rows_inserted = writer.inserted
+            job.rows_updated = writer.updated
+            job.rows_skipped = writer.skipped
+        job.status = DONE
+        return job.to_dict()
+    except ImportCancelled:
+        job.deleted = db_writer.submit(delete_batch, job.batch_id).result()
+        job.rows_inserted = 0
+        job.status = CANCELLED
+        return job.to_dict()
+    except Exception as e:
+        job.deleted = db_writer.submit(delete_batch, job.batch_id).result()
+        job.rows_inserted = 0
+        job.status = FAILED
+        job.error = str(e)
+        raise
+    finally:
+        job.finished_at = time.time()
+        vocab.sync_in_background()  # chat keywords pick up (or drop) this batch's words
+
+
+def cancel(batch_id: str) -> Optional[ImportJob]:
+    """Ask a queued/running job to stop; it deletes its own rows. Returns the job if tracked."""
+    job = get(batch_id)
+    if job is not None:
+        job._cancel.set()
+    return job
@@ -1,36 +1,73 @@
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional
+from itertools import islice
 
-def parse_rows(source: str, rows: List[Dict]) -> List[Dict]:
-    """
-    Dispatch CSV rows to source-specific parser.
-    Each parser returns normalized records:
-    {tx_datetime, exp_type, total_amount, note, txn_id}
-    """
-    src = source.lower()
+from .dates import DateParser
+
+_INDIA_BANKS = {"sbi", "hdfc", "icici", "axis"}
+_US_BANKS = {"chase", "boa"}
+_CANADA_BANKS = {"td", "rbc"}
+
+
+def _module(src: str):
     if src == "amazon":
         from . import amazon
-        return amazon.parse(rows)
-    elif src == "gpay":
+        return amazon
+    if src == "gpay":
         from . import gpay
-        return gpay.parse(rows)
-    elif src == "paytm":
+        return gpay
+    if src == "paytm":
         from . import paytm
-        return paytm.parse(rows)
-    elif src == "phonepe":
+        return paytm
+    if src == "phonepe":
         from . import phonepe
-        return phonepe.parse(rows)
-    elif src in {"sbi", "hdfc", "icici", "axis"}:
+        return phonepe
+    if src in _INDIA_BANKS:
         from . import banks_india
-        return banks_india.parse(src, rows)
-    elif src in {"chase", "boa"}:
-        from . import banks_us
-        return banks_us.parse(src, rows)
-    elif src in {"td", "rbc"}:
+        return banks_india
+    if src in _US_BANKS:
+        from . import bank_us
+        return bank_us
+    if src in _CANADA_BANKS:
         from . import banks_canada
-        return banks_canada.parse(src, rows)
-    else:
-        from . import generic
-        return generic.parse(rows)
+        return banks_canada
+    from . import generic
+    return generic
+
+
+def date_parser(source: str) -> DateParser:
+    """A fresh DateParser with the formats of source's parser (one per file)."""
+    return _module(source.lower()).DATE_PARSER.clone()
+
+
+def parse_rows(source: str, rows: List[Dict], dates: Optional[DateParser] = None) -> List[Dict]:
+    """
+    Dispatch CSV rows to source-specific parser.
+    Each parser returns normalized records:
+    {tx_datetime, exp_type, total_amount, note, txn_id}
+    Pass the same `dates` (see date_parser) for every chunk of one file so the
+    date format is detected once.
+    """
+    src = source.lower()
+    module = _module(src)
+    if src == "amazon" or src in _INDIA_BANKS | _US_BANKS | _CANADA_BANKS:
+        return module.parse(src, rows, dates)
+    return module.parse(rows, dates)
+
+
+def iter_parse_rows(source: str, rows: Iterable[Dict], batch_size: int = 1000) -> Iterator[Dict]:
+    """
+    Generator version of parse_rows for large inputs.
+    Pulls `batch_size` raw rows at a time, runs them through the source parser
+    and yields the normalized records, so the full file is never held in memory.
+    The date format is detected from the first chunk and reused for the rest.
+    """
+    dates = date_parser(source)
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, batch_size))
+        if not chunk:
+            return
+        yield from parse_rows(source, chunk, dates)
 
 
 def parse_text(source: str, text: str) -> List[Dict]:
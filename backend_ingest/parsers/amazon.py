@@ -1,29 +1,30 @@
-from typing import List, Dict
-from datetime import datetime
+from typing import List, Dict, Optional
 import re
 
+from .dates import DateParser
+from .headers import Headers, first
+
+DATE_FORMATS = [
+    "%m/%d/%Y",          # 09/14/2025 (US style)
+    "%d-%m-%Y",          # 14-09-2025
+    "%d/%m/%Y",          # 14/09/2025
+    "%Y-%m-%d",          # 2025-09-14
+    "%Y-%m-%dT%H:%M:%S", # 2025-09-14T10:30:12
+    "%d-%b-%Y",          # 14-Sep-2025
+]
+DATE_PARSER = DateParser(DATE_FORMATS)  # shared memo for parse_date()
+
+# header names tried in order for each field (see parsers.headers)
+HEADERS = Headers(
+    date=("Date", "Transaction Date", "tx_datetime"),
+    amount=("Amount", "total_amount", "Value"),
+    note=("Description", "Details", "Narration", "note"),
+    txn_id=("TransactionID", "TxnID", "OrderID", "RefNo", "txn_id"),
+)
+
 def parse_date(value: str):
-    """Try several common date formats and return a datetime or None."""
-    if not value:
-        return None
-    value = str(value).strip()
-    formats = [
-        "%m/%d/%Y",          # 09/14/2025 (US style)
-        "%d-%m-%Y",          # 14-09-2025
-        "%d/%m/%Y",          # 14/09/2025
-        "%Y-%m-%d",          # 2025-09-14
-        "%Y-%m-%dT%H:%M:%S", # 2025-09-14T10:30:12
-        "%d-%b-%Y",          # 14-Sep-2025
-    ]
-    for fmt in formats:
-        try:
-            return datetime.strptime(value, fmt)
-        except ValueError:
-            continue
-    try:
-        return datetime.fromisoformat(value)
-    except Exception:
-        return None
+    """Try DATE_FORMATS in order, then fromisoformat; return a datetime or None."""
+    return DATE_PARSER.parse(value)
 
 def parse_amount(value: str):
     """Normalize amount strings to float. Strip commas, currency symbols, parentheses."""
@@ -42,49 +43,29 @@ def parse_amount(value: str):
         m = re.search(r"-?[\d]+(?:\.[\d]+)?", s)
         return float(m.group(0)) if m else 0.0
 
-def parse(bank: str, rows: List[Dict]) -> List[Dict]:
+def parse(bank: str, rows: List[Dict], dates: Optional[DateParser] = None) -> List[Dict]:
     """
     Robust parser for US-style bank/credit-card CSVs.
     Handles flexible headers and multiple date/amount formats.
     """
+    dates = dates or DATE_PARSER.clone()
+    # Date
+    raw_dates = [first(r, HEADERS.date) for r in rows]
+    dates.detect(raw_dates)  # no-op after the first chunk of a file
+
     parsed = []
-    for r in rows:
-        # Date
-        dt_raw = (
-            r.get("Date")
-            or r.get("Transaction Date")
-            or r.get("tx_datetime")
-            or ""
-        )
-        dt = parse_date(dt_raw)
+    for r, dt_raw in zip(rows, raw_dates):
+        dt = dates.parse(dt_raw)
 
         # Amount
-        amount_raw = (
-            r.get("Amount")
-            or r.get("total_amount")
-            or r.get("Value")
-            or "0"
-        )
+        amount_raw = first(r, HEADERS.amount, "0")
         amount = parse_amount(amount_raw)
 
         # Note / description
-        note = (
-            r.get("Description")
-            or r.get("Details")
-            or r.get("Narration")
-            or r.get("note")
-            or ""
-        )
+        note = first(r, HEADERS.note)
 
         # Transaction ID
-        txn_id = (
-            r.get("TransactionID")
-            or r.get("TxnID")
-            or r.get("OrderID")
-            or r.get("RefNo")
-            or r.get("txn_id")
-            or ""
-        )
+        txn_id = first(r, HEADERS.txn_id)
 
         parsed.append({
             "tx_datetime": dt.isoformat() if dt else None,
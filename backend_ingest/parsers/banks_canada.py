@@ -1,31 +1,31 @@
 # robust parser for bank-like CSVs
-from typing import List, Dict
-from datetime import datetime
+from typing import List, Dict, Optional
 import re
 
+from .dates import DateParser
+from .headers import Headers, first
+
+DATE_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S",  # 2025-09-14T10:30:12
+    "%Y-%m-%d",           # 2025-09-14
+    "%d-%m-%Y",           # 14-09-2025
+    "%d/%m/%Y",           # 14/09/2025
+    "%d-%b-%Y",           # 14-Sep-2025
+    "%Y/%m/%d",           # 2025/09/14
+]
+DATE_PARSER = DateParser(DATE_FORMATS)  # shared memo for parse_date()
+
+# header names tried in order for each field (see parsers.headers)
+HEADERS = Headers(
+    date=("Date", "Txn Date", "Transaction Date", "tx_datetime", "timestamp"),
+    amount=("Amount", "Amt", "total_amount", "Value"),
+    note=("Details", "Description", "Narration", "note", "Remarks"),
+    txn_id=("TxnID", "Txn Id", "OrderID", "RefNo", "Ref", "txn_id", "transaction_id"),
+)
+
 def parse_date(value: str):
-    """Try several common date formats and return a datetime or None."""
-    if not value:
-        return None
-    value = str(value).strip()
-    formats = [
-        "%Y-%m-%dT%H:%M:%S",  # 2025-09-14T10:30:12
-        "%Y-%m-%d",           # 2025-09-14
-        "%d-%m-%Y",           # 14-09-2025
-        "%d/%m/%Y",           # 14/09/2025
-        "%d-%b-%Y",           # 14-Sep-2025
-        "%Y/%m/%d",           # 2025/09/14
-    ]
-    for fmt in formats:
-        try:
-            return datetime.strptime(value, fmt)
-        except ValueError:
-            continue
-    # last resort: try fromisoformat
-    try:
-        return datetime.fromisoformat(value)
-    except Exception:
-        return None
+    """Try DATE_FORMATS in order, then fromisoformat; return a datetime or None."""
+    return DATE_PARSER.parse(value)
 
 def parse_amount(value: str):
     """Normalize amount strings to float. Strip commas, currency symbols, parentheses."""
@@ -52,7 +52,7 @@ def parse_amount(value: str):
                 return 0.0
         return 0.0
 
-def parse(bank: str, rows: List[Dict]) -> List[Dict]:
+def parse(bank: str, rows: List[Dict], dates: Optional[DateParser] = None) -> List[Dict]:
     """
     Generic robust parser for bank-like CSVs.
     - bank: string to use as exp_type
@@ -60,50 +60,24 @@ def parse(bank: str, rows: List[Dict]) -> List[Dict]:
     Returns list of dicts with keys: tx_datetime (ISO string or None),
     exp_type, total_amount (float), note (str), txn_id (str)
     """
+    dates = dates or DATE_PARSER.clone()
+    # date field - allow multiple header names
+    raw_dates = [first(r, HEADERS.date) for r in rows]
+    dates.detect(raw_dates)  # no-op after the first chunk of a file
+
     parsed = []
-    for r in rows:
-        # date field - allow multiple header names
-        dt_raw = (
-            r.get("Date")
-            or r.get("Txn Date")
-            or r.get("Transaction Date")
-            or r.get("tx_datetime")
-            or r.get("timestamp")
-            or ""
-        )
-        dt = parse_date(dt_raw)
+    for r, dt_raw in zip(rows, raw_dates):
+        dt = dates.parse(dt_raw)
 
         # amount field - allow multiple header names
-        amount_raw = (
-            r.get("Amount")
-            or r.get("Amt")
-            or r.get("total_amount")
-            or r.get("Value")
-            or "0"
-        )
+        amount_raw = first(r, HEADERS.amount, "0")
         amount = parse_amount(amount_raw)
 
         # note/description
-        note = (
-            r.get("Details")
-            or r.get("Description")
-            or r.get("Narration")
-            or r.get("note")
-            or r.get("Remarks")
-            or ""
-        )
+        note = first(r, HEADERS.note)
 
         # txn id / reference
-        txn_id = (
-            r.get("TxnID")
-            or r.get("Txn Id")
-            or r.get("OrderID")
-            or r.get("RefNo")
-            or r.get("Ref")
-            or r.get("txn_id")
-            or r.get("transaction_id")
-            or ""
-        )
+        txn_id = first(r, HEADERS.txn_id)
 
         parsed.append({
             "tx_datetime": dt.isoformat() if dt else None,
@@ -1,30 +1,30 @@
 # backend_ingest/parsers/bank.py
-from typing import List, Dict
-from datetime import datetime
+from typing import List, Dict, Optional
 import re
 
+from .dates import DateParser
+from .headers import Headers, first
+
+DATE_FORMATS = [
+    "%d-%m-%Y",        # 14-09-2025
+    "%d/%m/%Y",        # 14/09/2025
+    "%Y-%m-%d",        # 2025-09-14
+    "%Y-%m-%dT%H:%M:%S",  # 2025-09-14T10:30:12
+    "%d-%b-%Y",        # 14-Sep-2025
+]
+DATE_PARSER = DateParser(DATE_FORMATS)  # shared memo for parse_date()
+
+# header names tried in order for each field (see parsers.headers)
+HEADERS = Headers(
+    date=("Txn Date", "Transaction Date", "Date", "tx_datetime", "timestamp"),
+    amount=("Amount", "Amt", "total_amount", "Credit", "Debit"),  # sometimes credit/debit separated
+    note=("Description", "Narration", "note", "Remarks"),
+    txn_id=("RefNo", "Ref", "txn_id", "TransactionRef"),
+)
+
 def parse_date(value: str):
-    """Try several common date formats and return a datetime or None."""
-    if not value:
-        return None
-    value = value.strip()
-    formats = [
-        "%d-%m-%Y",        # 14-09-2025
-        "%d/%m/%Y",        # 14/09/2025
-        "%Y-%m-%d",        # 2025-09-14
-        "%Y-%m-%dT%H:%M:%S",  # 2025-09-14T10:30:12
-        "%d-%b-%Y",        # 14-Sep-2025
-    ]
-    for fmt in formats:
-        try:
-            return datetime.strptime(value, fmt)
-        except ValueError:
-            continue
-    # last resort: try to parse simple numeric timestamp or loose iso
-    try:
-        return datetime.fromisoformat(value)
-    except Exception:
-        return None
+    """Try DATE_FORMATS in order, then fromisoformat; return a datetime or None."""
+    return DATE_PARSER.parse(value)
 
 def parse_amount(value: str):
     """Normalize amount strings to float. Strip commas, currency symbols, parentheses."""
@@ -52,7 +52,7 @@ def parse_amount(value: str):
                 return 0.0
         return 0.0
 
-def parse(bank: str, rows: List[Dict]) -> List[Dict]:
+def parse(bank: str, rows: List[Dict], dates: Optional[DateParser] = None) -> List[Dict]:
     """
     Robust bank CSV parser.
     Accepts multiple header names:
@@ -64,47 +64,24 @@ def parse(bank: str, rows: List[Dict]) -> List[Dict]:
       tx_datetime (ISO string or None), exp_type (bank param), total_amount (float),
       note (str), txn_id (str)
     """
+    dates = dates or DATE_PARSER.clone()
+    # possible date fields
+    raw_dates = [first(r, HEADERS.date) for r in rows]
+    dates.detect(raw_dates)  # no-op after the first chunk of a file
+
     parsed = []
-    for r in rows:
-        # possible date fields
-        dt_raw = (
-            r.get("Txn Date")
-            or r.get("Transaction Date")
-            or r.get("Date")
-            or r.get("tx_datetime")
-            or r.get("timestamp")
-            or ""
-        )
-        dt = parse_date(dt_raw)
+    for r, dt_raw in zip(rows, raw_dates):
+        dt = dates.parse(dt_raw)
 
         # possible amount fields
-        amount_raw = (
-            r.get("Amount")
-            or r.get("Amt")
-            or r.get("total_amount")
-            or r.get("Credit")  # sometimes credit/debit separated
-            or r.get("Debit")
-            or "0"
-        )
+        amount_raw = first(r, HEADERS.amount, "0")
         amount = parse_amount(amount_raw)
 
         # note / description
-        note = (
-            r.get("Description")
-            or r.get("Narration")
-            or r.get("note")
-            or r.get("Remarks")
-            or ""
-        )
+        note = first(r, HEADERS.note)
 
         # txn id / reference
-        txn_id = (
-            r.get("RefNo")
-            or r.get("Ref")
-            or r.get("txn_id")
-            or r.get("TransactionRef")
-            or ""
-        )
+        txn_id = first(r, HEADERS.txn_id)
 
         parsed.append({
             "tx_datetime": dt.isoformat() if dt else None,
@@ -0,0 +1,168 @@
+# backend_ingest/parsers/dates.py
+"""
+Shared date parsing for the source parsers.
+
+Each parser keeps its own format list (tried in that order, as before).
+A DateParser compiles every strptime format into a regex + int() path once,
+detects which format a file uses from a sample of its date column and tries
+that one first, falling back to the parser's order (then fromisoformat) only
+for rows that do not match. Repeated date strings are memoised.
+
+    dates = DATE_PARSER.clone()       # the parser module's formats, fresh state
+    dates.detect(raw_values)          # once per file; later calls are no-ops
+    dt = dates.parse("14-09-2025")    # datetime or None
+
+A file whose sample is all ambiguous (e.g. 03/04/2025) keeps the parser's
+order; one that contains 14/09/2025 parses its ambiguous rows day-first too.
+"""
+import re
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# non-empty values inspected by detect()
+SAMPLE_SIZE = 50
+# distinct strings memoised per parser before the memo is reset
+MEMO_SIZE = 10_000
+
+_ABBR_MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+_FULL_MONTHS = ("january", "february", "march", "april", "may", "june", "july",
+                "august", "september", "october", "november", "december")
+_MONTHS = {name: i + 1 for names in (_ABBR_MONTHS, _FULL_MONTHS) for i, name in enumerate(names)}
+
+# strptime directive -> (regex group, datetime() argument position; -1 = month name);
+# the groups are the ones _strptime itself uses, so the same strings match
+_DIRECTIVES = {
+    "Y": (r"(\d\d\d\d)", 0),
+    "m": (r"(1[0-2]|0[1-9]|[1-9])", 1),
+    "d": (r"(3[01]|[12]\d|0[1-9]|[1-9]| [1-9])", 2),
+    "H": (r"(2[0-3]|[0-1]\d|\d)", 3),
+    "M": (r"([0-5]\d|\d)", 4),
+    "S": (r"(6[0-1]|[0-5]\d|\d)", 5),
+    "b": ("(" + "|".join(_ABBR_MONTHS) + ")", -1),  # abbreviations only, like strptime
+    "B": ("(" + "|".join(_FULL_MONTHS) + ")", -1),  # full names only
+}
+_DEFAULTS = (1900, 1, 1, 0, 0, 0)
+
+Converter = Callable[[str], Optional[datetime]]
+
+
+def _strptime(fmt: str) -> Converter:
+    def convert(value: str) -> Optional[datetime]:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            return None
+    return convert
+
+
+def compile_format(fmt: str) -> Converter:
+    """
+    value -> datetime or None, equivalent to datetime.strptime(value, fmt)
+    for the directives in _DIRECTIVES; other formats use strptime itself.
+    """
+    pattern: List[str] = []
+    positions: List[int] = []
+    i = 0
+    while i < len(fmt):
+        ch = fmt[i]
+        if ch == "%" and i + 1 < len(fmt):
+            directive = _DIRECTIVES.get(fmt[i + 1])
+            if directive is None:
+                return _strptime(fmt)
+            pattern.append(directive[0])
+            positions.append(directive[1])
+            i += 2
+        else:
+            pattern.append(r"\s+" if ch.isspace() else re.escape(ch))
+            i += 1
+    match = re.compile("".join(pattern), re.IGNORECASE).fullmatch  # strptime ignores case too
+    fields = tuple(enumerate(positions))
+
+    def convert(value: str) -> Optional[datetime]:
+        m = match(value)
+        if m is None:
+            return None
+        groups = m.groups()
+        parts = list(_DEFAULTS)
+        for g, pos in fields:
+            if pos < 0:
+                month = _MONTHS.get(groups[g].lower())
+                if month is None:
+                    return None
+                parts[1] = month
+            else:
+                parts[pos] = int(groups[g])  # int() also takes %d's " 5"
+        try:
+            return datetime(*parts)
+        except ValueError:  # e.g. 31-02-2025
+            return None
+    return convert
+
+
+class DateParser:
+    def __init__(self, formats: Sequence[str], iso_fallback: bool = True, sample_size: int = SAMPLE_SIZE):
+        self.formats = list(formats)
+        self.iso_fallback = iso_fallback
+        self.sample_size = sample_size
+        self._compiled: List[Tuple[str, Converter]] = [(fmt, compile_format(fmt)) for fmt in self.formats]
+        self._order = self._compiled
+        self._sampled = False
+        self._memo: Dict[str, Optional[datetime]] = {}
+        self.detected: Optional[str] = None  # winning format after detect()
+
+    def clone(self) -> "DateParser":
+        """Same formats and settings, no detected format or memo (one per file)."""
+        return DateParser(self.formats, self.iso_fallback, self.sample_size)
+
+    def detect(self, values: Iterable[Optional[str]]) -> Optional[str]:
+        """
+        Pick the format matching most of the first sample_size non-empty
+        values (ties go to the earlier format) and try it first from now on.
+        Only the first call with a non-empty sample has an effect.
+        """
+        if self._sampled:
+            return self.detected
+        sample = list(islice((str(v).strip() for v in values if v and str(v).strip()), self.sample_size))
+        if not sample:
+            return None
+        self._sampled = True
+        best, best_hits = None, 0
+        for entry in self._compiled:
+            hits = sum(1 for v in sample if entry[1](v) is not None)
+            if hits > best_hits:
+                best, best_hits = entry, hits
+        if best is not None:
+            self.detected = best[0]
+            self._order = [best] + [e for e in self._compiled if e is not best]
+            self._memo.clear()  # memoised values may have been parsed in the old order
+        return self.detected
+
+    def parse(self, value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            return self._memo[value]
+        except KeyError:
+            pass
+        s = str(value).strip()
+        dt = None
+        for _, convert in self._order:
+            dt = convert(s)
+            if dt is not None:
+                break
+        else:
+            if self.iso_fallback:
+                try:
+                    dt = datetime.fromisoformat(s)
+                except ValueError:
+                    dt = None
+        if len(self._memo) >= MEMO_SIZE:
+            self._memo.clear()
+        self._memo[value] = dt
+        return dt
+
+    def isoformat(self, value: Optional[str]) -> Optional[str]:
+        """parse(value).isoformat(), or None."""
+        dt = self.parse(value)
+        return dt.isoformat() if dt else None
@@ -1,6 +1,8 @@
 # backend_ingest/parsers/generic.py
-from typing import List, Dict
-from datetime import datetime
+from typing import List, Dict, Optional
+
+from .dates import DateParser
+from .headers import Headers, first
 
 # expanded keywords set (include coffee/cafe)
 GROCERY_KEYWORDS = {
@@ -13,57 +15,63 @@ ITEM_KEYWORDS = {
 
 DATE_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d/%b/%Y"]
 
+DATE_PARSER = DateParser(DATE_FORMATS)  # shared memo for _parse_date()
+
+# header names tried in order for each field (see parsers.headers)
+HEADERS = Headers(
+    date=("Date", "date", "Txn Date"),
+    amount=("Amount", "amount"),
+    note=("Description", "Desc", "note"),
+    txn_id=("TxnID", "RefNo"),
+)
+
 def _parse_date(s: str):
-    if not s:
-        return None
-    s = s.strip()
-    for fmt in DATE_FORMATS:
-        try:
-            return datetime.strptime(s, fmt)
-        except Exception:
-            continue
-    # fallback: try iso
+    return DATE_PARSER.parse(s)
+
+def parse_amount(value) -> float:
     try:
-        return datetime.fromisoformat(s)
+        # keep sign so refunds (-1200) remain negative
+        return float(str(value).replace(",", "") or 0.0)
     except Exception:
-        return None
+        return 0.0
 
-def parse(rows: List[Dict]) -> List[Dict]:
-    parsed = []
-    for r in rows:
-        date_raw = (r.get("Date") or r.get("date") or r.get("Txn Date") or "").strip()
-        tx_dt = _parse_date(date_raw)
-        desc = (r.get("Description") or r.get("Desc") or r.get("note") or "").strip()
-        amt_raw = r.get("Amount") or r.get("amount") or "0"
-        try:
-            # keep sign so refunds (-1200) remain negative
-            amt = float(str(amt_raw).replace(",", "") or 0.0)
-        except Exception:
-            amt = 0.0
-
-        # naive exp_type detection
-        exp_type = "misc"
-        low_desc = desc.lower()
-
-        # If item keywords found, tag item-specific exp_type
-        for k in ITEM_KEYWORDS:
+def classify(desc: str) -> str:
+    """naive exp_type detection from a (stripped) description"""
+    exp_type = "misc"
+    low_desc = desc.lower()
+
+    # If item keywords found, tag item-specific exp_type
+    for k in ITEM_KEYWORDS:
+        if k in low_desc:
+            exp_type = "coffee" if k in {"coffee", "cafe", "starbucks"} else "misc"
+            break
+
+    # fallback grocery mapping
+    if exp_type == "misc":
+        for k in GROCERY_KEYWORDS:
             if k in low_desc:
-                exp_type = "coffee" if k in {"coffee", "cafe", "starbucks"} else "misc"
+                exp_type = "groceries"
                 break
+    return exp_type
 
-        # fallback grocery mapping
-        if exp_type == "misc":
-            for k in GROCERY_KEYWORDS:
-                if k in low_desc:
-                    exp_type = "groceries"
-                    break
+def parse(rows: List[Dict], dates: Optional[DateParser] = None) -> List[Dict]:
+    dates = dates or DATE_PARSER.clone()
+    raw_dates = [first(r, HEADERS.date).strip() for r in rows]
+    dates.detect(raw_dates)  # no-op after the first chunk of a file
+
+    parsed = []
+    for r, date_raw in zip(rows, raw_dates):
+        tx_dt = dates.parse(date_raw)
+        desc = first(r, HEADERS.note).strip()
+        amt = parse_amount(first(r, HEADERS.amount, "0"))
+        exp_type = classify(desc)
 
         parsed.append({
             "tx_datetime": tx_dt.isoformat() if tx_dt else None,
             "exp_type": exp_type,
             "total_amount": amt,
             "note": desc,
-            "txn_id": r.get("TxnID") or r.get("RefNo") or ""
+            "txn_id": first(r, HEADERS.txn_id)
         })
     return parsed
 
@@ -1,35 +1,47 @@
-from typing import List, Dict
-from datetime import datetime
+from typing import List, Dict, Optional
+
+from .dates import DateParser
+from .headers import Headers, first
+
+# strptime formats, tried in order (no fromisoformat fallback)
+DATE_FORMATS = ("%d-%m-%Y", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+DATE_PARSER = DateParser(DATE_FORMATS, iso_fallback=False)  # shared memo for parse_date()
+
+# header names tried in order for each field (see parsers.headers)
+HEADERS = Headers(
+    date=("Date", "tx_datetime"),
+    amount=("Amount", "total_amount"),
+    note=("Merchant", "Description", "note"),
+    txn_id=("TxnID", "txn_id"),
+)
 
 def parse_date(value: str):
-    """Try multiple date formats to be more flexible."""
-    if not value:
-        return None
-    for fmt in ("%d-%m-%Y", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
-        try:
-            return datetime.strptime(value.strip(), fmt)
-        except ValueError:
-            continue
-    return None
-
-def parse(rows: List[Dict]) -> List[Dict]:
+    """Try DATE_FORMATS in order; return a datetime or None."""
+    return DATE_PARSER.parse(value)
+
+def parse_amount(value) -> float:
+    try:
+        return float(value)
+    except Exception:
+        return 0.0
+
+def parse(rows: List[Dict], dates: Optional[DateParser] = None) -> List[Dict]:
+    dates = dates or DATE_PARSER.clone()
+    # handle multiple possible column names
+    raw_dates = [first(r, HEADERS.date) for r in rows]
+    dates.detect(raw_dates)  # no-op after the first chunk of a file
+
     parsed = []
-    for r in rows:
-        # handle multiple possible column names
-        dt_raw = r.get("Date") or r.get("tx_datetime") or ""
-        dt = parse_date(dt_raw)
+    for r, dt_raw in zip(rows, raw_dates):
+        dt = dates.parse(dt_raw)
 
-        amount_str = r.get("Amount") or r.get("total_amount") or "0"
-        try:
-            amount = float(amount_str)
-        except Exception:
-            amount = 0.0
+        amount = parse_amount(first(r, HEADERS.amount, "0"))
 
         parsed.append({
             "tx_datetime": dt.isoformat() if dt else None,
             "exp_type": "gpay",
             "total_amount": amount,
-            "note": r.get("Merchant") or r.get("Description") or r.get("note") or "",
-            "txn_id": r.get("TxnID") or r.get("txn_id") or ""
+            "note": first(r, HEADERS.note),
+            "txn_id": first(r, HEADERS.txn_id)
         })
     return parsed
@@ -0,0 +1,26 @@
+# backend_ingest/parsers/headers.py
+"""
+CSV header names per field, declared once per parser as HEADERS.
+
+Each parser reads a field with first(r, HEADERS.note): the first truthy
+value among the named columns, like `r.get(a) or r.get(b) or default`, so
+the headers a source understands are listed in one place instead of being
+spread over its row loop.
+"""
+from typing import Dict, NamedTuple, Optional, Sequence
+
+
+class Headers(NamedTuple):
+    date: Sequence[str]
+    amount: Sequence[str]
+    note: Sequence[str]
+    txn_id: Sequence[str]
+
+
+def first(row: Dict[str, Optional[str]], names: Sequence[str], default: str = "") -> str:
+    """The first truthy row[name] among names, else default."""
+    for name in names:
+        value = row.get(name)
+        if value:
+            return value
+    return default
@@ -1,109 +1,25 @@
 # backend_ingest/parsers/intent.py
 import re
-import time
 from datetime import datetime
-from typing import Optional, Dict, Any, Set, Iterable
-import sqlite3
-import string
+from typing import Optional, Dict, Any
 
-# adjust import path to your DB helper
-from backend_expenses.database import get_conn
+from backend_expenses import vocab
 
-# Static seed keywords you want always present
-STATIC_SEED = {"coffee", "cafe", "starbuck", "starbucks", "tea", "latte", "espresso", "chai", "beer", "wine"}
+# keyword set / matcher / cache live with the persisted vocabulary (backend_expenses.vocab),
+# where the chat planner uses them too
+STATIC_SEED = vocab.STATIC_SEED
+KeywordMatcher = vocab.KeywordMatcher
+_KEYWORD_CACHE = vocab._KEYWORD_CACHE
+build_dynamic_keywords_from_db = vocab.load_keywords
 
-# Minimal stopwords / tokens to ignore when building dynamic keywords
-_STOPWORDS = {
-    "the", "and", "for", "with", "from", "to", "on", "in", "at", "by", "of", "a", "an", "txn", "gpay", "upi", "pay",
-    "paytm", "google", "amazon", "order", "online", "cash", "debit", "credit"
-}
+# tokenising / stopwords are shared with the persisted vocabulary
+_STOPWORDS = vocab.STOPWORDS
+_tokenize = vocab.tokenize
+_is_valid_token = vocab.is_valid_token
 
-# caching dynamic keywords for performance
-_KEYWORD_CACHE: Dict[str, Any] = {
-    "keywords": set(STATIC_SEED),
-    "updated_at": 0.0,
-    "ttl": 300  # seconds; refresh every 5 minutes (tune as needed)
-}
 
-# tokenization helpers
-_TOKEN_RE = re.compile(r"[A-Za-z0-9]+")  # grab alphanumeric words
-
-def _tokenize(text: str) -> Iterable[str]:
-    if not text:
-        return ()
-    # extract alphanumeric tokens only, lowercase
-    return (tok.lower() for tok in _TOKEN_RE.findall(text or ""))
-
-def _is_valid_token(tok: str) -> bool:
-    if not tok:
-        return False
-    if tok in _STOPWORDS:
-        return False
-    if len(tok) < 3:  # ignore tiny tokens like 'is','to','on' — tune if needed
-        return False
-    # ignore pure-numeric tokens (txn ids, amounts)
-    if tok.isdigit():
-        return False
-    return True
-
-def build_dynamic_keywords_from_db(conn: sqlite3.Connection) -> Set[str]:
-    """
-    Query distinct note, source, exp_type from `expenses` and extract candidate tokens.
-    Returns a set of lowercased words merged with STATIC_SEED.
-    """
-    kws = set(STATIC_SEED)
-    cur = conn.cursor()
-
-    # Query distinct values for the three columns; use COALESCE to avoid NULL
-    try:
-        # Use a union of distinct columns
-        cur.execute("""
-            SELECT DISTINCT note as val FROM expenses
-            UNION
-            SELECT DISTINCT source FROM expenses
-            UNION
-            SELECT DISTINCT exp_type FROM expenses
-        """)
-    except Exception:
-        # Fallback to three separate queries if UNION unsupported for some reason
-        try:
-            cur.execute("SELECT DISTINCT note FROM expenses")
-            rows = cur.fetchall()
-        except Exception:
-            rows = []
-        # process rows below
-        values = [r[0] for r in rows if r and r[0]]
-    else:
-        rows = cur.fetchall()
-        values = [r[0] for r in rows if r and r[0]]
-
-    for v in values:
-        # strip punctuation at ends, then tokenize
-        # tokenization already pulls alphanumerics only
-        for tok in _tokenize(str(v)):
-            if _is_valid_token(tok):
-                kws.add(tok)
-
-    return kws
-
-def _refresh_keyword_cache_if_needed() -> Set[str]:
-    now = time.time()
-    ttl = _KEYWORD_CACHE.get("ttl", 300)
-    if (now - _KEYWORD_CACHE.get("updated_at", 0)) < ttl and _KEYWORD_CACHE.get("keywords"):
-        return _KEYWORD_CACHE["keywords"]
-
-    # refresh from DB
-    try:
-        conn = get_conn()
-        kws = build_dynamic_keywords_from_db(conn)
-        conn.close()
-    except Exception:
-        # if DB read fails, fall back to static seed
-        kws = set(STATIC_SEED)
-
-    _KEYWORD_CACHE["keywords"] = kws
-    _KEYWORD_CACHE["updated_at"] = now
-    return kws
+def _refresh_keyword_cache_if_needed() -> KeywordMatcher:
+    return _KEYWORD_CACHE.get()
 
 # high-level detection function
 def detect_item_month_query(text: str) -> Optional[Dict[str, Any]]:
@@ -148,10 +64,10 @@ def detect_item_month_query(text: str) -> Optional[Dict[str, Any]]:
         candidate = m2.group(1).strip().split()[0]
         if candidate in keywords:
             return {"keyword": candidate, "year": default_year, "month": default_month}
-        # try to find any keyword substring
-        for k in keywords:
-            if k in candidate:
-                return {"keyword": k, "year": default_year, "month": default_month}
+        # try to find any keyword substring (longest wins)
+        k = keywords.find(candidate)
+        if k:
+            return {"keyword": k, "year": default_year, "month": default_month}
         return {"keyword": candidate, "year": default_year, "month": default_month}
 
     # pattern 3: "coffee this month" short form
@@ -179,22 +95,19 @@ def detect_item_month_query(text: str) -> Optional[Dict[str, Any]]:
             except Exception:
                 mnum = default_month
         # find keyword from text
-        for k in keywords:
-            if k in s:
-                return {"keyword": k, "year": year, "month": mnum}
-        return {"keyword": None, "year": year, "month": mnum}
+        return {"keyword": keywords.find(s), "year": year, "month": mnum}
 
     # pattern 5: last month
     if re.search(r"\blast month\b", s):
         # choose keyword from text if present
-        for k in keywords:
-            if k in s:
-                # compute last month
-                y = default_year
-                mnum = default_month - 1
-                if mnum == 0:
-                    mnum = 12
-                    y -= 1
-                return {"keyword": k, "year": y, "month": mnum}
+        k = keywords.find(s)
+        if k:
+            # compute last month
+            y = default_year
+            mnum = default_month - 1
+            if mnum == 0:
+                mnum = 12
+                y -= 1
+            return {"keyword": k, "year": y, "month": mnum}
 
     return None
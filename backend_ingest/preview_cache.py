@@ -0,0 +1,94 @@
+# backend_ingest/preview_cache.py
+"""
+Server-side cache of parsed CSV previews.
+
+Import.tsx posts the file to /preview_csv, sends the parsed rows to
+/dedupe_preview and then uploads the same file to /upload_csv. preview_csv
+now returns a token (sha256 of source + file bytes) for the parsed rows kept
+here, so dedupe_preview and upload_csv can reuse them instead of receiving
+and parsing the file again.
+
+Entries expire after TTL seconds and the cache is bounded by number of
+entries and total cached rows (least recently used evicted first).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+TTL_SEC = float(os.environ.get("PREVIEW_CACHE_TTL_SEC", 600))
+MAX_ENTRIES = int(os.environ.get("PREVIEW_CACHE_MAX_ENTRIES", 32))
+MAX_ROWS = int(os.environ.get("PREVIEW_CACHE_MAX_ROWS", 500_000))
+
+
+class HashingReader:
+    """Wrap a binary file object and hash everything read through it."""
+
+    def __init__(self, raw: BinaryIO, source: str):
+        self._raw = raw
+        self._hash = hashlib.sha256(source.lower().encode("utf-8") + b"\0")
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._raw.read(size)
+        self._hash.update(data)
+        return data
+
+    def token(self) -> str:
+        return self._hash.hexdigest()
+
+
+class PreviewCache:
+    def __init__(self, ttl: float = TTL_SEC, max_entries: int = MAX_ENTRIES, max_rows: int = MAX_ROWS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries: "OrderedDict[str, Tuple[float, str, List[Dict[str, Any]]]]" = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, token: str) -> None:
+        _, _, rows = self._entries.pop(token)
+        self._rows -= len(rows)
+
+    def put(self, token: str, source: str, rows: List[Dict[str, Any]]) -> bool:
+        """Cache parsed rows under token; returns False if they are too large to keep."""
+        if len(rows) > self.max_rows:
+            return False
+        with self._lock:
+            if token in self._entries:
+                self._drop(token)
+            self._entries[token] = (time.time() + self.ttl, source.lower(), rows)
+            self._rows += len(rows)
+            while self._entries and (len(self._entries) > self.max_entries or self._rows > self.max_rows):
+                self._drop(next(iter(self._entries)))
+        return True
+
+    def get(self, token: str, source: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Parsed rows for token (and source, if given) or None when unknown/expired."""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[0] < time.time():
+                self._drop(token)
+                entry = None
+            if entry is None or (source is not None and entry[1] != source.lower()):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[2]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+cache = PreviewCache()
@@ -0,0 +1,77 @@
+# backend_ingest/streaming.py
+"""
+Incremental CSV reading for large uploads.
+
+Instead of `await file.read()` + decode + `list(csv.DictReader(...))`, the
+upload is decoded chunk by chunk, rows are handed to the source parser as a
+generator and the caller consumes parsed records in bounded batches, so peak
+memory does not grow with the size of the file.
+"""
+import codecs
+import csv
+import os
+from itertools import islice
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List
+
+# bytes read from the upload per chunk
+READ_CHUNK_BYTES = int(os.environ.get("INGEST_READ_CHUNK_BYTES", 64 * 1024))
+# parsed rows handled (parsed + inserted) per batch
+BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 1000))
+
+
+class ParseError(Exception):
+    """Raised while streaming when the upload itself cannot be decoded/parsed (vs. a DB failure)."""
+
+
+def iter_text_lines(raw: BinaryIO, chunk_size: int = READ_CHUNK_BYTES) -> Iterator[str]:
+    """
+    Decode a binary file object as UTF-8 (ignoring bad bytes) in fixed-size chunks
+    and yield complete lines, newline included, like iterating io.StringIO would.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    tail = ""
+    while True:
+        chunk = raw.read(chunk_size)
+        final = not chunk
+        text = tail + decoder.decode(chunk or b"", final=final)
+        lines = text.split("\n")
+        # last piece has no newline yet; keep it for the next chunk
+        tail = lines.pop()
+        for line in lines:
+            yield line + "\n"
+        if final:
+            break
+    if tail:
+        yield tail
+
+
+def iter_csv_rows(raw: BinaryIO, chunk_size: int = READ_CHUNK_BYTES) -> Iterator[Dict[str, Any]]:
+    """Yield csv.DictReader rows from a binary file object without reading it whole."""
+    return iter(csv.DictReader(iter_text_lines(raw, chunk_size)))
+
+
+def batched(items: Iterable[Any], size: int = BATCH_SIZE) -> Iterator[List[Any]]:
+    """Group an iterable into lists of at most `size` items."""
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_guard(records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Re-raise anything thrown while pulling parsed records as ParseError.
+    Parsing now happens lazily between inserts, so endpoints use this to keep
+    reporting bad files as 400s and DB failures as 500s.
+    """
+    it = iter(records)
+    while True:
+        try:
+            rec = next(it)
+        except StopIteration:
+            return
+        except Exception as e:
+            raise ParseError(str(e)) from e
+        yield rec
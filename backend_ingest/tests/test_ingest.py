@@ -11,3 +11,186 @@ def test_preview_generic():
     data = r.json()
     assert "parsed" in data
     assert data["parsed"][0]["total_amount"] == 123.45
+
+def test_streaming_lines_split_multibyte_chunks():
+    import io
+    from backend_ingest import streaming
+    raw = io.BytesIO("Date,Amount,Description\n2025-09-01,₹10,café\n2025-09-02,20,tea".encode("utf-8"))
+    rows = list(streaming.iter_csv_rows(raw, chunk_size=3))
+    assert [r["Description"] for r in rows] == ["café", "tea"]
+    assert [len(b) for b in streaming.batched(range(5), 2)] == [2, 2, 1]
+
+def test_worker_pool_rejects_past_queue_depth(monkeypatch):
+    import threading
+    import time
+    import pytest
+    from backend_ingest import workers
+    monkeypatch.setattr(workers, "MAX_WORKERS", 1)
+    monkeypatch.setattr(workers, "MAX_QUEUE_DEPTH", 0)
+    gate = threading.Event()
+    fut = workers.submit(gate.wait)
+    with pytest.raises(workers.QueueFull):
+        workers.submit(lambda: None)
+    gate.set()
+    fut.result(timeout=5)
+    deadline = time.time() + 5
+    while workers.stats()["in_flight"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert client.get("/ingest_stats").json()["in_flight"] == 0
+
+def test_background_import_status_and_cancel():
+    import time
+    csv_content = "Date,Amount,Narration,OrderID\n" + "".join(
+        f"0{d}/09/2025,{d}00.00,Order {d},BG-{d}\n" for d in range(1, 6)
+    )
+    files = {"file": ("paytm.csv", csv_content, "text/csv")}
+    r = client.post("/upload_csv", data={"source": "paytm", "background": "true"}, files=files)
+    assert r.status_code == 200
+    batch_id = r.json()["batch_id"]
+
+    deadline = time.time() + 5
+    while True:
+        status = client.get(f"/import_status/{batch_id}").json()
+        if status["status"] not in ("queued", "running") or time.time() > deadline:
+            break
+        time.sleep(0.02)
+    assert status["status"] == "done"
+    assert status["rows_inserted"] == 5
+
+    r = client.delete(f"/cancel_import/{batch_id}")
+    assert r.json() == {"batch_id": batch_id, "status": "cancelled", "deleted": 5}
+    assert client.get("/import_status/unknown").status_code == 404
+
+def test_preview_token_reused_by_dedupe_and_upload():
+    csv_content = "Date,Amount,Description\n2025-09-03,42.00,Token reuse\n"
+    files = {"file": ("t.csv", csv_content, "text/csv")}
+    token = client.post("/preview_csv", data={"source": "generic"}, files=files).json()["token"]
+    assert token
+
+    ded = client.post(f"/dedupe_preview?token={token}")
+    assert ded.status_code == 200
+    assert ded.json()["results"][0]["incoming"]["note"] == "Token reuse"
+
+    r = client.post("/upload_csv", data={"source": "generic", "token": token})
+    assert r.status_code == 200
+    assert r.json()["imported"] == 1
+    assert client.post("/upload_csv", data={"source": "generic", "token": "nope"}).status_code == 410
+
+def test_dedupe_preview_buckets_by_amount_and_date_window(add_expenses):
+    add_expenses({"tx_datetime": "2019-01-05T09:00:00", "exp_type": "misc", "total_amount": 731.4,
+                  "note": "Dedupe Bucket Vendor"})
+    incoming = [{"tx_datetime": "2025-09-01T00:00:00", "total_amount": 731.9, "note": "dedupe bucket vendor!"}]
+
+    found = client.post("/dedupe_preview", json=incoming).json()["results"][0]["candidates"]
+    assert [c["existing"]["note"] for c in found] == ["Dedupe Bucket Vendor"]
+
+    windowed = client.post("/dedupe_preview?date_window_days=30", json=incoming).json()
+    assert windowed["results"][0]["candidates"] == []
+
+
+def test_find_duplicates_clusters_and_incremental_rerun(add_expenses):
+    client.get("/find_duplicates?full=true")
+
+    def add(tx, amount, note, source="dup-src", txn_id=None):
+        [expense_id] = add_expenses({"tx_datetime": tx, "exp_type": "misc", "total_amount": amount, "note": note,
+                                     "source": source, "txn_id": txn_id})
+        return expense_id
+
+    a = add("2018-03-01T10:00:00", 4321.5, "Cluster Cafe")
+    b = add("2018-03-01 18:30:00", 4321.5, "something else")  # same source/amount/day
+    c = add("2018-03-03T08:00:00", 4321.9, "cluster cafe #2")  # fuzzy note, 2 days later
+    d = add("2018-06-01T00:00:00", 1.25, "x", txn_id="DUP-TXN-1")
+    e = add("2018-07-01T00:00:00", 99.0, "y", txn_id="DUP-TXN-1")
+
+    res = client.get("/find_duplicates?limit=100000").json()
+    assert res["mode"] == "incremental"
+    assert res["scanned"] == 5
+    by_id = {c_["cluster_id"]: c_ for c_ in res["clusters"]}
+    assert by_id[a]["expense_ids"] == [a, b, c]
+    assert by_id[d]["expense_ids"] == [d, e]
+    assert by_id[d]["reasons"] == ["txn_id"]
+
+    full = client.get("/find_duplicates?full=true&limit=100000").json()
+    assert full["mode"] == "full"
+    assert {tuple(c_["expense_ids"]) for c_ in full["clusters"]} >= {(a, b, c), (d, e)}
+    assert client.get("/find_duplicates").json()["scanned"] == 0
+
+
+def test_upload_csv_upsert_is_idempotent():
+    def upload(body, mode="upsert"):
+        files = {"file": ("paytm.csv", "Date,Amount,Narration,OrderID\n" + body, "text/csv")}
+        r = client.post("/upload_csv", data={"source": "paytm", "mode": mode}, files=files)
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    body = "01/02/2017,10.00,Upsert A,UPS-1\n02/02/2017,20.00,Upsert B,UPS-2\n" \
+           "03/02/2017,5.00,Upsert same,\n03/02/2017,5.00,Upsert same,\n"
+    first = upload(body)
+    assert (first["rows_inserted"], first["rows_updated"], first["rows_skipped"]) == (4, 0, 0)
+
+    again = upload(body.replace("20.00", "25.00") + "04/02/2017,30.00,Upsert C,UPS-3\n")
+    assert (again["rows_inserted"], again["rows_updated"], again["rows_skipped"]) == (1, 1, 3)
+
+    assert upload(body, mode="append")["rows_inserted"] == 4
+    r = client.post("/query_amount", json={"keyword": "Upsert C", "start": "2017", "end": "2017-02"}).json()
+    assert (r["start"], r["end"], r["total"], r["tx_count"]) == ("2017-01-01", "2017-03-01", 30.0, 1)
+    assert client.post("/query_amount", json={"keyword": "x", "start": "someday"}).status_code == 400
+    files = {"file": ("paytm.csv", "Date,Amount\n", "text/csv")}
+    assert client.post("/upload_csv", data={"source": "paytm", "mode": "merge"}, files=files).status_code == 400
+
+def test_date_parser_detects_format_per_file_and_matches_strptime():
+    from datetime import datetime
+    from backend_ingest import parsers
+    from backend_ingest.parsers.dates import compile_format
+
+    # every bank format, plus %B, against strptime on valid, variant and malformed values
+    sources = ("generic", "gpay", "paytm", "phonepe", "sbi", "chase", "td", "amazon")
+    formats = {fmt for source in sources for fmt in parsers._module(source).DATE_FORMATS}
+    samples = [datetime(2025, 9, 4, 7, 5, 3), datetime(2024, 2, 29, 23, 59, 59), datetime(2025, 12, 31)]
+    for fmt in sorted(formats | {"%d %B %Y"}):
+        convert = compile_format(fmt)
+        values = {"x", "", "31/02/2025", "2025-02-30", "05 Sep 2025", "05 sept 2025", "00-09-2025",
+                  "14-SEP-2025", "2025-09-14t10:30:12", "2025-09-14T10:30:60", "09/ 5/2025", "2025-9-4T7:5:3"}
+        for dt in samples:
+            value = dt.strftime(fmt)
+            values |= {value, value.lower(), value.upper(), value + " ", value + "0", value.replace("0", "", 1)}
+        for value in values:
+            try:
+                expected = datetime.strptime(value, fmt)
+            except ValueError:
+                expected = None
+            assert convert(value) == expected, (fmt, value)
+
+    # US parser order is month-first; a day-first file is detected from its first chunk
+    rows = [{"Date": "14/09/2025", "Amount": "1"}, {"Date": "03/04/2025", "Amount": "2"}, {"Date": "2025-01-05", "Amount": "3"}]
+    out = list(parsers.iter_parse_rows("chase", rows, batch_size=1))
+    assert [r["tx_datetime"] for r in out] == ["2025-09-14T00:00:00", "2025-04-03T00:00:00", "2025-01-05T00:00:00"]
+    # a file of only ambiguous dates keeps the parser's order
+    assert parsers.parse_rows("chase", [{"Date": "03/04/2025"}])[0]["tx_datetime"] == "2025-03-04T00:00:00"
+
+def test_parsers_read_fields_through_their_headers():
+    from backend_ingest import parsers
+
+    for source in ("generic", "gpay", "paytm", "phonepe", "sbi", "chase", "td", "amazon"):
+        headers = parsers._module(source).HEADERS
+        # first header empty, second filled: the parser falls through to the second
+        row = {name: "" for names in headers for name in names}
+        row.update({headers.amount[1]: "12", headers.note[1]: "coffee", headers.txn_id[1]: "T9"})
+        row[headers.date[1]] = "2025-09-14"
+        out = parsers.parse_rows(source, [row])[0]
+        assert (out["total_amount"], out["note"], out["txn_id"]) == (12.0, "coffee", "T9"), source
+        assert out["tx_datetime"].startswith("2025-09-14"), source
+
+def test_keyword_matcher_prefers_longest_then_leftmost(monkeypatch):
+    from backend_ingest.parsers import intent
+
+    matcher = intent.KeywordMatcher(["tea", "steak", "coffee", "cafe", ""])
+    assert matcher.find("steak and coffee") == "coffee"  # longest beats earlier
+    assert matcher.find("cafe tea") == "cafe"
+    assert matcher.find("green tea at the cafe") == "cafe"
+    assert matcher.find("nothing") is None
+    assert "tea" in matcher and len(matcher) == 4
+
+    monkeypatch.setattr(intent._KEYWORD_CACHE, "get", lambda: matcher)
+    q = intent.detect_item_month_query("steak and coffee last month")
+    assert q["keyword"] == "coffee"
@@ -0,0 +1,57 @@
+# backend_ingest/workers.py
+"""
+Bounded worker pool for heavy ingest work (CSV parsing + sqlite3 writes).
+
+The upload endpoints are `async def`; running parsers.parse_rows and blocking
+sqlite3 calls inline would freeze the event loop (and every other request,
+health check included). Work is handed to a small ThreadPoolExecutor instead,
+with a cap on how many jobs may be running or waiting at once so a burst of
+large uploads is rejected early rather than queueing without bound.
+
+Threads (not processes) are used because the jobs read the spooled upload
+file and share the DB helpers; sqlite3 releases the GIL while it works.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+MAX_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+# jobs allowed to wait for a free worker on top of the running ones
+MAX_QUEUE_DEPTH = int(os.environ.get("INGEST_QUEUE_DEPTH", 8))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="ingest-worker")
+_lock = threading.Lock()
+_in_flight = 0
+
+
+class QueueFull(Exception):
+    """Raised when MAX_WORKERS + MAX_QUEUE_DEPTH jobs are already in flight."""
+
+
+def _release(_fut: Future) -> None:
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+
+
+def submit(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """Schedule fn on the ingest pool; raises QueueFull instead of queueing past the limit."""
+    global _in_flight
+    with _lock:
+        if _in_flight >= MAX_WORKERS + MAX_QUEUE_DEPTH:
+            raise QueueFull(f"ingest queue is full ({_in_flight} jobs in flight)")
+        _in_flight += 1
+    try:
+        fut = _executor.submit(fn, *args, **kwargs)
+    except Exception:
+        _release(None)
+        raise
+    fut.add_done_callback(_release)
+    return fut
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        in_flight = _in_flight
+    return {"workers": MAX_WORKERS, "queue_depth_limit": MAX_QUEUE_DEPTH, "in_flight": in_flight}
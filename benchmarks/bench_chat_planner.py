@@ -0,0 +1,86 @@
+# benchmarks/bench_chat_planner.py
+"""
+Chat planning / execution latency over a corpus of typical questions (backend_expenses.chat_planner).
+
+    FINANCE_DB=/tmp/copy.db python -m benchmarks.bench_chat_planner [--repeat 200]
+
+Prints per-message plan time uncached (cache cleared each pass) and cached,
+then execute() time per intent against FINANCE_DB. Point FINANCE_DB at a
+copy of a real database; the benchmark only reads.
+"""
+import argparse
+import time
+from collections import defaultdict
+from datetime import date
+
+from backend_expenses import chat_planner
+from backend_expenses.database import get_conn
+
+CORPUS = [
+    "How much did I spend on coffee this month?",
+    "how much did i spend this month",
+    "what did i spend on groceries last month",
+    "total spent on uber in sep 2025",
+    "coffee last month",
+    "how much on starbucks coffee at the airport yesterday",
+    "What's my total this week?",
+    "spent on dining today",
+    "how much did I spend on swiggy in march",
+    "total spend 2025-07",
+    "show expenses by category",
+    "category summary for last month",
+    "top 5 merchants",
+    "top merchants this year",
+    "large transactions",
+    "transactions above ₹2,500 this month",
+    "anything over 10000 last year?",
+    "hello there",
+    "can you help me budget",
+]
+
+
+def _per_call_us(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / (repeat * len(CORPUS)) * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+    today = date.today()
+
+    def plan_all(clear: bool):
+        def run():
+            if clear:
+                chat_planner._plan.cache_clear()
+            for text in CORPUS:
+                chat_planner.plan(text, today)
+        return run
+
+    cold = _per_call_us(plan_all(True), args.repeat)
+    warm = _per_call_us(plan_all(False), args.repeat)
+    print(f"plan  uncached {cold:7.1f} us/msg  cached {warm:7.1f} us/msg  ({len(CORPUS)} messages)")
+
+    conn = get_conn()
+    try:
+        timings = defaultdict(list)
+        for text in CORPUS:
+            p = chat_planner.plan(text, today)
+            if not p.intent:
+                continue
+            repeat = max(1, args.repeat // 10)
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                chat_planner.execute(conn, p)
+            timings[p.intent if not p.term else "sum (term)"].append((time.perf_counter() - t0) / repeat * 1000)
+    finally:
+        conn.close()
+    for intent, ms in sorted(timings.items()):
+        print(f"execute {intent:16s} mean {sum(ms) / len(ms):8.2f} ms  max {max(ms):8.2f} ms  ({len(ms)} messages)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_intent.py
+"""
+Keyword lookup latency vs vocabulary size (backend_ingest.parsers.intent).
+
+    python -m benchmarks.bench_intent [--sizes 1000 10000 80000 200000]
+
+Compares KeywordMatcher.find with the previous `for k in keywords: if k in s`
+scan on a few chat messages. The matcher's cost is bounded by the number of
+distinct keyword lengths (one pass over the message per length), not by the
+number of keywords: it levels off once every length up to the longest
+keyword is present (9 here, 4..12 letters) instead of growing with the
+vocabulary, while the scan grows linearly. A vocabulary with longer
+keywords makes each lookup proportionally slower.
+"""
+import argparse
+import random
+import string
+import time
+
+from backend_ingest.parsers.intent import KeywordMatcher
+
+MESSAGES = [
+    "how much did i spend on starbucks coffee in sep 2025",
+    "what did i spend last month at the corner bakery",
+    "total spent on uber rides this month",
+    "how much on zzqx nothing matches here at all",
+]
+
+
+def vocabulary(size: int, seed: int = 3) -> set:
+    rnd = random.Random(seed)
+    words = {"coffee", "starbucks", "uber", "bakery"}
+    while len(words) < size:
+        words.add("".join(rnd.choices(string.ascii_lowercase, k=rnd.randint(4, 12))))
+    return words
+
+
+def linear_scan(keywords, text):
+    for k in keywords:
+        if k in text:
+            return k
+    return None
+
+
+def _per_call_us(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for msg in MESSAGES:
+            fn(msg)
+    return (time.perf_counter() - t0) / (repeat * len(MESSAGES)) * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 80_000, 200_000])
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+
+    for size in args.sizes:
+        words = vocabulary(size)
+        t0 = time.perf_counter()
+        matcher = KeywordMatcher(words)
+        build_ms = (time.perf_counter() - t0) * 1000
+        fast = _per_call_us(matcher.find, args.repeat)
+        slow = _per_call_us(lambda m: linear_scan(words, m), max(1, args.repeat // 20))
+        print(f"vocab={size:>7d}  lengths={len(matcher._lengths):>2d}  build {build_ms:7.1f} ms  "
+              f"matcher {fast:8.1f} us/msg  linear scan {slow:10.1f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# Shared by backend_expenses/tests and backend_ingest/tests.
+# backend_expenses.database binds FINANCE_DB on import, so the test database is
+# chosen here, before the test modules import the apps: a fresh file per session
+# instead of the tracked data/finance.db
+_TMP_DIR = None
+if "backend_expenses.database" not in sys.modules:
+    _TMP_DIR = tempfile.mkdtemp(prefix="finance-tests-")
+    os.environ["FINANCE_DB"] = os.path.join(_TMP_DIR, "finance.db")
+
+
+def pytest_unconfigure(config):
+    if _TMP_DIR:
+        shutil.rmtree(_TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def add_expenses():
+    """add_expenses(row_dict, ...) inserts expenses, commits and returns their ids."""
+    from backend_expenses import result_cache
+    from backend_expenses.database import get_conn
+
+    def add(*rows):
+        c = get_conn()
+        try:
+            ids = [
+                c.execute(f"INSERT INTO expenses ({', '.join(r)}) VALUES ({', '.join('?' * len(r))})",
+                          tuple(r.values())).lastrowid
+                for r in rows
+            ]
+            result_cache.bump(c)  # raw writes bypass the writer's bump
+            c.commit()
+        finally:
+            c.close()
+        return ids
+    return add
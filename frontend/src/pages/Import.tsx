@@ -3,6 +3,18 @@ import React, { useState, useRef } from "react";
 import axios from "axios";
 import { INGEST_API } from "../config";
 
+type ImportStatus = {
+  batch_id?: string;
+  status?: "queued" | "running" | "done" | "failed" | "cancelled";
+  imported?: number;
+  rows_parsed?: number;
+  rows_inserted?: number;
+  rows_updated?: number;
+  rows_skipped?: number;
+  rows_per_sec?: number | null;
+  error?: string | null;
+};
+
 export default function ImportPage(): JSX.Element {
   const [source, setSource] = useState("generic");
   const [file, setFile] = useState<File | null>(null);
@@ -11,7 +23,9 @@ export default function ImportPage(): JSX.Element {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [importedCount, setImportedCount] = useState<number | null>(null);
+  const [skippedCount, setSkippedCount] = useState<number>(0);
   const [lastBatchId, setLastBatchId] = useState<string | null>(null);
+  const [previewToken, setPreviewToken] = useState<string | null>(null);
 
   const fileInputRef = useRef<HTMLInputElement | null>(null);
 
@@ -19,8 +33,10 @@ export default function ImportPage(): JSX.Element {
     setPreview(null);
     setDedupe(null);
     setImportedCount(null);
+    setSkippedCount(0);
     setError(null);
     setLastBatchId(null);
+    setPreviewToken(null);
     const f = e.target.files?.[0] ?? null;
     setFile(f);
   };
@@ -30,8 +46,10 @@ export default function ImportPage(): JSX.Element {
     setPreview(null);
     setDedupe(null);
     setImportedCount(null);
+    setSkippedCount(0);
     setError(null);
     setLastBatchId(null);
+    setPreviewToken(null);
     if (fileInputRef.current) fileInputRef.current.value = "";
   };
 
@@ -49,11 +67,15 @@ export default function ImportPage(): JSX.Element {
 
       const res = await axios.post(`${INGEST_API}/preview_csv`, fd);
       setPreview(res.data);
+      setPreviewToken(res.data.token ?? null);
 
       const rowsForDedupe = res.data.parsed ?? res.data.preview ?? [];
       try {
         if (Array.isArray(rowsForDedupe) && rowsForDedupe.length > 0) {
-          const ded = await axios.post(`${INGEST_API}/dedupe_preview`, rowsForDedupe);
+          // the server kept the parsed rows; reference them instead of posting them back
+          const ded = res.data.token
+            ? await axios.post(`${INGEST_API}/dedupe_preview`, null, { params: { token: res.data.token } })
+            : await axios.post(`${INGEST_API}/dedupe_preview`, rowsForDedupe);
           setDedupe(ded.data);
         } else {
           setDedupe(null);
@@ -75,22 +97,46 @@ export default function ImportPage(): JSX.Element {
     setError(null);
     setLoading(true);
     setImportedCount(null);
+    setSkippedCount(0);
     setLastBatchId(null);
     try {
-      const fd = new FormData();
-      fd.append("source", source);
-      fd.append("file", file);
+      const upload = (withToken: boolean) => {
+        const fd = new FormData();
+        fd.append("source", source);
+        fd.append("background", "true");
+        // a preview token lets the server commit the rows it already parsed
+        if (withToken && previewToken) fd.append("token", previewToken);
+        else fd.append("file", file);
+        return axios.post<ImportStatus>(`${INGEST_API}/upload_csv`, fd, { timeout: 120000 });
+      };
 
-      const res = await axios.post<{ imported?: number; batch_id?: string }>(`${INGEST_API}/upload_csv`, fd, {
-        timeout: 120000,
-      });
+      let res;
+      try {
+        res = await upload(true);
+      } catch (err: any) {
+        // token expired on the server: send the file itself
+        if (!previewToken || err?.response?.status !== 410) throw err;
+        res = await upload(false);
+      }
 
-      const imported = res.data.imported ?? 0;
-      setImportedCount(imported);
-      if (res.data.batch_id) setLastBatchId(res.data.batch_id);
+      let status = res.data;
+      if (status.batch_id) setLastBatchId(status.batch_id);
+      setImportedCount(status.imported ?? status.rows_inserted ?? 0);
+      setSkippedCount((status.rows_skipped ?? 0) + (status.rows_updated ?? 0));
+
+      // background job: poll progress until it finishes
+      while (status.batch_id && (status.status === "queued" || status.status === "running")) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const poll = await axios.get<ImportStatus>(`${INGEST_API}/import_status/${status.batch_id}`);
+        status = poll.data;
+        setImportedCount(status.rows_inserted ?? 0);
+        setSkippedCount((status.rows_skipped ?? 0) + (status.rows_updated ?? 0));
+      }
+      if (status.status === "failed") throw new Error(status.error || "Import failed");
 
       if (fileInputRef.current) fileInputRef.current.value = "";
       setFile(null);
+      setPreviewToken(null);
     } catch (err: any) {
       console.error("import error", err);
       const msg = err?.response?.data?.detail || err?.response?.data || err?.message || "Import failed";
@@ -110,6 +156,7 @@ export default function ImportPage(): JSX.Element {
       alert(`Deleted ${resp.data.deleted} rows from batch ${resp.data.batch_id}`);
       setLastBatchId(null);
       setImportedCount(null);
+      setSkippedCount(0);
       setPreview(null);
       setDedupe(null);
     } catch (err: any) {
@@ -178,6 +225,7 @@ export default function ImportPage(): JSX.Element {
         {importedCount !== null && (
           <div style={{ marginTop: 8, color: "green" }}>
             Imported rows: <strong>{importedCount}</strong>
+            {skippedCount > 0 && <span style={{ color: "#666" }}> ({skippedCount} already imported)</span>}
           </div>
         )}
       </div>
@@ -1,27 +1,36 @@
 # normalize_existing_db.py
-import sqlite3
+# Point FINANCE_DB at the database to fix (defaults to data/finance.db).
+from backend_expenses.database import FINANCE_DB, get_conn
 from backend_expenses.utils_datetime_amount import normalize_tx_datetime, normalize_amount
+from backend_expenses.writer import writer
 
-DB = r"C:\business\21-projects\monexa\data\Finance.db"
+CHUNK = 1000
 
-def normalize_db(db_path=DB):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT id, tx_datetime, total_amount FROM expenses")
-    rows = cur.fetchall()
+
+def _update_chunk(conn, updates):
+    conn.executemany("UPDATE expenses SET tx_datetime = ?, total_amount = ? WHERE id = ?", updates)
+    return len(updates)
+
+
+def normalize_db():
+    conn = get_conn()
+    try:
+        rows = conn.execute("SELECT id, tx_datetime, total_amount FROM expenses").fetchall()
+    finally:
+        conn.close()
     updates = []
     for _id, raw_dt, raw_amt in rows:
         new_dt = normalize_tx_datetime(raw_dt)
         new_amt = normalize_amount(raw_amt)
         # decide whether to update (convert None->NULL, string->normalized)
         if (new_dt is not None and new_dt != raw_dt) or (new_amt is not None and str(new_amt) != ("" if raw_amt is None else str(raw_amt))):
-            updates.append((_id, new_dt, new_amt))
-    print(f"Found {len(updates)} rows to update")
-    for _id, new_dt, new_amt in updates:
-        cur.execute("UPDATE expenses SET tx_datetime = ?, total_amount = ? WHERE id = ?", (new_dt, new_amt, _id))
-    conn.commit()
-    conn.close()
-    print("Normalization complete.")
+            updates.append((new_dt, new_amt, _id))
+    print(f"Found {len(updates)} rows to update in {FINANCE_DB}")
+    # queued chunks share the writer's group commit with any other writers
+    futures = [writer.submit(_update_chunk, updates[i:i + CHUNK]) for i in range(0, len(updates), CHUNK)]
+    updated = sum(f.result() for f in futures)
+    writer.close()
+    print(f"Normalization complete ({updated} rows).")
 
 if __name__ == "__main__":
     normalize_db()